@@ -1,18 +1,44 @@
-from io import BytesIO
+from functools import partial
 
-from .core import Dumper, Loader, undefined
+from .core import Dumper, Loader, IncrementalLoader, ObjectVector, undefined
+from .core import ArrayCollection, ObjectProxy, Columns, RawAMF
+from .core import ReadSession, WriteSession, Stats, _instance, _READ_SIZE
+from .schema import Schema
+from .batch import loads_many, dumps_many
+from .transcode import JSONTranscoder
 
-def dump(data, stream, proto=3, Dumper=Dumper):
-    Dumper().dump(data, stream, proto=proto)
+def dump(data, stream, proto=3, Dumper=Dumper, refs='identity', prefix=None):
+    _instance(Dumper).dump(data, stream, proto=proto, refs=refs,
+                           prefix=prefix)
 
 def load(input, proto=3, Loader=Loader):
-    return Loader().load(input, proto=proto)
+    return _instance(Loader).load(input, proto=proto)
 
-def dumps(data, proto=3, Dumper=Dumper):
-    buf = BytesIO()
-    dump(data, buf, proto=proto, Dumper=Dumper)
-    return buf.getvalue()
+def dumps(data, proto=3, Dumper=Dumper, refs='identity', prefix=None):
+    return _instance(Dumper).dump(data, proto=proto, refs=refs, prefix=prefix)
+
+def encoded_size(data, proto=3, Dumper=Dumper, refs='identity'):
+    return _instance(Dumper).size(data, proto=proto, refs=refs)
+
+def fragment(data, proto=3, Dumper=Dumper, refs='identity'):
+    # RawAMF of ``data``, written as encoded here in any AMF``proto`` data
+    return _instance(Dumper).fragment(data, proto=proto, refs=refs)
 
 def loads(data, proto=3, Loader=Loader):
-    buf = BytesIO(data)
-    return load(buf, proto=proto, Loader=Loader)
+    return _instance(Loader).loads(data, proto=proto)
+
+def extract(data, path, proto=3, Loader=Loader):
+    return _instance(Loader).extract(data, path, proto=proto)
+
+def transcode_json(src, dst=None, proto=3, Loader=Loader):
+    # AMF bytes-like object or binary stream to JSON text
+    if hasattr(src, 'read'):
+        src = src.read()
+    return JSONTranscoder(Loader=Loader).to_json(src, dst, proto=proto)
+
+def transcode_amf(src, dst=None, proto=3, Dumper=Dumper):
+    # JSON text or text stream to AMF. Counts of AMF arrays are written
+    # before their items, so the text is parsed once all of it is read
+    if hasattr(src, 'read'):
+        src = ''.join(iter(partial(src.read, _READ_SIZE), ''))
+    return JSONTranscoder(Dumper=Dumper).to_amf(src, dst, proto=proto)
@@ -0,0 +1,64 @@
+from collections import deque
+from weakref import WeakKeyDictionary as weakdict
+
+from .core import Dumper, Loader, IncrementalLoader, _instance
+
+CHUNK_SIZE = 65536
+
+# Per reader parser state. A read may return bytes of the next value, so
+# they are kept here for the next load_async()/iter_async() on the reader.
+# Reference tables are shared by all values of the reader, like in
+# ``Loader.load_all``
+_readers = weakdict()
+
+
+class _ReaderState(object):
+    __slots__ = ('parser', 'values')
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.values = deque()
+
+
+def _state(reader, proto, Loader):
+    state = _readers.get(reader)
+    if state is None:
+        state = _readers[reader] = _ReaderState(
+            IncrementalLoader(proto, Loader()))
+    elif state.parser.proto != proto:
+        raise ValueError("Reader is already decoded with proto {}"
+                         .format(state.parser.proto))
+    return state
+
+
+async def _next(reader, state):
+    values = state.values
+    while not values:
+        data = await reader.read(CHUNK_SIZE)
+        if not data:
+            if state.parser.pending():
+                raise EOFError("Truncated AMF data")
+            raise EOFError()
+        values.extend(state.parser.feed(data))
+    return values.popleft()
+
+
+async def load_async(reader, proto=3, Loader=Loader):
+    return await _next(reader, _state(reader, proto, Loader))
+
+
+async def iter_async(reader, proto=3, Loader=Loader):
+    state = _state(reader, proto, Loader)
+    while True:
+        try:
+            value = await _next(reader, state)
+        except EOFError as e:
+            if e.args:
+                raise
+            return
+        yield value
+
+
+async def dump_async(data, writer, proto=3, Dumper=Dumper, context=None):
+    writer.write(_instance(Dumper).dump(data, proto=proto, context=context))
+    await writer.drain()
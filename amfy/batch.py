@@ -0,0 +1,77 @@
+import os
+from collections import deque
+from itertools import chain, islice
+from concurrent.futures import ProcessPoolExecutor
+
+from .core import Dumper, Loader
+
+CHUNK_SIZE = 512
+
+
+def _chunks(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _loads_chunk(Loader, proto, chunk):
+    loader = Loader()
+    return [loader.loads(data, proto=proto) for data in chunk]
+
+
+def _dumps_chunk(Dumper, proto, refs, chunk):
+    dumper = Dumper()
+    return [dumper.dump(data, proto=proto, refs=refs) for data in chunk]
+
+
+def _pipeline(executor, window, func, args, chunks):
+    # at most ``window`` chunks are in flight, so input is consumed and
+    # results are yielded as they are needed
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append(executor.submit(func, *args, chunk))
+            if len(pending) >= window:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _map(func, args, items, chunk_size, workers, executor):
+    if chunk_size < 1:
+        raise ValueError(chunk_size)
+    chunks = _chunks(items, chunk_size)
+    head = list(islice(chunks, 2))
+    if len(head) < 2 or workers == 1:
+        # a single chunk is not worth the round trip to other processes
+        for chunk in chain(head, chunks):
+            yield from func(*args, chunk)
+        return
+    window = 2 * (workers or os.cpu_count() or 1)
+    chunks = chain(head, chunks)
+    if executor is not None:
+        yield from _pipeline(executor, window, func, args, chunks)
+        return
+    with ProcessPoolExecutor(workers) as executor:
+        yield from _pipeline(executor, window, func, args, chunks)
+
+
+def loads_many(items, proto=3, Loader=Loader, chunk_size=CHUNK_SIZE,
+               workers=None, executor=None):
+    # Decodes independent messages in a process pool, values are yielded
+    # in input order. ``Loader`` must be importable by worker processes
+    return _map(_loads_chunk, (Loader, proto), items,
+                chunk_size, workers, executor)
+
+
+def dumps_many(items, proto=3, Dumper=Dumper, refs='identity',
+               chunk_size=CHUNK_SIZE, workers=None, executor=None):
+    # Same for encoding, each value is a separate message
+    return _map(_dumps_chunk, (Dumper, proto, refs), items,
+                chunk_size, workers, executor)
@@ -1,7 +1,14 @@
-from io import BytesIO
+import sys
+import array
+import re
+import mmap
 import struct
+import uuid
 import datetime, time
+from bisect import bisect_left
 from collections import OrderedDict
+from itertools import groupby
+from functools import cached_property, lru_cache, partial
 from weakref import WeakKeyDictionary as weakdict
 
 class Undefined(object):
@@ -18,378 +25,2975 @@ class Undefined(object):
 
 undefined = object().__new__(Undefined)
 
+class ObjectVector(list):
+    # Vector.<Object> or vector of some class, numeric vectors are decoded
+    # into array.array
+    classname = '*'
+    fixed = False
+
+class Columns(dict):
+    # Array of objects of one sealed trait decoded column by column with
+    # ``Loader(columns=True)``: member name to the list of its values, or
+    # array.array of numeric ones. Written as the array of objects again
+    classname = ''
+
+class ArrayCollection(list):
+    # Written as flex.messaging.io.ArrayCollection, which is decoded into
+    # the list it wraps
+    __slots__ = ()
+
+class ObjectProxy(dict):
+    # Written as flex.messaging.io.ObjectProxy, decoded into the object it
+    # wraps
+    __slots__ = ()
+
+# Small (externalizable) forms of Flex messages: class aliases of the full
+# messages and the fields of each group of flag bytes, by flag byte and
+# bit. Fields ending with '*' are UUIDs written as 16 byte arrays
+_abstract_message = (
+    ('body', 'clientId', 'destination', 'headers', 'messageId',
+     'timestamp', 'timeToLive'),
+    ('clientId*', 'messageId*'),
+    )
+_small_messages = {
+    'DSA': ('flex.messaging.messages.AsyncMessage',
+            (_abstract_message, (('correlationId', 'correlationId*'),))),
+    'DSK': ('flex.messaging.messages.AcknowledgeMessage',
+            (_abstract_message, (('correlationId', 'correlationId*'),),
+             ())),
+    'DSC': ('flex.messaging.messages.CommandMessage',
+            (_abstract_message, (('correlationId', 'correlationId*'),),
+             (('operation',),))),
+    }
+
+_double = struct.Struct('!d')
+_ushort = struct.Struct('!H')
+_ulong = struct.Struct('!L')
+_marker_double = struct.Struct('!Bd')
+_marker_ushort = struct.Struct('!BH')
+_marker_ulong = struct.Struct('!BL')
+
+# Numeric vectors are copied from the wire with array.frombytes, which
+# needs a byteswap on little endian hosts
+_swap = sys.byteorder == 'little'
+_vector_int = 'i' if array.array('i').itemsize == 4 else 'l'
+_vector_uint = 'I' if array.array('I').itemsize == 4 else 'L'
+_vector_markers = {}
+for _code in array.typecodes:
+    _size = array.array(_code).itemsize
+    if _code in 'bhil' and _size <= 4:
+        _vector_markers[_code, _size] = 0x0D
+    elif _code in 'BHIL' and _size <= 4:
+        _vector_markers[_code, _size] = 0x0E
+del _code, _size
+
+def _encode_u29(data):
+    ba = bytearray()
+    if not data:
+        return b'\x00'
+    while data:
+        ba.append((data & 0x7f) | 0x80)
+        data >>= 7
+    ba.reverse()
+    ba[-1] &= 0x7f
+    return bytes(ba)
+
+def _vli_size(data):
+    return (data.bit_length() + 6) // 7 or 1
+
+# Encodings of small integers, reference indexes and string headers
+_U29_CACHED = 1 << 14
+_u29 = tuple(_encode_u29(i) for i in range(_U29_CACHED))
+
+# Short object keys and member names are encoded once per process, values
+# are written as they come so they don't push keys out. The cache is
+# bounded and lru_cache is safe to share between threads
+_STRING_CACHED = 64
+
+@lru_cache(maxsize=1024)
+def _encode_string3(data):
+    data = data.encode('utf-8')
+    return _encode_u29((len(data) << 1)|1) + data
+
+@lru_cache(maxsize=1024)
+def _encode_string0(data):
+    data = data.encode('utf-8')
+    return _ushort.pack(len(data)) + data
+
+def _slots(cls):
+    res = []
+    for base in reversed(cls.__mro__):
+        slots = base.__dict__.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for name in slots:
+            if name not in ('__dict__', '__weakref__'):
+                res.append(name)
+    return res
+
+# Runs of numbers in arrays are packed and unpacked _RUN items at a time
+_RUN = 64
+_numeric = frozenset((int, float))
+_int3 = tuple(b'\x04' + i for i in _u29)
+_double_run3 = re.compile(b'(?:\x05.{8})+', re.S)
+_double_run0 = re.compile(b'(?:\x00.{8})+', re.S)
+_int_run3 = re.compile(b'(?:\x04[\x00-\x7f])+')
+
+@lru_cache(maxsize=None)
+def _run_struct(fmt, num):
+    return struct.Struct('!' + fmt*num)
+
+def _pack_doubles(out, marker, values):
+    num = len(values)
+    args = [marker]*(2*num)
+    args[1::2] = values
+    full = num - num % _RUN
+    if full:
+        pack = _run_struct('Bd', _RUN).pack
+        for i in range(0, 2*full, 2*_RUN):
+            out += pack(*args[i:i+2*_RUN])
+    if num > full:
+        out += _run_struct('Bd', num - full).pack(*args[2*full:])
+
+def _unpack_doubles(buf, pos, num):
+    # ``num`` doubles, each prefixed by a marker byte
+    res = []
+    full = num - num % _RUN
+    if full:
+        for run in _run_struct('xd', _RUN).iter_unpack(buf[pos:pos+9*full]):
+            res += run
+    if num > full:
+        res += _run_struct('xd', num - full).unpack_from(buf, pos + 9*full)
+    return res
+
+# Loaders and dumpers used by module level functions, one per class. They
+# keep no state between calls, tables made on first use are kept. Not a
+# weak dictionary, making weak references costs more than the lookup
+_instances = {}
+
+def _instance(cls):
+    res = _instances.get(cls)
+    if res is None:
+        res = _instances[cls] = cls()
+    return res
+
+def _marker_table(obj, names, default):
+    table = [getattr(obj, default)]*256
+    for marker, name in names.items():
+        table[marker] = getattr(obj, name)
+    return table
+
+def _type_table(obj, names, proto):
+    return {cls: obj._handler(getattr(obj, name), proto)
+            for cls, name in names.items()}
+
+def _type_lookup(obj, table, names, cls, proto):
+    for base in cls.__mro__:
+        name = names.get(base)
+        if name is not None:
+            write = table[cls] = obj._handler(getattr(obj, name), proto)
+            return write
+    raise NotImplementedError("Type {!r}".format(cls))
+
+def _count_read(stats, proto, marker, read):
+    # bytes of nested values are accounted to their own markers
+    key = (proto, marker)
+    def counted(buf, pos, context):
+        nested = stats._nested
+        stats._nested = 0
+        stats._depth += 1
+        if stats._depth > stats.max_depth:
+            stats.max_depth = stats._depth
+        val, end = read(buf, pos, context)
+        stats._depth -= 1
+        size = end - pos + 1
+        stats.counts[key] = stats.counts.get(key, 0) + 1
+        stats.bytes[key] = stats.bytes.get(key, 0) + size - stats._nested
+        stats._nested = nested + size
+        return val, end
+    return counted
+
+def _count_write(stats, proto, write):
+    # same for writers, the key is the marker written
+    def counted(data, out, context):
+        nested = stats._nested
+        stats._nested = 0
+        stats._depth += 1
+        if stats._depth > stats.max_depth:
+            stats.max_depth = stats._depth
+        start = len(out)
+        write(data, out, context)
+        stats._depth -= 1
+        size = len(out) - start
+        key = (proto, out[start])
+        stats.counts[key] = stats.counts.get(key, 0) + 1
+        stats.bytes[key] = stats.bytes.get(key, 0) + size - stats._nested
+        stats._nested = nested + size
+    return counted
+
+def _index(value, path):
+    for key in path:
+        if isinstance(value, (dict, list)):
+            value = value[key]
+        else:
+            value = getattr(value, key)
+    return value
+
+def _read_flags(buf, pos):
+    # flag bytes of Flex small messages, the high bit is set on all but
+    # the last one
+    end = pos
+    while buf[end] & 0x80:
+        end += 1
+    return list(buf[pos:end+1]), end + 1
+
+# Types decoded as they are instead of through a memoryview
+_sliced = frozenset((bytes, bytearray, mmap.mmap))
+
+# Size of reads from streams that are seeked back to the end of a value
+_READ_SIZE = 65536
+
+def _check(buf, end):
+    # slicing silently truncates, so lengths read from the wire are checked
+    if end > len(buf):
+        raise EOFError("Truncated AMF data", end)
+    return end
+
 class Loader(object):
+    # Marker byte to method name. Subclasses may override the methods or
+    # extend the tables, e.g. ``markers3 = dict(Loader.markers3, ...)``
+    markers3 = {
+        0x00: '_read_undefined3',
+        0x01: '_read_null3',
+        0x02: '_read_false3',
+        0x03: '_read_true3',
+        0x04: '_read_integer3',
+        0x05: '_read_double3',
+        0x06: '_read_string3',
+        0x07: '_read_xmldoc3',
+        0x08: '_read_date3',
+        0x09: '_read_array3',
+        0x0A: '_read_object3',
+        0x0B: '_read_xml3',
+        0x0C: '_read_bytearray3',
+        0x0D: '_read_vector_int3',
+        0x0E: '_read_vector_uint3',
+        0x0F: '_read_vector_double3',
+        0x10: '_read_vector_object3',
+        }
+    markers0 = {
+        0x00: '_read_number0',
+        0x01: '_read_boolean0',
+        0x02: '_read_sstring0',
+        0x03: '_read_object0',
+        0x05: '_read_null0',
+        0x06: '_read_undefined0',
+        0x07: '_read_reference0',
+        0x08: '_read_ecma_array0',
+        0x0A: '_read_strict_array0',
+        0x0B: '_read_date0',
+        0x0C: '_read_long_string0',
+        0x11: '_read_avmplus0',
+        }
+    # Same for skipping values without decoding them, used by ``skip()``
+    # and ``extract()``. Skippers return the offset past the value
+    skips3 = {
+        0x00: '_skip_none',
+        0x01: '_skip_none',
+        0x02: '_skip_none',
+        0x03: '_skip_none',
+        0x04: '_skip_integer3',
+        0x05: '_skip_double',
+        0x06: '_skip_string3',
+        0x07: '_read_xmldoc3',
+        0x08: '_skip_date3',
+        0x09: '_skip_array3',
+        0x0A: '_skip_object3',
+        0x0B: '_read_xml3',
+        0x0C: '_skip_bytearray3',
+        0x0D: '_skip_vector_int3',
+        0x0E: '_skip_vector_int3',
+        0x0F: '_skip_vector_double3',
+        0x10: '_skip_vector_object3',
+        }
+    skips0 = {
+        0x00: '_skip_double',
+        0x01: '_skip_boolean0',
+        0x02: '_skip_sstring0',
+        0x03: '_skip_object0',
+        0x05: '_skip_none',
+        0x06: '_skip_none',
+        0x07: '_skip_reference0',
+        0x08: '_skip_ecma_array0',
+        0x0A: '_skip_strict_array0',
+        0x0B: '_skip_date0',
+        0x0C: '_skip_long_string0',
+        0x11: '_skip_avmplus0',
+        }
+
+    # Generator versions of container readers for ``max_depth``, see
+    # ``_walk``
+    walks3 = {
+        0x09: '_walk_array3',
+        0x0A: '_walk_object3',
+        0x10: '_walk_vector_object3',
+        }
+    walks0 = {
+        0x03: '_walk_object0',
+        0x08: '_walk_ecma_array0',
+        0x0A: '_walk_strict_array0',
+        }
+
+    # AMF class alias to python class, objects of unknown classes are
+    # decoded as dicts
+    aliases = {}
+
+    # Externalizable classes to names of the methods reading and skipping
+    # what their writeExternal writes. Both get the offset past the traits,
+    # readers add the object to the context before reading its contents
+    # like _read_object3 does, for skippers it's done already
+    externals = {
+        'flex.messaging.io.ArrayCollection': ('_read_wrapped3',
+                                              '_skip_wrapped3'),
+        'flex.messaging.io.ObjectProxy': ('_read_wrapped3',
+                                          '_skip_wrapped3'),
+        'DSA': ('_read_async_message3', '_skip_async_message3'),
+        'DSK': ('_read_acknowledge_message3', '_skip_acknowledge_message3'),
+        'DSC': ('_read_command_message3', '_skip_command_message3'),
+        }
+
+    def __init__(self, stats=False, views=False, max_depth=None,
+                 columns=False):
+        # dispatch tables and the flags below are made on first use, so
+        # loaders are cheap to make, see _markers3
+        # byte arrays as memoryview slices of the input instead of copies,
+        # they keep the input buffer exported while referenced
+        self.views = views
+        # arrays of objects of one sealed trait as Columns, references to
+        # their rows are resolved by the object reader
+        self.columns = columns
+        # containers are read with an explicit stack of generators, so
+        # nesting is limited by ``max_depth`` instead of the recursion
+        # limit. Overridden container readers are kept as they are
+        self.max_depth = max_depth
+        if max_depth is not None:
+            if stats:
+                raise ValueError("Stats can't be collected with max_depth")
+            self._openers3 = self._walk_table(self._markers3,
+                                              Loader.markers3, self.walks3)
+            self._openers0 = self._walk_table(self._markers0,
+                                              Loader.markers0, self.walks0)
+        # counting readers are installed only when stats are requested,
+        # bulk paths are off then for every value to be counted
+        self.stats = None
+        if stats:
+            self.stats = Stats()
+            self._markers3 = [_count_read(self.stats, 3, m, read)
+                              for m, read in enumerate(self._markers3)]
+            self._markers0 = [_count_read(self.stats, 0, m, read)
+                              for m, read in enumerate(self._markers0)]
+            self._bulk3 = self._bulk0 = self._inline0 = False
+        self._aliases = dict(self.aliases)
+        self._schemas = {}
+        # skip tables are built on first use by skip and extract
+        self._skips3 = self._skips0 = None
+
+    @cached_property
+    def _markers3(self):
+        table = _marker_table(self, self.markers3, '_read_unknown3')
+        if self.views:
+            table[0x0C] = self._read_bytearray_view3
+        if self.columns:
+            table[0x09] = self._read_array_columns3
+            table[0x0A] = self._read_object_columns3
+        return table
+
+    @cached_property
+    def _markers0(self):
+        return _marker_table(self, self.markers0, '_read_unknown0')
+
+    @cached_property
+    def _bulk3(self):
+        # bulk number paths are valid only while numbers are read as usual
+        return (self._markers3[0x04].__func__ is Loader._read_integer3 and
+                self._markers3[0x05].__func__ is Loader._read_double3)
+
+    @cached_property
+    def _bulk0(self):
+        return self._markers0[0x00].__func__ is Loader._read_number0
+
+    @cached_property
+    def _inline0(self):
+        # same for numbers, booleans and strings read by container readers
+        return self._bulk0 and all(
+            self._markers0[m].__func__ is getattr(Loader, name)
+            for m, name in ((0x00, '_read_number0'), (0x01, '_read_boolean0'),
+                            (0x02, '_read_sstring0')))
+
+    @cached_property
+    def _externals(self):
+        return {classname: (getattr(self, read), getattr(self, skip))
+                for classname, (read, skip) in self.externals.items()}
 
     def add_alias(self, alias, constructor):
-        raise NotImplementedError()
+        self._aliases[alias] = constructor
+
+    def add_external(self, classname, reader, skipper):
+        # ``reader(buf, pos, context)`` returns the value and the offset
+        # past it, ``skipper(buf, pos, context)`` only the offset, see
+        # ``externals``
+        self._externals[classname] = (reader, skipper)
+
+    def add_schema(self, schema):
+        self._aliases[schema.classname] = schema.cls
+        self._schemas[schema.classname] = (schema.members,
+                                           schema.decoder(self))
+
+    def load(self, stream, proto=0, context=None):
+        # please keep it reentrant
+        getbuffer = getattr(stream, 'getbuffer', None)
+        if getbuffer is not None:
+            # BytesIO, decode in place without copying the payload
+            start = stream.tell()
+            with getbuffer() as buf:
+                res, pos = self._decode(buf, start, proto, context)
+            stream.seek(pos)
+            return res
+        return self._load_stream(stream, proto, context)
+
+    def _load_stream(self, stream, proto, context):
+        # Only the value is consumed: seekable streams are read in pieces
+        # and seeked back to the end of the value, buffered ones are
+        # scanned through peek() and read up to it, others are read no
+        # further than the length the value has at least. Where the value
+        # ends is found by _Scanner, values it can't follow are decoded
+        # again as data arrives. Streams may have nothing but read()
+        seekable = getattr(stream, 'seekable', None)
+        start = stream.tell() if seekable is not None and seekable() else None
+        peek = getattr(stream, 'peek', None)
+        scanner = _Scanner(self, proto,
+                           ReadContext() if context is None else context)
+        buf = bytearray()
+        need = 1
+        end = None
+        while end is None:
+            if start is not None:
+                ahead = stream.read(max(need - len(buf), _READ_SIZE))
+            elif peek is not None:
+                ahead = peek(need - len(buf))
+            else:
+                ahead = stream.read(need - len(buf))
+            if not ahead:
+                raise EOFError("Truncated AMF data")
+            buf += ahead
+            if scanner is not None:
+                try:
+                    with memoryview(buf) as view:
+                        end = scanner.scan(view, 0)
+                    need = scanner.need
+                except _Unscannable:
+                    scanner = None
+            if scanner is None:
+                mark = context.mark() if context is not None else None
+                try:
+                    res, end = self._decode(bytes(buf), 0, proto, context)
+                except EOFError as e:
+                    need = e.args[1] if len(e.args) > 1 else len(buf) + 1
+                    if mark is not None:
+                        context.rollback(mark)
+            if end is None and start is None and peek is not None:
+                stream.read(len(ahead))
+        if start is not None:
+            stream.seek(start + end)
+        elif peek is not None:
+            stream.read(end - len(buf) + len(ahead))
+        if scanner is not None:
+            res, end = self._decode(self._buffer(buf), 0, proto, context)
+        return res
+
+    def loads(self, value, proto=0, context=None):
+        # value may be bytes, bytearray, mmap or anything with buffer protocol
+        return self._decode(self._buffer(value), 0, proto, context)[0]
+
+    def _buffer(self, value):
+        # bytes, bytearray and mmap are read as they are, slices of them
+        # are quicker to make and decode than memoryview slices. Views of
+        # byte arrays need a memoryview
+        if self.views or type(value) not in _sliced:
+            return memoryview(value)
+        return value
+
+    def load_all(self, stream, proto=0):
+        # values are yielded as they are read, see IncrementalLoader. Views
+        # need the whole input in one buffer
+        if self.views:
+            yield from self.loads_all(stream.read(), proto)
+            return
+        read = getattr(stream, 'read1', stream.read)
+        parser = IncrementalLoader(proto, self)
+        while True:
+            data = read(_READ_SIZE)
+            if not data:
+                break
+            yield from parser.feed(data)
+        if parser.pending():
+            raise EOFError("Truncated AMF data")
+
+    def loads_all(self, value, proto=0):
+        # values share reference tables, like messages of one connection,
+        # a truncated value at the end raises EOFError
+        buf = self._buffer(value)
+        context = ReadContext()
+        pos = 0
+        while pos < len(buf):
+            res, pos = self._decode(buf, pos, proto, context)
+            yield res
+
+    def skip(self, value, proto=0, pos=0):
+        # returns offset past the value starting at ``pos``
+        buf = self._buffer(value)
+        context = SkipContext(self, buf)
+        if self._skips3 is None:
+            self._skip_tables()
+        if proto == 0:
+            skip = self._skips0
+        elif proto == 3:
+            skip = self._skips3
+        else:
+            raise ValueError(proto)
+        try:
+            return skip[buf[pos]](buf, pos + 1, context)
+        except (IndexError, struct.error):
+            raise EOFError("Truncated AMF data")
+
+    def extract(self, value, path, proto=0):
+        # decodes only the value at ``path``, a sequence of keys, indexes
+        # and attribute names, everything else is skipped
+        buf = self._buffer(value)
+        context = SkipContext(self, buf)
+        if self._skips3 is None:
+            self._skip_tables()
+        if proto == 0:
+            extract = self._extract0
+        elif proto == 3:
+            extract = self._extract3
+        else:
+            raise ValueError(proto)
+        try:
+            return extract(buf, 0, tuple(path), context)
+        except (IndexError, struct.error):
+            raise EOFError("Truncated AMF data")
+
+    def _skip_tables(self):
+        self._skips3 = _marker_table(self, self.skips3, '_read_unknown3')
+        self._skips0 = _marker_table(self, self.skips0, '_read_unknown0')
+
+    def _decode(self, buf, pos, proto, context):
+        if context is None:
+            context = ReadContext()
+        else:
+            context.start_message()
+        if proto == 0:
+            read = self._read_item0
+        elif proto == 3:
+            read = self._read_item3
+        else:
+            raise ValueError(proto)
+        try:
+            if self.stats is not None:
+                return self.stats._call(read, buf, pos, context)
+            return read(buf, pos, context)
+        except (IndexError, struct.error):
+            raise EOFError("Truncated AMF data")
+
+    def _read_item3(self, buf, pos, context):
+        return self._markers3[buf[pos]](buf, pos + 1, context)
+
+    def _read_undefined3(self, buf, pos, context):
+        return undefined, pos
+
+    def _read_null3(self, buf, pos, context):
+        return None, pos
+
+    def _read_false3(self, buf, pos, context):
+        return False, pos
+
+    def _read_true3(self, buf, pos, context):
+        return True, pos
+
+    def _read_integer3(self, buf, pos, context):
+        num = buf[pos]
+        if num < 0x80:
+            return num, pos + 1
+        return self._read_vli(buf, pos)
+
+    def _read_double3(self, buf, pos, context):
+        return _double.unpack_from(buf, pos)[0], pos + 8
+
+    def _read_date3(self, buf, pos, context):
+        num, pos = self._read_vli(buf, pos)
+        if num & 1:
+            res = datetime.datetime.utcfromtimestamp(
+                _double.unpack_from(buf, pos)[0]/1000)
+            context.add_object(res)
+            pos += 8
+        else:
+            res = context.get_object(num >> 1)
+        return res, pos
+
+    def _read_array3(self, buf, pos, context):
+        num, pos = self._read_vli(buf, pos)
+        if not num & 1:
+            return context.get_object(num >> 1), pos
+        markers = self._markers3
+        res = None
+        while True:
+            val, pos = self._read_string3(buf, pos, context)
+            if val == '':
+                if res is None:
+                    res = [None]*(num >> 1)
+                    context.add_object(res)
+                break
+            elif res is None:
+                res = OrderedDict()
+                context.add_object(res)
+            res[val], pos = markers[buf[pos]](buf, pos + 1, context)
+        num >>= 1
+        if num and self._bulk3 and type(res) is list and buf[pos] in (4, 5):
+            return res, self._read_numbers3(buf, pos, res, context)
+        for i in range(num):
+            res[i], pos = markers[buf[pos]](buf, pos + 1, context)
+        return res, pos
+
+    def _read_array_columns3(self, buf, pos, context):
+        # Rows aren't made, the reference table gets one _Rows per array
+        # in their place. Arrays found not to be columns part way through
+        # are read as lists, with the rows read so far made from columns
+        start = pos
+        num, pos = self._read_vli(buf, pos)
+        if not num & 1:
+            return context.get_object(num >> 1), pos
+        num >>= 1
+        if not num or buf[pos] != 0x01 or buf[pos + 1] != 0x0A:
+            return self._read_array3(buf, start, context)
+        mark = context.mark()
+        key = len(context.objects)
+        res = Columns()
+        context.add_object(res)
+        ref, pos = self._read_vli(buf, pos + 2)
+        if not ref & 1:
+            context.rollback(mark)
+            return self._read_array3(buf, start, context)
+        trait, pos = self._read_trait3(ref, buf, pos, context)
+        if trait.dynamic or trait.skipper is not None or not trait.members:
+            context.rollback(mark)
+            return self._read_array3(buf, start, context)
+        if ref & 2:
+            ref = (len(context.traits) - 1) << 2 | 1
+        res.classname = trait.classname
+        columns = [[] for name in trait.members]
+        appends = [column.append for column in columns]
+        rows = _Rows(trait, columns)
+        keys = rows.keys
+        markers = self._markers3
+        objects = context.objects
+        add_object = context.add_object
+        i = 0
+        while True:
+            keys.append(len(objects))
+            add_object(rows)
+            for append in appends:
+                val, pos = markers[buf[pos]](buf, pos + 1, context)
+                append(val)
+            i += 1
+            if i == num or buf[pos] != 0x0A:
+                break
+            # the trait of the next row is a reference to the same one
+            # when it's a row too, one byte references are compared as is
+            if ref < 0x80 and buf[pos + 1] == ref:
+                pos += 2
+            else:
+                val, end = self._read_vli(buf, pos + 1)
+                if val != ref:
+                    break
+                pos = end
+        if i < num:
+            res = [rows.row(k, context) for k in keys]
+            context.set_object(key, res)
+            for j in range(num - i):
+                val, pos = markers[buf[pos]](buf, pos + 1, context)
+                res.append(val)
+            return res, pos
+        for name, column in zip(trait.members, columns):
+            kinds = set(map(type, column))
+            if kinds <= _numeric:
+                column = array.array('d' if float in kinds else 'q', column)
+            res[name] = column
+        return res, pos
+
+    def _read_object_columns3(self, buf, pos, context):
+        num, end = self._read_vli(buf, pos)
+        if not num & 1:
+            res = context.get_object(num >> 1)
+            if type(res) is _Rows:
+                res = res.row(num >> 1, context)
+            return res, end
+        return self._read_object3(buf, pos, context)
+
+    def _read_numbers3(self, buf, pos, res, context):
+        # dense array of mostly numbers, runs of doubles and small integers
+        # are unpacked in one step each
+        markers = self._markers3
+        num = len(res)
+        i = 0
+        while i < num:
+            marker = buf[pos]
+            if marker == 0x05:
+                match = _double_run3.match(buf, pos, pos + 9*(num - i))
+                if match:
+                    end = match.end()
+                    run = _unpack_doubles(buf, pos, (end - pos) // 9)
+                    res[i:i+len(run)] = run
+                    i += len(run)
+                    pos = end
+                    continue
+            elif marker == 0x04 and buf[pos + 1] < 0x80:
+                # multi-byte integers go through the handler directly
+                match = _int_run3.match(buf, pos, pos + 2*(num - i))
+                if match:
+                    end = match.end()
+                    run = list(buf[pos+1:end:2])
+                    res[i:i+len(run)] = run
+                    i += len(run)
+                    pos = end
+                    continue
+            res[i], pos = markers[marker](buf, pos + 1, context)
+            i += 1
+        return pos
+
+    def _read_trait3(self, num, buf, pos, context):
+        if num & 2:
+            if num & 4: # traits-ext
+                classname, pos = self._read_string3(buf, pos, context)
+                handler = self._externals.get(classname)
+                if handler is None:
+                    raise NotImplementedError(
+                        "Externalizable {!r}".format(classname))
+                trait = Trait(False, classname, (),
+                              self._aliases.get(classname), *handler)
+            else: # traits
+                dyn = bool(num & 8)
+                classname, pos = self._read_string3(buf, pos, context)
+                members = []
+                for i in range(num >> 4):
+                    name, pos = self._read_string3(buf, pos, context)
+                    members.append(name)
+                trait = Trait(dyn, classname, members,
+                              self._aliases.get(classname))
+                schema = self._schemas.get(classname)
+                if (schema is not None and not dyn
+                        and schema[0] == trait.members):
+                    trait.reader = schema[1]
+            context.add_trait(trait)
+        else: # traits-ref
+            trait = context.get_trait(num >> 2)
+        return trait, pos
+
+    def _read_object3(self, buf, pos, context):
+        num, pos = self._read_vli(buf, pos)
+        if not num & 1:
+            return context.get_object(num >> 1), pos
+        trait, pos = self._read_trait3(num, buf, pos, context)
+        if trait.reader is not None:
+            return trait.reader(buf, pos, context)
+        markers = self._markers3
+        cls = trait.cls
+        if cls is None:
+            res = {}
+            context.add_object(res)
+            for name in trait.members:
+                res[name], pos = markers[buf[pos]](buf, pos + 1, context)
+            if trait.dynamic:
+                while True:
+                    key, pos = self._read_string3(buf, pos, context)
+                    if key == "":
+                        break
+                    res[key], pos = markers[buf[pos]](buf, pos + 1, context)
+        else:
+            res = cls.__new__(cls)
+            context.add_object(res)
+            for name in trait.members:
+                val, pos = markers[buf[pos]](buf, pos + 1, context)
+                setattr(res, name, val)
+            if trait.dynamic:
+                while True:
+                    key, pos = self._read_string3(buf, pos, context)
+                    if key == "":
+                        break
+                    val, pos = markers[buf[pos]](buf, pos + 1, context)
+                    setattr(res, key, val)
+        return res, pos
+
+    def _read_bytearray3(self, buf, pos, context):
+        num, pos = self._read_vli(buf, pos)
+        if num & 1:
+            end = _check(buf, pos + (num >> 1))
+            res = bytes(buf[pos:end])
+            context.add_object(res)
+            pos = end
+        else:
+            res = context.get_object(num >> 1)
+        return res, pos
+
+    def _read_bytearray_view3(self, buf, pos, context):
+        num, pos = self._read_vli(buf, pos)
+        if num & 1:
+            end = _check(buf, pos + (num >> 1))
+            res = buf[pos:end]
+            context.add_object(res)
+            pos = end
+        else:
+            res = context.get_object(num >> 1)
+        return res, pos
+
+    def _read_vector3(self, buf, pos, context, typecode):
+        num, pos = self._read_vli(buf, pos)
+        if not num & 1:
+            return context.get_object(num >> 1), pos
+        pos += 1 # fixed flag
+        res = array.array(typecode)
+        end = _check(buf, pos + (num >> 1) * res.itemsize)
+        res.frombytes(buf[pos:end])
+        if _swap:
+            res.byteswap()
+        context.add_object(res)
+        return res, end
+
+    def _read_vector_int3(self, buf, pos, context):
+        return self._read_vector3(buf, pos, context, _vector_int)
+
+    def _read_vector_uint3(self, buf, pos, context):
+        return self._read_vector3(buf, pos, context, _vector_uint)
+
+    def _read_vector_double3(self, buf, pos, context):
+        return self._read_vector3(buf, pos, context, 'd')
+
+    def _read_vector_object3(self, buf, pos, context):
+        num, pos = self._read_vli(buf, pos)
+        if not num & 1:
+            return context.get_object(num >> 1), pos
+        res = ObjectVector()
+        res.fixed = bool(buf[pos])
+        context.add_object(res)
+        res.classname, pos = self._read_string3(buf, pos + 1, context)
+        markers = self._markers3
+        for i in range(num >> 1):
+            val, pos = markers[buf[pos]](buf, pos + 1, context)
+            res.append(val)
+        return res, pos
+
+    def _read_xmldoc3(self, buf, pos, context):
+        raise NotImplementedError("XML Document")
+
+    def _read_xml3(self, buf, pos, context):
+        raise NotImplementedError("XML")
+
+    def _read_unknown3(self, buf, pos, context):
+        raise NotImplementedError("Marker 0x{:02x}".format(buf[pos-1]))
+
+    def _read_vli(self, buf, pos):
+        byte = buf[pos]
+        if byte < 0x80:
+            return byte, pos + 1
+        val = 0
+        while True:
+            byte = buf[pos]
+            pos += 1
+            val = (val << 7) | (byte & 0x7f)
+            if not (byte & 0x80):
+                break
+        return val, pos
+
+    def _read_string3(self, buf, pos, context):
+        num = buf[pos]
+        if num < 0x80:
+            pos += 1
+        else:
+            num, pos = self._read_vli(buf, pos)
+        if num & 1:
+            num >>= 1
+            if num:
+                end = _check(buf, pos + num)
+                res = str(buf[pos:end], 'utf-8')
+                context.add_string(res)
+                return res, end
+            else:
+                return '', pos
+        else:
+            num >>= 1
+            return context.get_string(num), pos
+
+    def _read_string0(self, buf, pos):
+        end = _check(buf, pos + 2 + _ushort.unpack_from(buf, pos)[0])
+        return str(buf[pos+2:end], 'utf-8'), end
+
+    def _read_item0(self, buf, pos, context):
+        return self._markers0[buf[pos]](buf, pos + 1, context)
+
+    def _read_number0(self, buf, pos, context):
+        return _double.unpack_from(buf, pos)[0], pos + 8
+
+    def _read_boolean0(self, buf, pos, context):
+        return bool(buf[pos]), pos + 1
+
+    def _read_sstring0(self, buf, pos, context):
+        end = pos + 2 + _ushort.unpack_from(buf, pos)[0]
+        if end > len(buf):
+            raise EOFError("Truncated AMF data", end)
+        if type(buf) is memoryview:
+            return str(buf[pos+2:end], 'utf-8'), end
+        return buf[pos+2:end].decode('utf-8'), end
+
+    def _read_object0(self, buf, pos, context):
+        # keys, numbers, strings and booleans, most of what objects are
+        # made of, are read here instead of by their readers
+        markers = self._markers0
+        inline = self._inline0
+        # bytes slices decode quicker than memoryview ones
+        sliced = type(buf) is not memoryview
+        size = len(buf)
+        res = {}
+        context.add_complex(res)
+        while True:
+            start = pos + 2
+            pos = start + (buf[pos] << 8 | buf[pos+1])
+            if pos == start:
+                break
+            if pos > size:
+                raise EOFError("Truncated AMF data", pos)
+            if sliced:
+                key = buf[start:pos].decode('utf-8')
+            else:
+                key = str(buf[start:pos], 'utf-8')
+            marker = buf[pos]
+            if not inline:
+                res[key], pos = markers[marker](buf, pos + 1, context)
+            elif marker == 0x00:
+                res[key] = _double.unpack_from(buf, pos + 1)[0]
+                pos += 9
+            elif marker == 0x02:
+                start = pos + 3
+                pos = start + (buf[pos+1] << 8 | buf[pos+2])
+                if pos > size:
+                    raise EOFError("Truncated AMF data", pos)
+                if sliced:
+                    res[key] = buf[start:pos].decode('utf-8')
+                else:
+                    res[key] = str(buf[start:pos], 'utf-8')
+            elif marker == 0x01:
+                res[key] = bool(buf[pos+1])
+                pos += 2
+            else:
+                res[key], pos = markers[marker](buf, pos + 1, context)
+        end = buf[pos]
+        assert end == 0x09
+        return res, pos + 1
+
+    def _read_null0(self, buf, pos, context):
+        return None, pos
+
+    def _read_undefined0(self, buf, pos, context):
+        return undefined, pos
+
+    def _read_reference0(self, buf, pos, context):
+        idx = _ushort.unpack_from(buf, pos)[0]
+        return context.get_complex(idx), pos + 2
+
+    def _read_ecma_array0(self, buf, pos, context):
+        # the count is only a hint and is skipped, the array ends like an
+        # object
+        return self._read_object0(buf, pos + 4, context)
+
+    def _read_strict_array0(self, buf, pos, context):
+        cnt = _ulong.unpack_from(buf, pos)[0]
+        pos += 4
+        markers = self._markers0
+        res = []
+        context.add_complex(res)
+        while cnt:
+            if buf[pos] == 0x00 and self._bulk0:
+                match = _double_run0.match(buf, pos, pos + 9*cnt)
+                if match:
+                    end = match.end()
+                    run = _unpack_doubles(buf, pos, (end - pos) // 9)
+                    res += run
+                    cnt -= len(run)
+                    pos = end
+                    continue
+            val, pos = markers[buf[pos]](buf, pos + 1, context)
+            res.append(val)
+            cnt -= 1
+        return res, pos
+
+    def _read_date0(self, buf, pos, context):
+        end = _check(buf, pos + 10)
+        if buf[pos+8] or buf[pos+9]:
+            raise ValueError("Non-zero date timezone")
+        val = _double.unpack_from(buf, pos)[0]
+        return datetime.datetime.utcfromtimestamp(val/1000), end
+
+    def _read_long_string0(self, buf, pos, context):
+        end = _check(buf, pos + 4 + _ulong.unpack_from(buf, pos)[0])
+        return str(buf[pos+4:end], 'utf-8'), end
+
+    def _read_avmplus0(self, buf, pos, context):
+        return self._read_item3(buf, pos, context)
+
+    def _read_unknown0(self, buf, pos, context):
+        raise NotImplementedError("Marker {:02x}".format(buf[pos-1]))
+
+    def _extract3(self, buf, pos, path, context):
+        if not path:
+            return self._read_item3(buf, pos, context)[0]
+        key = path[0]
+        marker = buf[pos]
+        start = pos
+        skip = self._skips3
+        if marker == 0x09:
+            mark = context.mark()
+            num, pos = self._read_vli(buf, pos + 1)
+            if not num & 1:
+                return _index(context.get_object(num >> 1), path)
+            context.add_object(_Skipped(start, 3, mark))
+            while True:
+                name, pos = self._read_string3(buf, pos, context)
+                if name == '':
+                    break
+                if name == key:
+                    return self._extract3(buf, pos, path[1:], context)
+                pos = skip[buf[pos]](buf, pos + 1, context)
+            if isinstance(key, int) and 0 <= key < num >> 1:
+                for i in range(key):
+                    pos = skip[buf[pos]](buf, pos + 1, context)
+                return self._extract3(buf, pos, path[1:], context)
+        elif marker == 0x0A:
+            mark = context.mark()
+            num, pos = self._read_vli(buf, pos + 1)
+            if not num & 1:
+                return _index(context.get_object(num >> 1), path)
+            trait, pos = self._read_trait3(num, buf, pos, context)
+            if trait.skipper is not None:
+                # externalizable, only its reader knows what's inside
+                return _index(trait.reader(buf, pos, context)[0], path)
+            context.add_object(_Skipped(start, 3, mark))
+            for name in trait.members:
+                if name == key:
+                    return self._extract3(buf, pos, path[1:], context)
+                pos = skip[buf[pos]](buf, pos + 1, context)
+            if trait.dynamic:
+                while True:
+                    name, pos = self._read_string3(buf, pos, context)
+                    if name == '':
+                        break
+                    if name == key:
+                        return self._extract3(buf, pos, path[1:], context)
+                    pos = skip[buf[pos]](buf, pos + 1, context)
+        else:
+            return _index(self._read_item3(buf, pos, context)[0], path)
+        raise KeyError(key)
+
+    def _extract0(self, buf, pos, path, context):
+        if not path:
+            return self._read_item0(buf, pos, context)[0]
+        key = path[0]
+        marker = buf[pos]
+        skip = self._skips0
+        if marker == 0x03 or marker == 0x08:
+            context.add_complex(_Skipped(pos, 0, context.mark()))
+            pos += 1 if marker == 0x03 else 5
+            while True:
+                name, pos = self._read_string0(buf, pos)
+                if name == '':
+                    break
+                if name == key:
+                    return self._extract0(buf, pos, path[1:], context)
+                pos = skip[buf[pos]](buf, pos + 1, context)
+        elif marker == 0x0A:
+            context.add_complex(_Skipped(pos, 0, context.mark()))
+            cnt = _ulong.unpack_from(buf, pos + 1)[0]
+            pos += 5
+            if isinstance(key, int) and 0 <= key < cnt:
+                for i in range(key):
+                    pos = skip[buf[pos]](buf, pos + 1, context)
+                return self._extract0(buf, pos, path[1:], context)
+        elif marker == 0x11:
+            return self._extract3(buf, pos + 1, path, context)
+        else:
+            return _index(self._read_item0(buf, pos, context)[0], path)
+        raise KeyError(key)
+
+    def _skip_none(self, buf, pos, context):
+        return pos
+
+    def _skip_double(self, buf, pos, context):
+        return _check(buf, pos + 8)
+
+    def _skip_integer3(self, buf, pos, context):
+        while buf[pos] & 0x80:
+            pos += 1
+        return pos + 1
+
+    def _skip_string3(self, buf, pos, context):
+        num, pos = self._read_vli(buf, pos)
+        if num & 1 and num > 1:
+            end = _check(buf, pos + (num >> 1))
+            # decoded to str only if it's referenced by extracted value
+            context.add_string(buf[pos:end])
+            return end
+        return pos
+
+    def _skip_date3(self, buf, pos, context):
+        mark = context.mark()
+        start = pos - 1
+        num, pos = self._read_vli(buf, pos)
+        if num & 1:
+            context.add_object(_Skipped(start, 3, mark))
+            return _check(buf, pos + 8)
+        return pos
+
+    def _skip_array3(self, buf, pos, context):
+        mark = context.mark()
+        start = pos - 1
+        num, pos = self._read_vli(buf, pos)
+        if not num & 1:
+            return pos
+        context.add_object(_Skipped(start, 3, mark))
+        skip = self._skips3
+        skip_string = self._skip_string3
+        while buf[pos] != 0x01:
+            pos = skip_string(buf, pos, context)
+            pos = skip[buf[pos]](buf, pos + 1, context)
+        pos += 1
+        for i in range(num >> 1):
+            pos = skip[buf[pos]](buf, pos + 1, context)
+        return pos
+
+    def _skip_object3(self, buf, pos, context):
+        mark = context.mark()
+        start = pos - 1
+        num, pos = self._read_vli(buf, pos)
+        if not num & 1:
+            return pos
+        trait, pos = self._read_trait3(num, buf, pos, context)
+        context.add_object(_Skipped(start, 3, mark))
+        if trait.skipper is not None:
+            return trait.skipper(buf, pos, context)
+        skip = self._skips3
+        for i in range(len(trait.members)):
+            pos = skip[buf[pos]](buf, pos + 1, context)
+        if trait.dynamic:
+            skip_string = self._skip_string3
+            while buf[pos] != 0x01:
+                pos = skip_string(buf, pos, context)
+                pos = skip[buf[pos]](buf, pos + 1, context)
+            pos += 1
+        return pos
+
+    def _skip_bytearray3(self, buf, pos, context):
+        mark = context.mark()
+        start = pos - 1
+        num, pos = self._read_vli(buf, pos)
+        if num & 1:
+            context.add_object(_Skipped(start, 3, mark))
+            return _check(buf, pos + (num >> 1))
+        return pos
+
+    def _skip_vector_int3(self, buf, pos, context):
+        return self._skip_vector3(buf, pos, context, 4)
+
+    def _skip_vector_double3(self, buf, pos, context):
+        return self._skip_vector3(buf, pos, context, 8)
+
+    def _skip_vector3(self, buf, pos, context, itemsize):
+        mark = context.mark()
+        start = pos - 1
+        num, pos = self._read_vli(buf, pos)
+        if num & 1:
+            context.add_object(_Skipped(start, 3, mark))
+            return _check(buf, pos + 1 + (num >> 1) * itemsize)
+        return pos
+
+    def _skip_vector_object3(self, buf, pos, context):
+        mark = context.mark()
+        start = pos - 1
+        num, pos = self._read_vli(buf, pos)
+        if not num & 1:
+            return pos
+        context.add_object(_Skipped(start, 3, mark))
+        pos = self._skip_string3(buf, pos + 1, context)
+        skip = self._skips3
+        for i in range(num >> 1):
+            pos = skip[buf[pos]](buf, pos + 1, context)
+        return pos
+
+    def _skip_boolean0(self, buf, pos, context):
+        return _check(buf, pos + 1)
+
+    def _skip_string0(self, buf, pos):
+        return _check(buf, pos + 2 + _ushort.unpack_from(buf, pos)[0])
+
+    def _skip_sstring0(self, buf, pos, context):
+        return self._skip_string0(buf, pos)
+
+    def _skip_object0(self, buf, pos, context):
+        context.add_complex(_Skipped(pos - 1, 0, context.mark()))
+        skip = self._skips0
+        skip_string = self._skip_string0
+        while buf[pos] or buf[pos+1]:
+            pos = skip_string(buf, pos)
+            pos = skip[buf[pos]](buf, pos + 1, context)
+        end = buf[pos+2]
+        assert end == 0x09
+        return pos + 3
+
+    def _skip_reference0(self, buf, pos, context):
+        return _check(buf, pos + 2)
+
+    def _skip_ecma_array0(self, buf, pos, context):
+        context.add_complex(_Skipped(pos - 1, 0, context.mark()))
+        skip = self._skips0
+        skip_string = self._skip_string0
+        pos += 4
+        while buf[pos] or buf[pos+1]:
+            pos = skip_string(buf, pos)
+            pos = skip[buf[pos]](buf, pos + 1, context)
+        end = buf[pos+2]
+        assert end == 0x09
+        return pos + 3
+
+    def _skip_strict_array0(self, buf, pos, context):
+        context.add_complex(_Skipped(pos - 1, 0, context.mark()))
+        cnt = _ulong.unpack_from(buf, pos)[0]
+        pos += 4
+        skip = self._skips0
+        for i in range(cnt):
+            pos = skip[buf[pos]](buf, pos + 1, context)
+        return pos
+
+    def _skip_date0(self, buf, pos, context):
+        return _check(buf, pos + 10)
+
+    def _skip_long_string0(self, buf, pos, context):
+        return _check(buf, pos + 4 + _ulong.unpack_from(buf, pos)[0])
+
+    def _skip_avmplus0(self, buf, pos, context):
+        return self._skips3[buf[pos]](buf, pos + 1, context)
+
+    def _read_wrapped3(self, buf, pos, context):
+        # ArrayCollection and ObjectProxy write just the value they wrap,
+        # it's returned in their place and their reference is set to it
+        # once read
+        key = len(context.objects)
+        context.add_object(None)
+        res, pos = self._markers3[buf[pos]](buf, pos + 1, context)
+        context.set_object(key, res)
+        return res, pos
+
+    def _skip_wrapped3(self, buf, pos, context):
+        return self._skips3[buf[pos]](buf, pos + 1, context)
+
+    def _read_async_message3(self, buf, pos, context):
+        return self._read_message3('DSA', buf, pos, context)
+
+    def _skip_async_message3(self, buf, pos, context):
+        return self._skip_message3('DSA', buf, pos, context)
+
+    def _read_acknowledge_message3(self, buf, pos, context):
+        return self._read_message3('DSK', buf, pos, context)
+
+    def _skip_acknowledge_message3(self, buf, pos, context):
+        return self._skip_message3('DSK', buf, pos, context)
+
+    def _read_command_message3(self, buf, pos, context):
+        return self._read_message3('DSC', buf, pos, context)
+
+    def _skip_command_message3(self, buf, pos, context):
+        return self._skip_message3('DSC', buf, pos, context)
+
+    def _read_message3(self, classname, buf, pos, context):
+        # Decoded like the full message would be: an instance of the class
+        # registered for its alias or a dict. Fields that weren't written
+        # are missing, values of unknown flags are read and dropped
+        alias, groups = _small_messages[classname]
+        cls = self._aliases.get(alias)
+        if cls is None:
+            res = {}
+            setter = res.__setitem__
+        else:
+            res = cls.__new__(cls)
+            setter = partial(setattr, res)
+        context.add_object(res)
+        markers = self._markers3
+        for group in groups:
+            flags, pos = _read_flags(buf, pos)
+            for i, byte in enumerate(flags):
+                names = group[i] if i < len(group) else ()
+                # unknown flags go up to bit 5, like BlazeDS reads them
+                for bit in range(max(len(names), 6)):
+                    if not byte >> bit & 1:
+                        continue
+                    val, pos = markers[buf[pos]](buf, pos + 1, context)
+                    if bit >= len(names):
+                        continue
+                    name = names[bit]
+                    if name[-1] == '*':
+                        name = name[:-1]
+                        val = str(uuid.UUID(bytes=bytes(val))).upper()
+                    setter(name, val)
+        return res, pos
+
+    def _skip_message3(self, classname, buf, pos, context):
+        skip = self._skips3
+        for group in _small_messages[classname][1]:
+            flags, pos = _read_flags(buf, pos)
+            for i, byte in enumerate(flags):
+                names = group[i] if i < len(group) else ()
+                for bit in range(max(len(names), 6)):
+                    if byte >> bit & 1:
+                        pos = skip[buf[pos]](buf, pos + 1, context)
+        return pos
+
+    def _walk_table(self, markers, defaults, walks):
+        openers = [None]*256
+        for marker, name in walks.items():
+            if markers[marker].__func__ is getattr(Loader, defaults[marker]):
+                openers[marker] = opener = getattr(self, name)
+                markers[marker] = self._walker(opener)
+        return openers
+
+    def _walker(self, opener):
+        def walk(buf, pos, context):
+            res = opener(buf, pos, context)
+            return res if type(res) is tuple else self._walk(res)
+        return walk
+
+    def _walk(self, reader):
+        # Openers return (value, offset) for references or a generator
+        # reading the items. Generators yield generators of nested
+        # containers and get back (value, offset) of each, the last thing
+        # they yield is their own (value, offset), which is cheaper than
+        # raising StopIteration
+        limit = self.max_depth
+        stack = []
+        send = reader.send
+        value = None
+        while True:
+            reader = send(value)
+            if type(reader) is tuple:
+                if not stack:
+                    return reader
+                send = stack.pop()
+                value = reader
+            elif len(stack) + 1 < limit:
+                stack.append(send)
+                send = reader.send
+                value = None
+            else:
+                raise ValueError("Nesting is deeper than {}".format(limit))
+
+    def _walk_array3(self, buf, pos, context):
+        num, pos = self._read_vli(buf, pos)
+        if not num & 1:
+            return context.get_object(num >> 1), pos
+        return self._walk_array_items3(num >> 1, buf, pos, context)
+
+    def _walk_array_items3(self, num, buf, pos, context):
+        markers = self._markers3
+        openers = self._openers3
+        res = None
+        while True:
+            key, pos = self._read_string3(buf, pos, context)
+            if key == '':
+                if res is None:
+                    res = [None]*num
+                    context.add_object(res)
+                break
+            elif res is None:
+                res = OrderedDict()
+                context.add_object(res)
+            opener = openers[buf[pos]]
+            if opener is None:
+                res[key], pos = markers[buf[pos]](buf, pos + 1, context)
+            else:
+                val = opener(buf, pos + 1, context)
+                res[key], pos = val if type(val) is tuple else (yield val)
+        bulk = self._bulk3 and type(res) is list
+        i = 0
+        while i < num:
+            marker = buf[pos]
+            if bulk and marker == 0x05:
+                match = _double_run3.match(buf, pos, pos + 9*(num - i))
+                if match:
+                    end = match.end()
+                    run = _unpack_doubles(buf, pos, (end - pos) // 9)
+                    res[i:i+len(run)] = run
+                    i += len(run)
+                    pos = end
+                    continue
+            elif bulk and marker == 0x04 and buf[pos + 1] < 0x80:
+                match = _int_run3.match(buf, pos, pos + 2*(num - i))
+                if match:
+                    end = match.end()
+                    run = list(buf[pos+1:end:2])
+                    res[i:i+len(run)] = run
+                    i += len(run)
+                    pos = end
+                    continue
+            opener = openers[marker]
+            if opener is None:
+                res[i], pos = markers[marker](buf, pos + 1, context)
+            else:
+                val = opener(buf, pos + 1, context)
+                res[i], pos = val if type(val) is tuple else (yield val)
+            i += 1
+        yield res, pos
+
+    def _walk_object3(self, buf, pos, context):
+        num, pos = self._read_vli(buf, pos)
+        if not num & 1:
+            return context.get_object(num >> 1), pos
+        trait, pos = self._read_trait3(num, buf, pos, context)
+        if trait.reader is not None:
+            return trait.reader(buf, pos, context)
+        return self._walk_members3(trait, buf, pos, context)
+
+    def _walk_members3(self, trait, buf, pos, context):
+        markers = self._markers3
+        openers = self._openers3
+        cls = trait.cls
+        if cls is None:
+            res = {}
+            setter = res.__setitem__
+        else:
+            res = cls.__new__(cls)
+            setter = partial(setattr, res)
+        context.add_object(res)
+        for name in trait.members:
+            opener = openers[buf[pos]]
+            if opener is None:
+                val, pos = markers[buf[pos]](buf, pos + 1, context)
+            else:
+                val = opener(buf, pos + 1, context)
+                val, pos = val if type(val) is tuple else (yield val)
+            setter(name, val)
+        if trait.dynamic:
+            while True:
+                key, pos = self._read_string3(buf, pos, context)
+                if key == "":
+                    break
+                opener = openers[buf[pos]]
+                if opener is None:
+                    val, pos = markers[buf[pos]](buf, pos + 1, context)
+                else:
+                    val = opener(buf, pos + 1, context)
+                    val, pos = val if type(val) is tuple else (yield val)
+                setter(key, val)
+        yield res, pos
+
+    def _walk_vector_object3(self, buf, pos, context):
+        num, pos = self._read_vli(buf, pos)
+        if not num & 1:
+            return context.get_object(num >> 1), pos
+        return self._walk_vector_items3(num >> 1, buf, pos, context)
+
+    def _walk_vector_items3(self, num, buf, pos, context):
+        markers = self._markers3
+        openers = self._openers3
+        res = ObjectVector()
+        res.fixed = bool(buf[pos])
+        context.add_object(res)
+        res.classname, pos = self._read_string3(buf, pos + 1, context)
+        for i in range(num):
+            opener = openers[buf[pos]]
+            if opener is None:
+                val, pos = markers[buf[pos]](buf, pos + 1, context)
+            else:
+                val = opener(buf, pos + 1, context)
+                val, pos = val if type(val) is tuple else (yield val)
+            res.append(val)
+        yield res, pos
+
+    def _walk_object0(self, buf, pos, context):
+        # AMF0 references have a marker of their own, so these openers are
+        # generators themselves
+        markers = self._markers0
+        openers = self._openers0
+        res = {}
+        context.add_complex(res)
+        while True:
+            key, pos = self._read_string0(buf, pos)
+            if key == '':
+                break
+            opener = openers[buf[pos]]
+            if opener is None:
+                res[key], pos = markers[buf[pos]](buf, pos + 1, context)
+            else:
+                res[key], pos = yield opener(buf, pos + 1, context)
+        end = buf[pos]
+        assert end == 0x09
+        yield res, pos + 1
+
+    def _walk_ecma_array0(self, buf, pos, context):
+        return self._walk_object0(buf, pos + 4, context)
+
+    def _walk_strict_array0(self, buf, pos, context):
+        cnt = _ulong.unpack_from(buf, pos)[0]
+        pos += 4
+        markers = self._markers0
+        openers = self._openers0
+        res = []
+        context.add_complex(res)
+        while cnt:
+            marker = buf[pos]
+            if marker == 0x00 and self._bulk0:
+                match = _double_run0.match(buf, pos, pos + 9*cnt)
+                if match:
+                    end = match.end()
+                    run = _unpack_doubles(buf, pos, (end - pos) // 9)
+                    res += run
+                    cnt -= len(run)
+                    pos = end
+                    continue
+            opener = openers[marker]
+            if opener is None:
+                val, pos = markers[marker](buf, pos + 1, context)
+            else:
+                val, pos = yield opener(buf, pos + 1, context)
+            res.append(val)
+            cnt -= 1
+        yield res, pos
+
+
+class _Unscannable(Exception):
+    # value has markers or classes read by code _Scanner doesn't know, or
+    # is malformed in a way left for the decoder to report
+    pass
+
+def _scannable(loader, names, defaults):
+    # markers read by Loader's own readers
+    cls = type(loader)
+    return frozenset(
+        marker for marker, name in names.items()
+        if defaults.get(marker) == name and
+        getattr(cls, name) is getattr(Loader, name))
+
+# Frames of _Scanner: a number of values, key/value pairs up to an empty
+# key (the number is 1 when the value of a key is next) and flag groups of
+# Flex small messages
+_VALUES0, _VALUES3, _PAIRS0, _PAIRS3, _MESSAGE = range(5)
+
+class _Scanner(object):
+    # Finds where top-level values end in data arriving in pieces, for
+    # IncrementalLoader. Tokens are read without decoding anything, what
+    # is left of the containers in progress is kept on a stack, so a value
+    # cut short is resumed at its last complete token and every byte is
+    # looked at once. Strings and traits defined by the value are tracked
+    # for trait references and externalizable class names, the ones of
+    # earlier values are in the context they were decoded with
+
+    def __init__(self, loader, proto, context):
+        self.loader = loader
+        self.proto = proto
+        self.context = context
+        self._names3 = type(loader).markers3
+        self._names0 = type(loader).markers0
+        self._known3 = _scannable(loader, self._names3, Loader.markers3)
+        self._known0 = _scannable(loader, self._names0, Loader.markers0)
+        self.reset()
+
+    def reset(self):
+        # for the next value, offsets are relative to its start
+        self.pos = 0
+        self.need = 0
+        self.stack = [[_VALUES3 if self.proto == 3 else _VALUES0, 1]]
+        self.strings = []
+        self.traits = []
+        # tables of earlier values are counted when the value starts
+        self.nstrings = self.ntraits = None
+
+    def scan(self, buf, start):
+        # offset past the value at ``start``, or None while it's
+        # incomplete and then ``need`` is the length it has at least
+        if self.nstrings is None:
+            context = self.context
+            self.nstrings = len(context.strings)
+            self.ntraits = len(context.traits)
+            self.max_strings = getattr(context, 'max_strings', sys.maxsize)
+            self.max_traits = getattr(context, 'max_traits', sys.maxsize)
+        stack = self.stack
+        pos = start + self.pos
+        try:
+            while stack:
+                frame = stack[-1]
+                kind = frame[0]
+                if kind == _VALUES3 or kind == _VALUES0:
+                    if kind == _VALUES3:
+                        pos, frames = self._value3(buf, pos, start)
+                    else:
+                        pos, frames = self._value0(buf, pos, start)
+                    frame[1] -= 1
+                    if not frame[1]:
+                        stack.pop()
+                elif kind == _PAIRS3:
+                    if not frame[1]:
+                        num, end = self.loader._read_vli(buf, pos)
+                        pos = self._string3(num, buf, end, start)
+                        if num == 1:
+                            stack.pop()
+                        else:
+                            frame[1] = 1
+                        continue
+                    pos, frames = self._value3(buf, pos, start)
+                    frame[1] = 0
+                elif kind == _PAIRS0:
+                    if not frame[1]:
+                        num = _ushort.unpack_from(buf, pos)[0]
+                        if num:
+                            pos = _check(buf, pos + 2 + num)
+                            frame[1] = 1
+                        else:
+                            # and the end marker
+                            pos = _check(buf, pos + 3)
+                            stack.pop()
+                        continue
+                    pos, frames = self._value0(buf, pos, start)
+                    frame[1] = 0
+                else:
+                    groups = frame[1]
+                    if frame[2] == len(groups):
+                        stack.pop()
+                        continue
+                    group = groups[frame[2]]
+                    flags, pos = _read_flags(buf, pos)
+                    frame[2] += 1
+                    num = 0
+                    for i, byte in enumerate(flags):
+                        names = group[i] if i < len(group) else ()
+                        for bit in range(max(len(names), 6)):
+                            num += byte >> bit & 1
+                    frames = ([_VALUES3, num],) if num else ()
+                stack += frames
+        except EOFError as e:
+            self.need = e.args[1] - start
+        except (IndexError, struct.error):
+            self.need = len(buf) + 1 - start
+        self.pos = pos - start
+        return None if stack else pos
+
+    def _string3(self, num, buf, pos, start):
+        if not num & 1:
+            return pos
+        end = _check(buf, pos + (num >> 1))
+        if end > pos and (self.nstrings + len(self.strings) <
+                          self.max_strings):
+            self.strings.append((pos - start, end - start))
+        return end
+
+    def _name3(self, buf, pos, start):
+        num, pos = self.loader._read_vli(buf, pos)
+        if num & 1:
+            end = self._string3(num, buf, pos, start)
+            return str(buf[pos:end], 'utf-8'), end
+        num >>= 1
+        if num < self.nstrings:
+            return self.context.strings[num], pos
+        num -= self.nstrings
+        if num >= len(self.strings):
+            raise _Unscannable()
+        begin, end = self.strings[num]
+        return str(buf[start+begin:start+end], 'utf-8'), pos
+
+    def _value3(self, buf, pos, start):
+        # offset past the token of a value and frames of what's left of it
+        marker = buf[pos]
+        pos += 1
+        if marker not in self._known3:
+            raise _Unscannable()
+        if marker < 0x04:
+            return pos, ()
+        elif marker == 0x05:
+            return _check(buf, pos + 8), ()
+        num, pos = self.loader._read_vli(buf, pos)
+        if marker == 0x06:
+            return self._string3(num, buf, pos, start), ()
+        elif marker == 0x0A:
+            return self._object3(num, buf, pos, start)
+        elif marker == 0x04:
+            return pos, ()
+        elif not num & 1:
+            return pos, ()
+        num >>= 1
+        if marker == 0x09:
+            if num:
+                return pos, ([_VALUES3, num], [_PAIRS3, 0])
+            return pos, ([_PAIRS3, 0],)
+        elif marker == 0x08:
+            return _check(buf, pos + 8), ()
+        elif marker == 0x0C:
+            return _check(buf, pos + num), ()
+        elif marker == 0x0D or marker == 0x0E:
+            return _check(buf, pos + 1 + num * 4), ()
+        elif marker == 0x0F:
+            return _check(buf, pos + 1 + num * 8), ()
+        elif marker == 0x10:
+            name, end = self.loader._read_vli(buf, _check(buf, pos + 1))
+            pos = self._string3(name, buf, end, start)
+            return pos, ([_VALUES3, num],) if num else ()
+        # XML, which the decoder refuses
+        raise _Unscannable()
+
+    def _object3(self, num, buf, pos, start):
+        if not num & 1:
+            return pos, ()
+        if num & 2:
+            # strings of an incomplete trait are read again
+            mark = len(self.strings)
+            try:
+                if num & 4:
+                    classname, pos = self._name3(buf, pos, start)
+                    trait = (False, 0, classname)
+                else:
+                    for i in range((num >> 4) + 1):
+                        name, end = self.loader._read_vli(buf, pos)
+                        pos = self._string3(name, buf, end, start)
+                    trait = (bool(num & 8), num >> 4, None)
+            except (EOFError, IndexError):
+                del self.strings[mark:]
+                raise
+            if self.ntraits + len(self.traits) < self.max_traits:
+                self.traits.append(trait)
+        else:
+            num >>= 2
+            if num < self.ntraits:
+                trait = self.context.traits[num]
+                trait = (trait.dynamic, len(trait.members),
+                         trait.classname if trait.skipper else None)
+            elif num - self.ntraits < len(self.traits):
+                trait = self.traits[num - self.ntraits]
+            else:
+                raise _Unscannable()
+        dynamic, members, external = trait
+        if external is not None:
+            return pos, self._external(external)
+        frames = [[_PAIRS3, 0]] if dynamic else []
+        if members:
+            frames.append([_VALUES3, members])
+        return pos, frames
+
+    def _external(self, classname):
+        # only the classes Loader reads itself
+        names = Loader.externals.get(classname)
+        handler = self.loader._externals.get(classname)
+        if names is None or handler is None or any(
+                getattr(method, '__func__', None) is not getattr(Loader, name)
+                for method, name in zip(handler, names)):
+            raise _Unscannable()
+        if classname in _small_messages:
+            return ([_MESSAGE, _small_messages[classname][1], 0],)
+        return ([_VALUES3, 1],)
+
+    def _value0(self, buf, pos, start):
+        marker = buf[pos]
+        pos += 1
+        if marker not in self._known0:
+            raise _Unscannable()
+        if marker == 0x00:
+            return _check(buf, pos + 8), ()
+        elif marker == 0x02:
+            return _check(buf, pos + 2 +
+                          _ushort.unpack_from(buf, pos)[0]), ()
+        elif marker == 0x03:
+            return pos, ([_PAIRS0, 0],)
+        elif marker == 0x01:
+            return _check(buf, pos + 1), ()
+        elif marker == 0x05 or marker == 0x06:
+            return pos, ()
+        elif marker == 0x07:
+            return _check(buf, pos + 2), ()
+        elif marker == 0x08:
+            return _check(buf, pos + 4), ([_PAIRS0, 0],)
+        elif marker == 0x0A:
+            num = _ulong.unpack_from(buf, pos)[0]
+            return pos + 4, ([_VALUES0, num],) if num else ()
+        elif marker == 0x0B:
+            return _check(buf, pos + 10), ()
+        elif marker == 0x0C:
+            return _check(buf, pos + 4 +
+                          _ulong.unpack_from(buf, pos)[0]), ()
+        elif marker == 0x11:
+            return pos, ([_VALUES3, 1],)
+        raise _Unscannable()
+
+
+class IncrementalLoader(object):
+    # Decodes top-level values from data arriving in arbitrary pieces,
+    # ``feed()`` returns values as soon as they are complete. Reference
+    # tables are shared by all values, like in ``Loader.load_all``.
+    # Where values end is found by _Scanner, each value is decoded once
+    # when it's complete. Values with markers or externalizable classes
+    # of Loader subclasses are decoded again as data arrives instead
+
+    def __init__(self, proto=3, loader=None, context=None):
+        if proto not in (0, 3):
+            raise ValueError(proto)
+        self.proto = proto
+        self.loader = loader or Loader()
+        if self.loader.views:
+            # the buffer is resized as data is fed and consumed
+            raise ValueError("Views can't be used with IncrementalLoader")
+        self.context = context or ReadContext()
+        self._buf = bytearray()
+        # buffer length below which an incomplete value is not looked at
+        self._need = 0
+        self._scanner = _Scanner(self.loader, proto, self.context)
+        # set while the value is one the scanner can't follow
+        self._retry = False
+
+    def feed(self, data):
+        buf = self._buf
+        buf += data
+        if len(buf) < self._need:
+            return []
+        res = []
+        pos = 0
+        context = self.context
+        scanner = self._scanner
+        with memoryview(buf) as view:
+            while pos < len(buf):
+                if not self._retry:
+                    try:
+                        end = scanner.scan(view, pos)
+                    except _Unscannable:
+                        self._retry = True
+                    else:
+                        if end is None:
+                            self._need = scanner.need
+                            break
+                mark = context.mark()
+                try:
+                    value, pos = self.loader._decode(view, pos,
+                                                     self.proto, context)
+                except EOFError as e:
+                    context.rollback(mark)
+                    self._retry = True
+                    self._need = (e.args[1] if len(e.args) > 1
+                                  else len(buf) + 1) - pos
+                    break
+                res.append(value)
+                self._retry = False
+                scanner.reset()
+            else:
+                self._need = 0
+        del buf[:pos]
+        return res
+
+    def pending(self):
+        return len(self._buf)
+
+
+class Trait(object):
+    __slots__ = ('dynamic', 'classname', 'members', 'cls', 'reader',
+                 'skipper')
+
+    def __init__(self, dynamic, classname, members=(), cls=None,
+                 reader=None, skipper=None):
+        self.dynamic = dynamic
+        self.members = tuple(members)
+        self.classname = classname
+        self.cls = cls
+        # compiled schema decoder for objects of this trait, if any
+        self.reader = reader
+        # set for externalizable classes, with the reader of the class
+        self.skipper = skipper
+
+    @classmethod
+    def from_class(cls, klass, alias, members=None, dynamic=None):
+        if members is None:
+            members = _slots(klass)
+            if dynamic is None:
+                dynamic = klass.__dictoffset__ != 0
+        elif dynamic is None:
+            dynamic = False
+        return cls(dynamic, alias, members, klass)
+
+anonymous_trait = Trait(True, "")
+
+@lru_cache(maxsize=256)
+def _columns_trait(classname, members):
+    # one trait for Columns of the same class and members, so the ones
+    # written after the first refer to its trait
+    return Trait(False, classname, members)
+
+class _Rows(object):
+    # Reference table entry of the rows of an array read as Columns, rows
+    # are made from the columns when referenced
+    __slots__ = ('trait', 'columns', 'keys', 'made')
+
+    def __init__(self, trait, columns):
+        self.trait = trait
+        self.columns = columns
+        # reference indexes of rows, ascending
+        self.keys = []
+        self.made = {}
+
+    def row(self, key, context):
+        res = self.made.get(key)
+        if res is not None:
+            return res
+        i = bisect_left(self.keys, key)
+        if i >= len(self.columns[-1]):
+            raise ValueError("Reference to a row being read")
+        cls = self.trait.cls
+        values = [column[i] for column in self.columns]
+        if cls is None:
+            res = dict(zip(self.trait.members, values))
+        else:
+            res = cls.__new__(cls)
+            for name, val in zip(self.trait.members, values):
+                setattr(res, name, val)
+        self.made[key] = res
+        context.set_object(key, res)
+        return res
+
+class _Walk(object):
+    # Dumper table entry of a container type for ``max_depth``, the
+    # container and everything in it are written by ``Dumper._walk``
+    __slots__ = ('opener', 'walk')
+
+    def __init__(self, opener, walk):
+        self.opener = opener
+        self.walk = walk
+
+    def __call__(self, data, out, context):
+        writer = self.opener(data, out, context)
+        if writer is not None:
+            self.walk(writer)
+
+class _Size(object):
+    # Output of writers run by ``Dumper.size``, only its length is kept
+    __slots__ = ('size',)
+
+    def __init__(self):
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, byte):
+        self.size += 1
+
+    def __iadd__(self, data):
+        self.size += len(data) if type(data) is bytes else \
+            memoryview(data).nbytes
+        return self
+
+class RawAMF(object):
+    # Value encoded once by ``Dumper.fragment`` and copied into the output
+    # wherever it's found. ``refs`` are the references written in ``data``
+    # as (position, end, table, index) and ``entries`` what the value adds
+    # to each reference table, see ``Dumper._write_raw``
+    __slots__ = ('value', 'proto', 'data', 'refs', 'entries', '_moved')
+
+    def __init__(self, value, proto, data, refs, entries):
+        self.value = value
+        self.proto = proto
+        self.data = data
+        self.refs = refs
+        self.entries = entries
+        self._moved = {}
+
+    def moved(self, base):
+        # ``data`` with references shifted past ``base``, the number of
+        # entries in each table of the enclosing context
+        if not any(base):
+            return self.data
+        data = self._moved.get(base)
+        if data is None:
+            if len(self._moved) >= 16:
+                self._moved.clear()
+            data = self._moved[base] = self._move(base)
+        return data
+
+    def _move(self, base):
+        res = bytearray()
+        start = 0
+        for pos, end, table, index in self.refs:
+            res += self.data[start:pos]
+            index += base[table]
+            if table == 3:
+                res += _marker_ushort.pack(0x07, index)
+            else:
+                res += _encode_u29((index << 2)|1 if table == 2
+                                   else index << 1)
+            start = end
+        res += self.data[start:]
+        return bytes(res)
+
+
+class Dumper(object):
+    # Exact type to method name, subclasses of these types are looked up
+    # through the mro on first use. Subclasses of Dumper may override the
+    # methods or extend the tables, e.g. ``types3 = dict(Dumper.types3, ...)``
+    types3 = {
+        Undefined: '_write_undefined3',
+        type(None): '_write_null3',
+        bool: '_write_bool3',
+        int: '_write_int3',
+        float: '_write_float3',
+        str: '_write_str3',
+        datetime.datetime: '_write_datetime3',
+        dict: '_write_dict3',
+        list: '_write_list3',
+        bytes: '_write_bytes3',
+        bytearray: '_write_buffer3',
+        memoryview: '_write_buffer3',
+        mmap.mmap: '_write_buffer3',
+        array.array: '_write_vector3',
+        ObjectVector: '_write_object_vector3',
+        Columns: '_write_columns3',
+        RawAMF: '_write_raw3',
+        }
+    types0 = {
+        bool: '_write_bool0',
+        int: '_write_number0',
+        float: '_write_number0',
+        str: '_write_str0',
+        dict: '_write_dict0',
+        type(None): '_write_null0',
+        Undefined: '_write_undefined0',
+        list: '_write_list0',
+        tuple: '_write_list0',
+        datetime.datetime: '_write_datetime0',
+        RawAMF: '_write_raw0',
+        }
+
+    # Generator versions of container writers for ``max_depth``, they
+    # yield items to be written
+    walks3 = {
+        '_write_dict3': '_walk_dict3',
+        '_write_list3': '_walk_list3',
+        '_write_typed3': '_walk_typed3',
+        '_write_object_vector3': '_walk_object_vector3',
+        }
+    walks0 = {
+        '_write_dict0': '_walk_dict0',
+        '_write_list0': '_walk_list0',
+        }
+
+    # Methods computing the size of what a writer writes, for ``size``.
+    # Overridden writers and writers without an entry are run into a
+    # ``_Size`` which only counts bytes
+    sizes3 = {
+        '_write_undefined3': '_size_marker',
+        '_write_null3': '_size_marker',
+        '_write_bool3': '_size_marker',
+        '_write_int3': '_size_int3',
+        '_write_float3': '_size_double',
+        '_write_str3': '_size_str3',
+        '_write_datetime3': '_size_datetime3',
+        '_write_dict3': '_size_dict3',
+        '_write_typed3': '_size_typed3',
+        '_write_list3': '_size_list3',
+        '_write_bytes3': '_size_bytes3',
+        '_write_buffer3': '_size_buffer3',
+        '_write_vector3': '_size_vector3',
+        '_write_object_vector3': '_size_object_vector3',
+        }
+    sizes0 = {
+        '_write_bool0': '_size_bool0',
+        '_write_number0': '_size_double',
+        '_write_str0': '_size_str0',
+        '_write_dict0': '_size_dict0',
+        '_write_null0': '_size_marker',
+        '_write_undefined0': '_size_marker',
+        '_write_list0': '_size_list0',
+        '_write_datetime0': '_size_datetime0',
+        }
+
+    # python class to AMF class alias, sealed members are taken from
+    # ``__slots__``, other attributes are written as dynamic members
+    aliases = {}
+
+    # python class to the class name and the name of the method writing
+    # what writeExternal of the class writes, see ``add_external``
+    externals = {
+        ArrayCollection: ('flex.messaging.io.ArrayCollection',
+                          '_write_wrapped_list3'),
+        ObjectProxy: ('flex.messaging.io.ObjectProxy',
+                      '_write_wrapped_dict3'),
+        }
+
+    def __init__(self, stats=False, max_depth=None):
+        # same as for Loader, table entries are made by _handler
+        if stats and max_depth is not None:
+            raise ValueError("Stats can't be collected with max_depth")
+        # type tables and the flags below are made on first use too
+        self.stats = Stats() if stats else None
+        self.max_depth = max_depth
+        # type to size method, filled on first use by size
+        self._sizes3 = {}
+        self._sizes0 = {}
+        self._traits = {}
+
+    @cached_property
+    def _types3(self):
+        # stored before aliases and externals of the class are added
+        # to it by their methods
+        types = self.__dict__['_types3'] = _type_table(self, self.types3, 3)
+        for cls, alias in self.aliases.items():
+            self.add_alias(cls, alias)
+        for cls, (classname, write) in self.externals.items():
+            self.add_external(cls, classname, getattr(self, write))
+        return types
+
+    @cached_property
+    def _types0(self):
+        return _type_table(self, self.types0, 0)
+
+    @cached_property
+    def _bulk3(self):
+        # same for writing
+        return self.stats is None and (
+            self._types3[int].__func__ is Dumper._write_int3 and
+            self._types3[float].__func__ is Dumper._write_float3)
+
+    @cached_property
+    def _bulk0(self):
+        return self.stats is None and (
+            self._types0[int].__func__ is Dumper._write_number0 and
+            self._types0[float].__func__ is Dumper._write_number0)
+
+    def _handler(self, write, proto):
+        if self.max_depth is not None:
+            name = getattr(write, '__name__', None)
+            walk = (self.walks3 if proto == 3 else self.walks0).get(name)
+            if walk is not None and write.__func__ is getattr(Dumper, name):
+                return _Walk(getattr(self, walk), self._walk)
+        if self.stats is None:
+            return write
+        return _count_write(self.stats, proto, write)
+
+    def add_alias(self, cls, alias, members=None, dynamic=None):
+        self._traits[cls] = Trait.from_class(cls, alias, members, dynamic)
+        self._types3[cls] = self._handler(self._write_typed3, 3)
+        self._sizes3.pop(cls, None)
+
+    def add_external(self, cls, classname, writer):
+        # Objects of ``cls`` are written as externalizable ``classname``,
+        # ``writer(data, out, context)`` writes what follows the traits
+        trait = self._traits[cls] = Trait(False, classname)
+        self._types3[cls] = self._handler(
+            partial(self._write_external3, trait, writer), 3)
+        self._sizes3.pop(cls, None)
+
+    def add_schema(self, schema):
+        if schema.cls is None:
+            raise ValueError("Schema without class can't be encoded")
+        self._traits[schema.cls] = schema.trait
+        self._types3[schema.cls] = self._handler(schema.encoder(self), 3)
+        self._sizes3.pop(schema.cls, None)
+
+    def dump(self, data, stream=None, proto=None, context=None,
+             refs='identity', prefix=None):
+        # please keep it reentrant. ``prefix`` is a struct.Struct, the
+        # length of the message packed with it is written before the
+        # message, in space reserved at the start of the buffer
+        if context is None:
+            context = ref_modes[refs]()
+        else:
+            context.start_message()
+        if proto == 0:
+            write = self._write_item0
+        elif proto == 3:
+            write = self._write_item3
+        else:
+            raise ValueError(proto)
+        out = bytearray(0 if prefix is None else prefix.size)
+        if self.stats is not None:
+            self.stats._call(write, data, out, context)
+        else:
+            write(data, out, context)
+        if prefix is not None:
+            prefix.pack_into(out, 0, len(out) - prefix.size)
+        if stream is None:
+            return out
+        stream.write(out)
+
+    def size(self, data, proto=None, refs='identity'):
+        # Number of bytes ``dump`` would write for ``data``, references
+        # are counted the same way without writing anything
+        if self.stats is not None:
+            raise ValueError("Stats can't be collected by size")
+        if proto == 0:
+            size = self._size_item0
+        elif proto == 3:
+            size = self._size_item3
+        else:
+            raise ValueError(proto)
+        return size(data, ref_modes[refs]())
+
+    def fragment(self, data, proto=3, refs='identity'):
+        # RawAMF of ``data`` encoded against a fresh context, with where
+        # its references are and what it adds to the tables recorded
+        if proto == 0:
+            write = self._write_item0
+        elif proto == 3:
+            write = self._write_item3
+        else:
+            raise ValueError(proto)
+        out = bytearray()
+        context = _FragmentContext(ref_modes[refs](), out)
+        write(data, out, context)
+        refs = []
+        for pos, table, index in context.refs:
+            if table == 3:
+                ref = _marker_ushort.pack(0x07, index)
+            else:
+                ref = _encode_u29((index << 2)|1 if table == 2
+                                  else index << 1)
+            # custom writers must write a reference right after looking
+            # it up, as the ones here do
+            if out[pos:pos+len(ref)] != ref:
+                raise ValueError("Reference not written where it was "
+                                 "looked up at {}".format(pos))
+            refs.append((pos, pos + len(ref), table, index))
+        return RawAMF(data, proto, bytes(out), refs, context.entries)
+
+    def _lookup0(self, cls):
+        return _type_lookup(self, self._types0, self.types0, cls, 0)
+
+    def _lookup3(self, cls):
+        return _type_lookup(self, self._types3, self.types3, cls, 3)
+
+    def _write_item0(self, data, out, context):
+        write = self._types0.get(type(data)) or self._lookup0(type(data))
+        write(data, out, context)
+
+    def _write_bool0(self, data, out, context):
+        out += b'\x01\x01' if data else b'\x01\x00'
+
+    def _write_number0(self, data, out, context):
+        out += _marker_double.pack(0x00, data)
+
+    def _write_str0(self, data, out, context):
+        data = data.encode('utf-8')
+        if len(data) < 65536:
+            out += _marker_ushort.pack(0x02, len(data))
+        else:
+            out += _marker_ulong.pack(0x0C, len(data))
+        out += data
+
+    def _write_dict0(self, data, out, context):
+        ref = context.get_complex(data)
+        if ref is not None:
+            out += _marker_ushort.pack(0x07, ref)
+        else:
+            context.add_complex(data)
+            out.append(0x03)
+            types = self._types0
+            for k, v in data.items():
+                self._write_string0(k, out, context)
+                write = types.get(type(v)) or self._lookup0(type(v))
+                write(v, out, context)
+            out += b'\x00\x00\x09'
+
+    def _write_null0(self, data, out, context):
+        out.append(0x05)
+
+    def _write_undefined0(self, data, out, context):
+        out.append(0x06)
+
+    def _write_list0(self, data, out, context): # strict array
+        ref = context.get_complex(data)
+        if ref is not None:
+            out += _marker_ushort.pack(0x07, ref)
+        else:
+            context.add_complex(data)
+            out += _marker_ulong.pack(0x0A, len(data))
+            if self._bulk0 and set(map(type, data)) <= _numeric:
+                # ints are encoded as doubles too
+                _pack_doubles(out, 0x00, data)
+                return
+            types = self._types0
+            for i in data:
+                write = types.get(type(i)) or self._lookup0(type(i))
+                write(i, out, context)
+
+    def _write_datetime0(self, data, out, context):
+        out += _marker_double.pack(0x0B,
+            time.mktime(data.utctimetuple())*1000)
+        out += b'\x00\x00'
+
+    def _write_string0(self, data, out, context):
+        if len(data) <= _STRING_CACHED:
+            out += _encode_string0(data)
+        else:
+            data = data.encode('utf-8')
+            out += _ushort.pack(len(data))
+            out += data
+
+    def _write_item3(self, data, out, context):
+        write = self._types3.get(type(data)) or self._lookup3(type(data))
+        write(data, out, context)
+
+    def _write_undefined3(self, data, out, context):
+        out.append(0x00)
+
+    def _write_null3(self, data, out, context):
+        out.append(0x01)
+
+    def _write_bool3(self, data, out, context):
+        out.append(0x03 if data else 0x02)
+
+    def _write_int3(self, data, out, context):
+        if data >= 0 and data < (1 << 31):
+            out.append(0x04)
+            self._write_vli(data, out)
+        else:
+            out += _marker_double.pack(0x05, data)
+
+    def _write_float3(self, data, out, context):
+        out += _marker_double.pack(0x05, data)
+
+    def _write_str3(self, data, out, context):
+        out.append(0x06)
+        self._write_text3(data, out, context)
+
+    def _write_datetime3(self, data, out, context):
+        out.append(0x08)
+        ref = context.get_object(data)
+        if ref is not None:
+            self._write_vli((ref << 1), out)
+        else:
+            out += _marker_double.pack(0x01,
+                time.mktime(data.utctimetuple())*1000)
+            context.add_object(data)
+
+    def _write_dict3(self, data, out, context):
+        out.append(0x0A)
+        ref = context.get_object(data)
+        if ref is not None:
+            self._write_vli((ref << 1), out)
+        else:
+            context.add_object(data)
+            ref = context.get_trait(anonymous_trait)
+            if ref is not None:
+                self._write_vli((ref << 2)|1, out)
+            else:
+                context.add_trait(anonymous_trait)
+                out.append(11)
+                self._write_string3(anonymous_trait.classname, out, context)
+            types = self._types3
+            for k, v in data.items():
+                self._write_string3(k, out, context)
+                write = types.get(type(v)) or self._lookup3(type(v))
+                write(v, out, context)
+            out.append(0x01)
+
+    def _write_typed3(self, data, out, context):
+        out.append(0x0A)
+        ref = context.get_object(data)
+        if ref is not None:
+            self._write_vli((ref << 1), out)
+            return
+        context.add_object(data)
+        trait = self._traits[type(data)]
+        ref = context.get_trait(trait)
+        if ref is not None:
+            self._write_vli((ref << 2)|1, out)
+        else:
+            context.add_trait(trait)
+            self._write_vli((len(trait.members) << 4)
+                            | (trait.dynamic << 3) | 3, out)
+            self._write_string3(trait.classname, out, context)
+            for name in trait.members:
+                self._write_string3(name, out, context)
+        types = self._types3
+        for name in trait.members:
+            v = getattr(data, name)
+            write = types.get(type(v)) or self._lookup3(type(v))
+            write(v, out, context)
+        if trait.dynamic:
+            members = trait.members
+            for k, v in getattr(data, '__dict__', {}).items():
+                if k in members:
+                    continue
+                self._write_string3(k, out, context)
+                write = types.get(type(v)) or self._lookup3(type(v))
+                write(v, out, context)
+            out.append(0x01)
+
+    def _write_list3(self, data, out, context):
+        out.append(0x09)
+        ref = context.get_object(data)
+        if ref is not None:
+            self._write_vli((ref << 1), out)
+        else:
+            context.add_object(data)
+            self._write_vli((len(data) << 1)|1, out)
+            out.append(0x01)
+            if self._bulk3 and set(map(type, data)) <= _numeric:
+                self._write_numbers3(data, out, context)
+                return
+            types = self._types3
+            for i in data:
+                write = types.get(type(i)) or self._lookup3(type(i))
+                write(i, out, context)
+
+    def _write_columns3(self, data, out, context):
+        out.append(0x09)
+        ref = context.get_object(data)
+        if ref is not None:
+            self._write_vli((ref << 1), out)
+            return
+        context.add_object(data)
+        columns = list(data.values())
+        num = len(columns[0]) if columns else 0
+        for column in columns:
+            if len(column) != num:
+                raise ValueError("Columns of different lengths")
+        self._write_vli((num << 1)|1, out)
+        out.append(0x01)
+        trait = _columns_trait(data.classname, tuple(data))
+        types = self._types3
+        # rows are tuples made by zip, one object each
+        for row in zip(*columns):
+            out.append(0x0A)
+            context.add_object(row)
+            ref = context.get_trait(trait)
+            if ref is not None:
+                self._write_vli((ref << 2)|1, out)
+            else:
+                context.add_trait(trait)
+                self._write_vli((len(trait.members) << 4)|3, out)
+                self._write_string3(trait.classname, out, context)
+                for name in trait.members:
+                    self._write_string3(name, out, context)
+            for v in row:
+                write = types.get(type(v)) or self._lookup3(type(v))
+                write(v, out, context)
 
-    def load(self, stream, proto=0, context=None):
-        # please keep it reentrant
-        if context is None:
-            context = ReadContext()
-        if proto == 0:
-            return self._read_item0(stream, context)
-        elif proto == 3:
-            return self._read_item3(stream, context)
+    def _write_external3(self, trait, writer, data, out, context):
+        out.append(0x0A)
+        ref = context.get_object(data)
+        if ref is not None:
+            self._write_vli((ref << 1), out)
+            return
+        context.add_object(data)
+        ref = context.get_trait(trait)
+        if ref is not None:
+            self._write_vli((ref << 2)|1, out)
         else:
-            raise ValueError(proto)
+            context.add_trait(trait)
+            out.append(0x07)
+            self._write_string3(trait.classname, out, context)
+        writer(data, out, context)
 
-    def loads(self, value, proto=0):
-        return self.load(BytesIO(value), proto)
+    def _write_wrapped_list3(self, data, out, context):
+        # the wrapped array is an object of its own, with a reference
+        # index after the wrapper's
+        self._write_item3(list(data), out, context)
 
-    def load_all(self, stream, proto=0):
-        context = Context()
-        try:
-            while True:
-                yield self.load(stream, proto, context)
-        except EOFError:
+    def _write_wrapped_dict3(self, data, out, context):
+        self._write_item3(dict(data), out, context)
+
+    def _write_raw0(self, data, out, context):
+        self._write_raw(data, 0, out, context)
+
+    def _write_raw3(self, data, out, context):
+        self._write_raw(data, 3, out, context)
+
+    def _write_raw(self, data, proto, out, context):
+        # The fragment's references are shifted past the entries already
+        # in the tables and its entries are added after them, as a reader
+        # decoding it in place would. Fragments in fragments and
+        # fragments that would overflow the tables of a session are
+        # written from their value
+        if data.proto != proto:
+            raise ValueError("AMF{} fragment in AMF{} data".format(
+                data.proto, proto))
+        base = (context.nstrings, context.nobjects, context.ntraits,
+                context.ncomplex)
+        max_strings = getattr(context, 'max_strings', None)
+        max_traits = getattr(context, 'max_traits', None)
+        if type(context) is _FragmentContext or (
+                max_strings is not None and
+                base[0] + len(data.entries[0]) > max_strings) or (
+                max_traits is not None and
+                base[2] + len(data.entries[2]) > max_traits):
+            write = self._write_item3 if proto == 3 else self._write_item0
+            write(data.value, out, context)
             return
+        out += data.moved(base)
+        adds = (context.add_string, context.add_object, context.add_trait,
+                context.add_complex)
+        for add, entries in zip(adds, data.entries):
+            for val in entries:
+                add(val)
 
-    def loads_all(self, value, proto=0):
-        return self.load_all(BytesIO(value), proto)
+    def _write_numbers3(self, data, out, context):
+        for kind, run in groupby(data, type):
+            run = list(run)
+            if kind is float:
+                _pack_doubles(out, 0x05, run)
+            elif min(run) >= 0 and max(run) < _U29_CACHED:
+                out += b''.join([_int3[i] for i in run])
+            else:
+                for i in run:
+                    self._write_int3(i, out, context)
 
-    def _read_item3(self, stream, context):
-        marker = stream.read(1)[0]
-        if marker ==    0x00:
-            return undefined
-        elif marker ==  0x01:
-            return None
-        elif marker ==  0x02:
-            return False
-        elif marker ==  0x03:
-            return True
-        elif marker ==  0x04:
-            return self._read_vli(stream)
-        elif marker ==  0x05:
-            return struct.unpack('!d', stream.read(8))[0]
-        elif marker ==  0x06:
-            return self._read_string3(stream, context)
-        elif marker ==  0x07:
-            raise NotImplementedError("XML Document")
-        elif marker ==  0x08:
-            num = self._read_vli(stream)
-            if num & 1:
-                res = datetime.datetime.utcfromtimestamp(
-                    struct.unpack('!d', stream.read(8))[0]/1000)
-                context.add_object(res)
+    def _write_bytes3(self, data, out, context):
+        out.append(0x0C)
+        ref = context.get_object(data)
+        if ref is not None:
+            self._write_vli((ref << 1), out)
+        else:
+            context.add_object(data)
+            self._write_vli((len(data) << 1)|1, out)
+            out += data
+
+    def _write_buffer3(self, data, out, context):
+        # other buffers are written as byte arrays without converting them
+        # to bytes first, add their types to ``types3`` to get the same
+        out.append(0x0C)
+        ref = context.get_object(data)
+        if ref is not None:
+            self._write_vli((ref << 1), out)
+        else:
+            context.add_object(data)
+            view = memoryview(data)
+            self._write_vli((view.nbytes << 1)|1, out)
+            if view.contiguous:
+                out += view
             else:
-                res = context.get_object(num >> 1)
-            return res
-        elif marker ==  0x09:
-            num = self._read_vli(stream)
-            if num & 1:
-                res = None
-                while True:
-                    val = self._read_string3(stream, context)
-                    if val == '':
-                        if res is None:
-                            res = [None]*(num >> 1)
-                            context.add_object(res)
-                        break
-                    elif res is None:
-                        res = OrderedDict()
-                        context.add_object(res)
-                    res[val] = self._read_item3(stream, context)
-                for i in range(num >> 1):
-                    res[i] = self._read_item3(stream, context)
+                out += view.tobytes()
+
+    def _write_vector3(self, data, out, context):
+        code = data.typecode
+        marker = _vector_markers.get((code, data.itemsize), 0x0F)
+        out.append(marker)
+        ref = context.get_object(data)
+        if ref is not None:
+            self._write_vli((ref << 1), out)
+            return
+        context.add_object(data)
+        self._write_vli((len(data) << 1)|1, out)
+        out.append(0x00) # not fixed
+        if marker == 0x0F and code != 'd':
+            data = array.array('d', data)
+        elif marker != 0x0F and data.itemsize != 4:
+            data = array.array(_vector_int if marker == 0x0D
+                               else _vector_uint, data)
+        elif _swap:
+            data = array.array(code, data)
+        if _swap:
+            data.byteswap()
+        out += data
+
+    def _write_object_vector3(self, data, out, context):
+        out.append(0x10)
+        ref = context.get_object(data)
+        if ref is not None:
+            self._write_vli((ref << 1), out)
+            return
+        context.add_object(data)
+        self._write_vli((len(data) << 1)|1, out)
+        out.append(0x01 if data.fixed else 0x00)
+        self._write_string3(data.classname, out, context)
+        types = self._types3
+        for i in data:
+            write = types.get(type(i)) or self._lookup3(type(i))
+            write(i, out, context)
+
+    def _walk(self, writer):
+        # Openers write container headers and return a generator writing
+        # the items, or None when there is nothing more to write. The
+        # generators yield generators of nested containers
+        limit = self.max_depth
+        stack = [writer]
+        while stack:
+            for writer in stack[-1]:
+                if len(stack) >= limit:
+                    raise ValueError("Nesting is deeper than {}"
+                                     .format(limit))
+                stack.append(writer)
+                break
             else:
-                res = context.get_object(num >> 1)
-            return res
-        elif marker ==  0x0A:
-            num = self._read_vli(stream)
-            if num & 1:
-                if num & 2:
-                    if num & 4: # traits-ext
-                        trait = Trait()
-                        raise NotImplementedError('Traits ext')
-                    else: # traits
-                        dyn = bool(num & 8)
-                        memb = num >> 4
-                        trait = Trait(dyn,
-                            self._read_string3(stream, context),
-                            (self._read_string3(stream, context)
-                                for i in range(memb)))
-                    context.add_trait(trait)
-                else: # traits-ref
-                    trait = context.get_trait(num >> 2)
+                stack.pop()
+
+    def _walk_items(self, values, types, lookup, out, context):
+        for v in values:
+            write = types.get(type(v)) or lookup(type(v))
+            if type(write) is not _Walk:
+                write(v, out, context)
             else:
-                return context.get_object(num >> 1)
-            if trait.members:
-                raise NotImplementedError("Trait members")
-            if not trait.dynamic:
-                raise NotImplementedError("Dynamic trait")
-            res = {}
-            while True:
-                key = self._read_string3(stream, context)
-                if key == "":
-                    break
-                value = self._read_item3(stream, context)
-                res[key] = value
-            return res
-        elif marker ==  0x0B:
-            # xml
-            raise NotImplementedError()
-        elif marker ==  0x0C:
-            num = self._read_vli(stream)
-            if num & 1:
-                res = stream.read(num >> 1)
-                context.add_object(res)
+                writer = write.opener(v, out, context)
+                if writer is not None:
+                    yield writer
+
+    def _walk_pairs(self, pairs, write_key, types, lookup, end,
+                    out, context):
+        for k, v in pairs:
+            write_key(k, out, context)
+            write = types.get(type(v)) or lookup(type(v))
+            if type(write) is not _Walk:
+                write(v, out, context)
             else:
-                res = context.get_object(num >> 1)
-            return res
+                writer = write.opener(v, out, context)
+                if writer is not None:
+                    yield writer
+        out += end
+
+    def _walk_dict3(self, data, out, context):
+        out.append(0x0A)
+        ref = context.get_object(data)
+        if ref is not None:
+            self._write_vli((ref << 1), out)
+            return None
+        context.add_object(data)
+        ref = context.get_trait(anonymous_trait)
+        if ref is not None:
+            self._write_vli((ref << 2)|1, out)
         else:
-            raise NotImplementedError("Marker 0x{:02x}".format(marker))
+            context.add_trait(anonymous_trait)
+            out.append(11)
+            self._write_string3(anonymous_trait.classname, out, context)
+        return self._walk_pairs(data.items(), self._write_string3,
+                                self._types3, self._lookup3, b'\x01',
+                                out, context)
 
-    def _read_vli(self, stream):
-        val = 0
-        while True:
-            byte = stream.read(1)[0]
-            val = (val << 7) | (byte & 0x7f)
-            if not (byte & 0x80):
-                break
-        return val
+    def _walk_list3(self, data, out, context):
+        out.append(0x09)
+        ref = context.get_object(data)
+        if ref is not None:
+            self._write_vli((ref << 1), out)
+            return None
+        context.add_object(data)
+        self._write_vli((len(data) << 1)|1, out)
+        out.append(0x01)
+        if data and self._bulk3 and set(map(type, data)) <= _numeric:
+            self._write_numbers3(data, out, context)
+            return None
+        return self._walk_items(data, self._types3, self._lookup3,
+                                out, context)
 
-    def _read_string3(self, stream, context):
-        num = self._read_vli(stream)
-        if num & 1:
-            num >>= 1
-            if num:
-                res = stream.read(num).decode('utf-8')
-                context.add_string(res)
-                return res
-            else:
-                return ''
+    def _walk_typed3(self, data, out, context):
+        out.append(0x0A)
+        ref = context.get_object(data)
+        if ref is not None:
+            self._write_vli((ref << 1), out)
+            return None
+        context.add_object(data)
+        trait = self._traits[type(data)]
+        ref = context.get_trait(trait)
+        if ref is not None:
+            self._write_vli((ref << 2)|1, out)
         else:
-            num >>= 1
-            return context.get_string(num)
+            context.add_trait(trait)
+            self._write_vli((len(trait.members) << 4)
+                            | (trait.dynamic << 3) | 3, out)
+            self._write_string3(trait.classname, out, context)
+            for name in trait.members:
+                self._write_string3(name, out, context)
+        return self._walk_typed_items3(data, trait, out, context)
 
-    def _read_string0(self, stream):
-        len = struct.unpack('!H', stream.read(2))[0]
-        return stream.read(len).decode('utf-8')
+    def _walk_typed_items3(self, data, trait, out, context):
+        members = trait.members
+        yield from self._walk_items(
+            (getattr(data, name) for name in members),
+            self._types3, self._lookup3, out, context)
+        if trait.dynamic:
+            yield from self._walk_pairs(
+                ((k, v) for k, v in getattr(data, '__dict__', {}).items()
+                 if k not in members),
+                self._write_string3, self._types3, self._lookup3, b'\x01',
+                out, context)
 
-    def _read_item0(self, stream, context):
-        marker = stream.read(1)
-        if marker:
-            marker = marker[0]
-        else:
-            raise EOFError()
-        if marker ==   0x00:
-            return struct.unpack('!d', stream.read(8))[0]
-        elif marker == 0x01:
-            return bool(stream.read(1)[0])
-        elif marker == 0x02:
-            return self._read_string0(stream)
-        elif marker == 0x03:
-            res = {}
-            context.add_complex(res)
-            while True:
-                key = self._read_string0(stream)
-                if key == '':
-                    break
-                res[key] = self._read_item0(stream, context)
-            end = stream.read(1)[0]
-            assert end == 0x09
-            return res
-        elif marker == 0x05: # null
+    def _walk_object_vector3(self, data, out, context):
+        out.append(0x10)
+        ref = context.get_object(data)
+        if ref is not None:
+            self._write_vli((ref << 1), out)
             return None
-        elif marker == 0x06: # undefined
-            return undefined
-        elif marker == 0x07: # ref
-            idx = struct.unpack('!H', stream.read(2))[0]
-            return context.get_complex(idx)
-        elif marker == 0x08: # assoc arr
-            cnt = struct.unpack('!L', stream.read(4))[0]
-            res = {}
-            context.add_complex(res)
-            for i in range(cnt):
-                key = self._read_string0(stream)
-                res[key] = self._read_item0(stream, context)
-            context.add_complex(res)
-            return res
-        elif marker == 0x0A: # strict array
-            cnt = struct.unpack('!L', stream.read(4))[0]
-            res = []
-            context.add_complex(res)
-            for i in range(cnt):
-                res.append(self._read_item0(stream, context))
-            return res
-        elif marker == 0x0B: # date
-            val = struct.unpack('!d', stream.read(8))[0]
-            res = datetime.datetime.utcfromtimestamp(val/1000)
-            tz = stream.read(2)
-            assert tz == b'\x00\x00'
-            return res
-        elif marker == 0x0C: # longstring
-            len = struct.unpack('!L', stream.read(4))[0]
-            return stream.read(len).decode('utf-8')
-        elif marker == 0x11: # AVM+
-            return self._read_item3(stream, context)
-        else:
-            raise NotImplementedError("Marker {:02x}".format(marker))
+        context.add_object(data)
+        self._write_vli((len(data) << 1)|1, out)
+        out.append(0x01 if data.fixed else 0x00)
+        self._write_string3(data.classname, out, context)
+        return self._walk_items(data, self._types3, self._lookup3,
+                                out, context)
 
+    def _walk_dict0(self, data, out, context):
+        ref = context.get_complex(data)
+        if ref is not None:
+            out += _marker_ushort.pack(0x07, ref)
+            return None
+        context.add_complex(data)
+        out.append(0x03)
+        return self._walk_pairs(data.items(), self._write_string0,
+                                self._types0, self._lookup0, b'\x00\x00\x09',
+                                out, context)
 
-class Trait(object):
-    __slots__ = ('dynamic', 'classname', 'members')
+    def _walk_list0(self, data, out, context):
+        ref = context.get_complex(data)
+        if ref is not None:
+            out += _marker_ushort.pack(0x07, ref)
+            return None
+        context.add_complex(data)
+        out += _marker_ulong.pack(0x0A, len(data))
+        if data and self._bulk0 and set(map(type, data)) <= _numeric:
+            _pack_doubles(out, 0x00, data)
+            return None
+        return self._walk_items(data, self._types0, self._lookup0,
+                                out, context)
 
-    def __init__(self, dynamic, classname, members=()):
-        self.dynamic = dynamic
-        self.members = tuple(members)
-        self.classname = classname
+    def _sizer(self, write, names):
+        name = getattr(write, '__name__', None)
+        size = names.get(name)
+        if size is not None and write.__func__ is getattr(Dumper, name):
+            return getattr(self, size)
+        return partial(self._size_written, write)
 
-anonymous_trait = Trait(True, "")
+    def _sizer0(self, cls):
+        write = self._types0.get(cls) or self._lookup0(cls)
+        size = self._sizes0[cls] = self._sizer(write, self.sizes0)
+        return size
 
-class Dumper(object):
+    def _sizer3(self, cls):
+        write = self._types3.get(cls) or self._lookup3(cls)
+        size = self._sizes3[cls] = self._sizer(write, self.sizes3)
+        return size
 
-    def dump(self, data, stream=None, proto=None, context=None):
-        # please keep it reentrant
-        if context is None:
-            context = WriteContext()
-        if proto == 0:
-            return self._write_item0(data, stream, context)
-        elif proto == 3:
-            return self._write_item3(data, stream, context)
-        else:
-            raise ValueError(proto)
+    def _size_written(self, write, data, context):
+        out = _Size()
+        write(data, out, context)
+        return out.size
 
-    def _write_item0(self, data, stream, context):
-        if isinstance(data, bool):
-            stream.write(b'\x01\x01' if data else b'\x01\x00')
-        elif isinstance(data, (float, int)):
-            stream.write(b'\x00' + struct.pack('!d', data))
-        elif isinstance(data, str):
-            if len(data) < 65536:
-                stream.write(b'\x02')
-                self._write_string0(data, stream, context)
-            else:
-                data = data.encode('utf-8')
-                stream.write(b'\x0c' + struct.pack('!L', len(data)))
-                stream.write(data)
-        elif isinstance(data, dict):
-            ref = context.get_complex(data)
-            if ref is not None:
-                stream.write(b'\x07' + struct.pack('!H', ref))
-            else:
-                context.add_complex(data)
-                stream.write(b'\x03')
-                for k, v in data.items():
-                    self._write_string0(k, stream, context)
-                    self._write_item0(v, stream, context)
-                self._write_string0("", stream, context)
-                stream.write(b'\x09')
-        elif data is None: # null
-            stream.write(b'\x05')
-        elif data is undefined: # undefined
-            stream.write(b'\x06')
-        elif isinstance(data, (list, tuple)): # strict array
-            ref = context.get_complex(data)
-            if ref is not None:
-                stream.write(b'\x07' + struct.pack('!H', ref))
-            else:
-                context.add_complex(data)
-                stream.write(b'\x0A' + struct.pack('!L', len(data)))
-                for i in data:
-                    self._write_item0(i, stream, context)
-        elif isinstance(data, datetime.datetime):
-            stream.write(b'\x0b' + struct.pack('!d',
-                time.mktime(data.utctimetuple())*1000) + b'\x00\x00')
+    def _size_item0(self, data, context):
+        size = self._sizes0.get(type(data)) or self._sizer0(type(data))
+        return size(data, context)
+
+    def _size_item3(self, data, context):
+        size = self._sizes3.get(type(data)) or self._sizer3(type(data))
+        return size(data, context)
+
+    def _size_marker(self, data, context):
+        return 1
+
+    def _size_bool0(self, data, context):
+        return 2
+
+    def _size_double(self, data, context):
+        return 9
+
+    def _size_datetime0(self, data, context):
+        return 11
+
+    def _size_str0(self, data, context):
+        size = len(data.encode('utf-8'))
+        return 3 + size if size < 65536 else 5 + size
+
+    def _size_string0(self, data, context):
+        if len(data) <= _STRING_CACHED:
+            return len(_encode_string0(data))
+        return 2 + len(data.encode('utf-8'))
+
+    def _size_dict0(self, data, context):
+        if context.get_complex(data) is not None:
+            return 3
+        context.add_complex(data)
+        sizes = self._sizes0
+        size_string = self._size_string0
+        res = 4
+        for k, v in data.items():
+            res += size_string(k, context)
+            res += (sizes.get(type(v)) or self._sizer0(type(v)))(v, context)
+        return res
+
+    def _size_list0(self, data, context):
+        if context.get_complex(data) is not None:
+            return 3
+        context.add_complex(data)
+        if self._bulk0 and set(map(type, data)) <= _numeric:
+            return 5 + 9*len(data)
+        sizes = self._sizes0
+        res = 5
+        for v in data:
+            res += (sizes.get(type(v)) or self._sizer0(type(v)))(v, context)
+        return res
+
+    def _size_int3(self, data, context):
+        if data >= 0 and data < (1 << 31):
+            return 1 + _vli_size(data)
+        return 9
+
+    def _size_str3(self, data, context):
+        ref = context.get_string(data)
+        if data and ref is not None:
+            return 1 + _vli_size(ref << 1)
+        if data:
+            context.add_string(data)
+        size = len(data.encode('utf-8'))
+        return 1 + _vli_size((size << 1)|1) + size
+
+    def _size_string3(self, data, context):
+        ref = context.get_string(data)
+        if data and ref is not None:
+            return _vli_size(ref << 1)
+        if data:
+            context.add_string(data)
+        if len(data) <= _STRING_CACHED:
+            return len(_encode_string3(data))
+        size = len(data.encode('utf-8'))
+        return _vli_size((size << 1)|1) + size
+
+    def _size_datetime3(self, data, context):
+        ref = context.get_object(data)
+        if ref is not None:
+            return 1 + _vli_size(ref << 1)
+        context.add_object(data)
+        return 10
+
+    def _size_trait3(self, trait, context):
+        ref = context.get_trait(trait)
+        if ref is not None:
+            return _vli_size((ref << 2)|1)
+        context.add_trait(trait)
+        res = _vli_size((len(trait.members) << 4) | (trait.dynamic << 3) | 3)
+        res += self._size_string3(trait.classname, context)
+        for name in trait.members:
+            res += self._size_string3(name, context)
+        return res
+
+    def _size_dict3(self, data, context):
+        ref = context.get_object(data)
+        if ref is not None:
+            return 1 + _vli_size(ref << 1)
+        context.add_object(data)
+        res = 2 + self._size_trait3(anonymous_trait, context)
+        sizes = self._sizes3
+        size_string = self._size_string3
+        for k, v in data.items():
+            res += size_string(k, context)
+            res += (sizes.get(type(v)) or self._sizer3(type(v)))(v, context)
+        return res
+
+    def _size_typed3(self, data, context):
+        ref = context.get_object(data)
+        if ref is not None:
+            return 1 + _vli_size(ref << 1)
+        context.add_object(data)
+        trait = self._traits[type(data)]
+        res = 1 + self._size_trait3(trait, context)
+        sizes = self._sizes3
+        for name in trait.members:
+            v = getattr(data, name)
+            res += (sizes.get(type(v)) or self._sizer3(type(v)))(v, context)
+        if trait.dynamic:
+            members = trait.members
+            for k, v in getattr(data, '__dict__', {}).items():
+                if k in members:
+                    continue
+                res += self._size_string3(k, context)
+                res += (sizes.get(type(v)) or self._sizer3(type(v)))(v,
+                                                                     context)
+            res += 1
+        return res
+
+    def _size_list3(self, data, context):
+        ref = context.get_object(data)
+        if ref is not None:
+            return 1 + _vli_size(ref << 1)
+        context.add_object(data)
+        res = 2 + _vli_size((len(data) << 1)|1)
+        if self._bulk3 and set(map(type, data)) <= _numeric:
+            # same encodings as _write_int3 and _write_float3
+            res += 9*len(data)
+            for i in data:
+                if type(i) is int and i >= 0 and i < (1 << 31):
+                    res -= 8 - ((i.bit_length() + 6) // 7 or 1)
+            return res
+        sizes = self._sizes3
+        for v in data:
+            res += (sizes.get(type(v)) or self._sizer3(type(v)))(v, context)
+        return res
+
+    def _size_bytes3(self, data, context):
+        ref = context.get_object(data)
+        if ref is not None:
+            return 1 + _vli_size(ref << 1)
+        context.add_object(data)
+        return 1 + _vli_size((len(data) << 1)|1) + len(data)
+
+    def _size_buffer3(self, data, context):
+        ref = context.get_object(data)
+        if ref is not None:
+            return 1 + _vli_size(ref << 1)
+        context.add_object(data)
+        size = memoryview(data).nbytes
+        return 1 + _vli_size((size << 1)|1) + size
+
+    def _size_vector3(self, data, context):
+        ref = context.get_object(data)
+        if ref is not None:
+            return 1 + _vli_size(ref << 1)
+        context.add_object(data)
+        marker = _vector_markers.get((data.typecode, data.itemsize), 0x0F)
+        size = 8 if marker == 0x0F else 4
+        return 2 + _vli_size((len(data) << 1)|1) + size*len(data)
+
+    def _size_object_vector3(self, data, context):
+        ref = context.get_object(data)
+        if ref is not None:
+            return 1 + _vli_size(ref << 1)
+        context.add_object(data)
+        res = 2 + _vli_size((len(data) << 1)|1)
+        res += self._size_string3(data.classname, context)
+        sizes = self._sizes3
+        for v in data:
+            res += (sizes.get(type(v)) or self._sizer3(type(v)))(v, context)
+        return res
+
+    def _write_vli(self, data, out):
+        if data < _U29_CACHED:
+            out += _u29[data]
         else:
-            raise NotImplementedError("Type {!r}".format(type(data)))
+            out += _encode_u29(data)
 
-    def _write_string0(self, data, stream, context):
-        data = data.encode('utf-8')
-        stream.write(struct.pack('!H', len(data)))
-        stream.write(data)
-
-
-    def _write_item3(self, data, stream, context):
-        if data is undefined:
-            stream.write(b'\x00')
-        elif data is None:
-            stream.write(b'\x01')
-        elif data is False:
-            stream.write(b'\x02')
-        elif data is True:
-            stream.write(b'\x03')
-        elif isinstance(data, int) and data >= 0 and data < (1 << 31):
-            stream.write(b'\x04')
-            self._write_vli(data, stream)
-        elif isinstance(data, (int, float)):
-            stream.write(b'\x05' + struct.pack('!d', data))
-        elif isinstance(data, str):
-            stream.write(b'\x06')
-            self._write_string3(data, stream, context)
-        elif isinstance(data, datetime.datetime):
-            stream.write(b'\x08')
-            ref = context.get_object(data)
-            if ref is not None:
-                self._write_vli((ref << 1), stream)
-            else:
-                self._write_vli(1, stream)
-                stream.write(struct.pack('!d',
-                    time.mktime(data.utctimetuple())*1000))
-                context.add_object(data)
-        elif isinstance(data, dict):
-            stream.write(b'\x0A')
-            ref = context.get_object(data)
-            if ref is not None:
-                self._write_vli((ref << 1), stream)
-            else:
-                ref = context.get_trait(anonymous_trait)
-                if ref is not None:
-                    self._write_vli((ref << 2)|1, stream)
-                else:
-                    context.add_trait(anonymous_trait)
-                    self._write_vli(11, stream)
-                    self._write_string3(anonymous_trait.classname, stream, context)
-                for k, v in data.items():
-                    self._write_string3(k, stream, context)
-                    self._write_item3(v, stream, context)
-                self._write_string3("", stream, context)
-        elif isinstance(data, list):
-            stream.write(b'\x09')
-            ref = context.get_object(data)
-            if ref is not None:
-                self._write_vli((ref << 1), stream)
-            else:
-                context.add_object(data)
-                self._write_vli((len(data) << 1)|1, stream)
-                self._write_string3("", stream, context)
-                for i in data:
-                    self._write_item3(i, stream, context)
-        elif isinstance(data, bytes):
-            stream.write(b'\x0C')
-            ref = context.get_object(data)
-            if ref is not None:
-                self._write_vli((ref << 1), stream)
-            else:
-                context.add_object(data)
-                self._write_vli((len(data) << 1)|1, stream)
-                stream.write(data)
+    def _write_string3(self, data, out, context):
+        ref = context.get_string(data)
+        if data and ref is not None:
+            self._write_vli(ref << 1, out)
         else:
-            raise NotImplementedError("Type {!r}".format(type(data)))
+            if data:
+                context.add_string(data)
+            if len(data) <= _STRING_CACHED:
+                out += _encode_string3(data)
+            else:
+                data = data.encode('utf-8')
+                self._write_vli((len(data) << 1)|1, out)
+                out += data
 
-    def _write_vli(self, data, stream):
-        ba = bytearray()
-        if not data:
-            stream.write(b'\x00')
-            return
-        while data:
-            ba.append((data & 0x7f) | 0x80)
-            data >>= 7
-        ba.reverse()
-        ba[-1] &= 0x7f
-        stream.write(ba)
-
-    def _write_string3(self, data, stream, context):
+    def _write_text3(self, data, out, context):
+        # same as _write_string3 for string values, not cached
         ref = context.get_string(data)
         if data and ref is not None:
-            self._write_vli(ref << 1, stream)
+            self._write_vli(ref << 1, out)
         else:
             if data:
                 context.add_string(data)
             data = data.encode('utf-8')
-            self._write_vli((len(data) << 1)|1, stream)
-            stream.write(data)
+            self._write_vli((len(data) << 1)|1, out)
+            out += data
 
 class ReadContext(object):
     def __init__(self):
@@ -398,29 +3002,110 @@ class ReadContext(object):
         self.traits = []
         self.complex = []
 
+    def start_message(self):
+        pass
+
+    def mark(self):
+        return (len(self.strings), len(self.objects),
+                len(self.traits), len(self.complex))
+
+    def rollback(self, mark):
+        del self.strings[mark[0]:]
+        del self.objects[mark[1]:]
+        del self.traits[mark[2]:]
+        del self.complex[mark[3]:]
+
     def add_string(self, val):
         self.strings.append(val)
 
     def get_string(self, key):
-        return self.strings[key]
+        try:
+            return self.strings[key]
+        except IndexError:
+            raise ValueError("Bad string reference {}".format(key))
 
     def add_object(self, val):
         self.objects.append(val)
 
+    def set_object(self, key, val):
+        self.objects[key] = val
+
     def get_object(self, key):
-        return self.objects[key]
+        try:
+            return self.objects[key]
+        except IndexError:
+            raise ValueError("Bad object reference {}".format(key))
 
     def add_trait(self, val):
         self.traits.append(val)
 
     def get_trait(self, key):
-        return self.traits[key]
+        try:
+            return self.traits[key]
+        except IndexError:
+            raise ValueError("Bad trait reference {}".format(key))
 
     def add_complex(self, val):
         self.complex.append(val)
 
     def get_complex(self, key):
-        return self.complex[key]
+        try:
+            return self.complex[key]
+        except IndexError:
+            raise ValueError("Bad complex reference {}".format(key))
+
+class _Skipped(object):
+    # Placeholder for a value that was skipped, it is decoded from its
+    # offset with the reference tables as they were at that point, if the
+    # extracted value refers to it
+    __slots__ = ('pos', 'proto', 'mark')
+
+    def __init__(self, pos, proto, mark):
+        self.pos = pos
+        self.proto = proto
+        self.mark = mark
+
+
+class SkipContext(ReadContext):
+    # Reference tables filled by Loader.skip and Loader.extract. Strings
+    # are kept as buffer slices and objects as offsets until requested
+
+    def __init__(self, loader, buf):
+        super().__init__()
+        self.loader = loader
+        self.buf = buf
+
+    def get_string(self, key):
+        val = super().get_string(key)
+        if type(val) is not str:
+            val = self.strings[key] = str(val, 'utf-8')
+        return val
+
+    def get_object(self, key):
+        val = super().get_object(key)
+        if type(val) is _Skipped:
+            val = self.objects[key] = self._materialize(val)
+        return val
+
+    def get_complex(self, key):
+        val = super().get_complex(key)
+        if type(val) is _Skipped:
+            val = self.complex[key] = self._materialize(val)
+        return val
+
+    def _materialize(self, skipped):
+        nstrings, nobjects, ntraits, ncomplex = skipped.mark
+        context = SkipContext(self.loader, self.buf)
+        context.strings = self.strings[:nstrings]
+        context.objects = self.objects[:nobjects]
+        context.traits = self.traits[:ntraits]
+        context.complex = self.complex[:ncomplex]
+        if skipped.proto == 3:
+            read = self.loader._read_item3
+        else:
+            read = self.loader._read_item0
+        return read(self.buf, skipped.pos, context)[0]
+
 
 class WriteContext(object):
     def __init__(self):
@@ -432,6 +3117,12 @@ class WriteContext(object):
         self.ntraits = 0
         self.complex = {}
         self.ncomplex = 0
+        # objects are tracked by id(), so they are kept alive until the
+        # end of the dump for the ids not to be reused by temporaries
+        self.pinned = []
+
+    def start_message(self):
+        pass
 
     def add_string(self, val):
         self.strings[val] = self.nstrings
@@ -443,6 +3134,7 @@ class WriteContext(object):
     def add_object(self, val):
         self.objects[id(val)] = self.nobjects
         self.nobjects += 1
+        self.pinned.append(val)
 
     def get_object(self, key):
         return self.objects.get(id(key), None)
@@ -457,6 +3149,246 @@ class WriteContext(object):
     def add_complex(self, val):
         self.complex[id(val)] = self.ncomplex
         self.ncomplex += 1
+        self.pinned.append(val)
 
     def get_complex(self, key):
         return self.complex.get(id(key), None)
+
+
+class TreeWriteContext(WriteContext):
+    # For data known to be acyclic and without shared containers, no
+    # object references are tracked or written
+
+    # only counted, for fragments to be placed after the entries
+    def add_object(self, val):
+        self.nobjects += 1
+
+    def get_object(self, key):
+        return None
+
+    def add_complex(self, val):
+        self.ncomplex += 1
+
+    def get_complex(self, key):
+        return None
+
+
+class ValueWriteContext(WriteContext):
+    # Equal immutable values are written once and referenced afterwards,
+    # other objects are tracked by identity
+
+    def add_object(self, val):
+        if type(val) in _by_value:
+            self.objects[type(val), val] = self.nobjects
+            self.nobjects += 1
+        else:
+            WriteContext.add_object(self, val)
+
+    def get_object(self, key):
+        if type(key) in _by_value:
+            return self.objects.get((type(key), key))
+        return self.objects.get(id(key))
+
+_by_value = frozenset((str, bytes, datetime.datetime))
+
+# reference tracking modes for ``Dumper.dump``
+ref_modes = {
+    'identity': WriteContext,
+    'tree': TreeWriteContext,
+    'value': ValueWriteContext,
+    }
+
+
+class Stats(object):
+    # Counters of a Loader or Dumper created with ``stats=True``. Counts
+    # and bytes are keyed by (protocol, marker), bytes of nested values
+    # are accounted to their own markers, so bytes sum up to the payload
+    # size. Fields of schema-compiled classes that have their declared type
+    # are accounted to the object. Reference hits and misses are keyed by
+    # table: 'strings', 'objects', 'traits' and 'complex' (AMF0 references)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = {}
+        self.bytes = {}
+        self.hits = dict.fromkeys(_tables, 0)
+        self.misses = dict.fromkeys(_tables, 0)
+        self.max_depth = 0
+        self.calls = 0
+        self.time = 0.0
+        self._depth = 0
+        self._nested = 0
+
+    def hit_ratio(self, table):
+        total = self.hits[table] + self.misses[table]
+        return self.hits[table] / total if total else 0.0
+
+    def _call(self, func, data, pos, context):
+        # top-level call, timed with reference lookups counted
+        self._depth = self._nested = 0
+        start = time.perf_counter()
+        try:
+            return func(data, pos, _CountingContext(context, self))
+        finally:
+            self.calls += 1
+            self.time += time.perf_counter() - start
+
+
+_tables = ('strings', 'objects', 'traits', 'complex')
+
+class _CountingContext(object):
+    # Proxy counting lookups of a read or write context: a lookup that
+    # finds a value is a hit, a value added to a table is a miss
+
+    def __init__(self, context, stats):
+        self._context = context
+        self._hits = stats.hits
+        self._misses = stats.misses
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+    def _get(self, table, val):
+        if val is not None:
+            self._hits[table] += 1
+        return val
+
+    def add_string(self, val):
+        self._misses['strings'] += 1
+        self._context.add_string(val)
+
+    def get_string(self, key):
+        return self._get('strings', self._context.get_string(key))
+
+    def add_object(self, val):
+        self._misses['objects'] += 1
+        self._context.add_object(val)
+
+    def get_object(self, key):
+        return self._get('objects', self._context.get_object(key))
+
+    def add_trait(self, val):
+        self._misses['traits'] += 1
+        self._context.add_trait(val)
+
+    def get_trait(self, key):
+        return self._get('traits', self._context.get_trait(key))
+
+    def add_complex(self, val):
+        self._misses['complex'] += 1
+        self._context.add_complex(val)
+
+    def get_complex(self, key):
+        return self._get('complex', self._context.get_complex(key))
+
+
+class _FragmentContext(object):
+    # Proxy of the fresh write context of ``Dumper.fragment``, recording
+    # found references as (position in ``out``, table, index) and the
+    # entries added to each table
+
+    def __init__(self, context, out):
+        self._context = context
+        self._out = out
+        self.refs = []
+        self.entries = ([], [], [], [])
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+    def _get(self, table, val):
+        if val is not None:
+            self.refs.append((len(self._out), table, val))
+        return val
+
+    def add_string(self, val):
+        self.entries[0].append(val)
+        self._context.add_string(val)
+
+    def get_string(self, key):
+        return self._get(0, self._context.get_string(key))
+
+    def add_object(self, val):
+        self.entries[1].append(val)
+        self._context.add_object(val)
+
+    def get_object(self, key):
+        return self._get(1, self._context.get_object(key))
+
+    def add_trait(self, val):
+        self.entries[2].append(val)
+        self._context.add_trait(val)
+
+    def get_trait(self, key):
+        return self._get(2, self._context.get_trait(key))
+
+    def add_complex(self, val):
+        self.entries[3].append(val)
+        self._context.add_complex(val)
+
+    def get_complex(self, key):
+        return self._get(3, self._context.get_complex(key))
+
+
+class ReadSession(ReadContext):
+    # Reference tables of a long-lived connection. Strings and traits are
+    # kept between messages, objects are per message. Tables stop growing
+    # at the limits, so the peer's WriteSession must use the same limits
+    # and must be reset at the same message
+
+    def __init__(self, max_strings=4096, max_traits=512):
+        super().__init__()
+        self.max_strings = max_strings
+        self.max_traits = max_traits
+        self.epoch = 0
+
+    def start_message(self):
+        del self.objects[:]
+        del self.complex[:]
+
+    def reset(self):
+        epoch = self.epoch
+        self.__init__(self.max_strings, self.max_traits)
+        self.epoch = epoch + 1
+
+    def add_string(self, val):
+        if len(self.strings) < self.max_strings:
+            self.strings.append(val)
+
+    def add_trait(self, val):
+        if len(self.traits) < self.max_traits:
+            self.traits.append(val)
+
+
+class WriteSession(WriteContext):
+    # Writing side of ReadSession
+
+    def __init__(self, max_strings=4096, max_traits=512):
+        super().__init__()
+        self.max_strings = max_strings
+        self.max_traits = max_traits
+        self.epoch = 0
+
+    def start_message(self):
+        self.objects.clear()
+        self.nobjects = 0
+        self.complex.clear()
+        self.ncomplex = 0
+        del self.pinned[:]
+
+    def reset(self):
+        epoch = self.epoch
+        self.__init__(self.max_strings, self.max_traits)
+        self.epoch = epoch + 1
+
+    def add_string(self, val):
+        if self.nstrings < self.max_strings:
+            self.strings[val] = self.nstrings
+            self.nstrings += 1
+
+    def add_trait(self, val):
+        if self.ntraits < self.max_traits:
+            self.traits[val] = self.ntraits
+            self.ntraits += 1
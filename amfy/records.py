@@ -0,0 +1,143 @@
+import os
+import mmap
+import array
+import struct
+
+from .core import Dumper, Loader, _ulong, _swap
+
+# File layout: MAGIC, protocol byte, then records of a 4-byte big-endian
+# length and one AMF message each. Every message has its own reference
+# tables, so any record can be decoded alone. Offsets of records are
+# appended to ``<path>.idx`` as 8-byte big-endian integers by the writer.
+# The index is only a hint: readers rebuild missing or stale parts of it
+# by hopping over length prefixes
+MAGIC = b'AMFLOG\x01'
+_HEADER = len(MAGIC) + 1
+_offset = struct.Struct('!Q')
+
+
+def _index_path(path):
+    return path + '.idx'
+
+
+class RecordWriter(object):
+
+    def __init__(self, path, proto=3, Dumper=Dumper):
+        if proto not in (0, 3):
+            raise ValueError(proto)
+        self.proto = proto
+        self._dumper = Dumper()
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC + bytes((proto,)))
+        else:
+            with open(path, 'rb') as f:
+                if f.read(_HEADER) != MAGIC + bytes((proto,)):
+                    self._file.close()
+                    raise ValueError("Not an AMF{} record log: {!r}"
+                                     .format(proto, path))
+        self._index = open(_index_path(path), 'ab')
+
+    def write(self, value):
+        data = self._dumper.dump(value, proto=self.proto)
+        offset = self._file.tell()
+        self._file.write(_ulong.pack(len(data)))
+        self._file.write(data)
+        self._index.write(_offset.pack(offset))
+
+    def flush(self):
+        # data first, so that the index never points past the data
+        self._file.flush()
+        self._index.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RecordReader(object):
+    # Memory-mapped reader, records are decoded in place from the mapping.
+    # Records appended after opening are not visible, an incomplete record
+    # at the end of the file (interrupted write) is ignored
+
+    def __init__(self, path, Loader=Loader):
+        self._loader = Loader()
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < _HEADER:
+                raise ValueError("Not an AMF record log: {!r}".format(path))
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buf = memoryview(self._map)
+        self.proto = self._buf[_HEADER-1]
+        if self._buf[:len(MAGIC)] != MAGIC or self.proto not in (0, 3):
+            self.close()
+            raise ValueError("Not an AMF record log: {!r}".format(path))
+        self.offsets = self._load_index(_index_path(path))
+
+    def _load_index(self, path):
+        offsets = array.array('Q')
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        offsets.frombytes(data[:len(data) - len(data) % 8])
+        if _swap:
+            offsets.byteswap()
+        # only the last entry is checked, when it's wrong the index is
+        # rebuilt from the start
+        if offsets and self._record_end(offsets[-1]) is None:
+            offsets = array.array('Q')
+        pos = self._record_end(offsets[-1]) if offsets else _HEADER
+        while True:
+            end = self._record_end(pos)
+            if end is None:
+                break
+            offsets.append(pos)
+            pos = end
+        return offsets
+
+    def _record_end(self, pos):
+        if pos < _HEADER or pos + 4 > len(self._buf):
+            return None
+        end = pos + 4 + _ulong.unpack_from(self._buf, pos)[0]
+        if end > len(self._buf):
+            return None
+        return end
+
+    def _read(self, pos):
+        start = pos + 4
+        end = start + _ulong.unpack_from(self._buf, pos)[0]
+        return self._loader.loads(self._buf[start:end], proto=self.proto)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._read(pos) for pos in self.offsets[index]]
+        return self._read(self.offsets[index])
+
+    def iter(self, start=0):
+        # values of records from ``start`` to the end
+        for pos in self.offsets[start:]:
+            yield self._read(pos)
+
+    def __iter__(self):
+        return self.iter()
+
+    def close(self):
+        self._buf.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,139 @@
+import struct
+
+from .core import Loader, Dumper, ReadContext, _check, _ushort, _ulong
+from .core import _instance
+
+UNKNOWN_LENGTH = 0xFFFFFFFF
+
+_missing = object()
+
+
+class _Message(object):
+    # Holds the encoded value until it's first accessed. The raw bytes are
+    # a memoryview slice of the packet, so unread values cost nothing and
+    # are written back unchanged by ``dumps``. Accessed values may be
+    # changed in place, so they are encoded again
+    __slots__ = ('_raw', '_value', '_loader')
+
+    def __init__(self, value, raw=None, loader=None):
+        self._value = value
+        self._raw = raw
+        self._loader = loader
+
+    def _get_value(self):
+        if self._value is _missing:
+            self._value = self._loader.loads(self._raw, proto=0,
+                                             context=ReadContext())
+        self._raw = None
+        return self._value
+
+    def _set_value(self, value):
+        self._value = value
+        self._raw = None
+
+
+class Header(_Message):
+    __slots__ = ('name', 'must_understand')
+
+    def __init__(self, name, value=None, must_understand=False,
+                 raw=None, loader=None):
+        super().__init__(value, raw, loader)
+        self.name = name
+        self.must_understand = must_understand
+
+    value = property(_Message._get_value, _Message._set_value)
+
+    def __repr__(self):
+        return '<Header {!r}>'.format(self.name)
+
+
+class Body(_Message):
+    __slots__ = ('target', 'response')
+
+    def __init__(self, target, response, data=None, raw=None, loader=None):
+        super().__init__(data, raw, loader)
+        self.target = target
+        self.response = response
+
+    data = property(_Message._get_value, _Message._set_value)
+
+    def __repr__(self):
+        return '<Body {!r} {!r}>'.format(self.target, self.response)
+
+
+class Envelope(object):
+    __slots__ = ('version', 'headers', 'bodies')
+
+    def __init__(self, version=3, headers=(), bodies=()):
+        self.version = version
+        self.headers = list(headers)
+        self.bodies = list(bodies)
+
+    def __repr__(self):
+        return '<Envelope v{} {!r} {!r}>'.format(self.version,
+            self.headers, self.bodies)
+
+
+def _read_value(loader, buf, pos):
+    length = _ulong.unpack_from(buf, pos)[0]
+    pos += 4
+    if length == UNKNOWN_LENGTH:
+        # have to decode the value to find where it ends
+        value, end = loader._decode(buf, pos, 0, ReadContext())
+        return value, buf[pos:end], end
+    end = _check(buf, pos + length)
+    return _missing, buf[pos:end], end
+
+
+def loads(data, Loader=Loader):
+    loader = _instance(Loader)
+    buf = memoryview(data)
+    read_string = loader._read_string0
+    try:
+        version = _ushort.unpack_from(buf, 0)[0]
+        pos = 2
+        headers = []
+        count = _ushort.unpack_from(buf, pos)[0]
+        pos += 2
+        for i in range(count):
+            name, pos = read_string(buf, pos)
+            must_understand = bool(buf[pos])
+            value, raw, pos = _read_value(loader, buf, pos + 1)
+            headers.append(Header(name, value, must_understand, raw, loader))
+        bodies = []
+        count = _ushort.unpack_from(buf, pos)[0]
+        pos += 2
+        for i in range(count):
+            target, pos = read_string(buf, pos)
+            response, pos = read_string(buf, pos)
+            value, raw, pos = _read_value(loader, buf, pos)
+            bodies.append(Body(target, response, value, raw, loader))
+    except (IndexError, struct.error):
+        raise EOFError("Truncated AMF data")
+    return Envelope(version, headers, bodies)
+
+
+def _write_value(dumper, msg, out):
+    raw = msg._raw
+    if raw is None:
+        raw = dumper.dump(msg._value, proto=0)
+    out += _ulong.pack(len(raw))
+    out += raw
+
+
+def dumps(envelope, Dumper=Dumper):
+    dumper = _instance(Dumper)
+    write_string = dumper._write_string0
+    out = bytearray()
+    out += _ushort.pack(envelope.version)
+    out += _ushort.pack(len(envelope.headers))
+    for header in envelope.headers:
+        write_string(header.name, out, None)
+        out.append(1 if header.must_understand else 0)
+        _write_value(dumper, header, out)
+    out += _ushort.pack(len(envelope.bodies))
+    for body in envelope.bodies:
+        write_string(body.target, out, None)
+        write_string(body.response, out, None)
+        _write_value(dumper, body, out)
+    return out
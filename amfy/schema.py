@@ -0,0 +1,198 @@
+import keyword
+
+from .core import Trait, _slots, _marker_double, _double, _encode_u29, _int3
+from .core import _encode_string3, _U29_CACHED
+
+
+_WRITE = {
+    float: '''\
+    if type(v) is float:
+        out += pack_double(0x05, v)
+    else:
+        write_item(v, out, context)
+''',
+    int: '''\
+    if type(v) is int and 0 <= v < U29_CACHED:
+        out += INT3[v]
+    else:
+        write_item(v, out, context)
+''',
+    str: '''\
+    if type(v) is str:
+        out.append(0x06)
+        write_string(v, out, context)
+    else:
+        write_item(v, out, context)
+''',
+    bool: '''\
+    if v is True:
+        out.append(0x03)
+    elif v is False:
+        out.append(0x02)
+    else:
+        write_item(v, out, context)
+''',
+    }
+
+_READ = {
+    float: '''\
+    if buf[pos] == 0x05:
+        v = unpack_double(buf, pos + 1)[0]
+        pos += 9
+    else:
+        v, pos = markers[buf[pos]](buf, pos + 1, context)
+''',
+    int: '''\
+    if buf[pos] == 0x04 and buf[pos+1] < 0x80:
+        v = buf[pos+1]
+        pos += 2
+    else:
+        v, pos = markers[buf[pos]](buf, pos + 1, context)
+''',
+    str: '''\
+    if buf[pos] == 0x06:
+        v, pos = read_string(buf, pos + 1, context)
+    else:
+        v, pos = markers[buf[pos]](buf, pos + 1, context)
+''',
+    bool: '''\
+    if buf[pos] == 0x03:
+        v = True
+        pos += 1
+    elif buf[pos] == 0x02:
+        v = False
+        pos += 1
+    else:
+        v, pos = markers[buf[pos]](buf, pos + 1, context)
+''',
+    }
+
+_ANY_WRITE = '''\
+    write_item(v, out, context)
+'''
+
+_ANY_READ = '''\
+    v, pos = markers[buf[pos]](buf, pos + 1, context)
+'''
+
+
+class Schema(object):
+    # A fixed object shape: class, AMF class alias and sealed members with
+    # their expected types (float, int, str, bool or None for any type).
+    # Encoder and decoder functions specialized for the shape are generated
+    # by ``Dumper.add_schema`` and ``Loader.add_schema``. Values that don't
+    # have the declared type go through the generic dispatch
+
+    def __init__(self, cls, classname, fields):
+        self.cls = cls
+        self.classname = classname
+        fields = [(f, None) if isinstance(f, str) else tuple(f)
+                  for f in fields]
+        for name, kind in fields:
+            if kind is not None and kind not in _WRITE:
+                raise ValueError("Unsupported field type {!r}".format(kind))
+        self.fields = tuple(fields)
+        self.members = tuple(name for name, kind in fields)
+        self.trait = Trait(False, classname, self.members, cls)
+
+    @classmethod
+    def from_class(cls, klass, classname, types=None):
+        # members are taken from __slots__
+        types = types or {}
+        return cls(klass, classname,
+                   [(name, types.get(name)) for name in _slots(klass)])
+
+    @classmethod
+    def from_trait(cls, trait, types=None, klass=None):
+        if trait.dynamic:
+            raise ValueError("Dynamic traits have no fixed shape")
+        types = types or {}
+        return cls(klass or trait.cls, trait.classname,
+                   [(name, types.get(name)) for name in trait.members])
+
+    def _header(self):
+        # trait written inline, strings are registered as if they were
+        # written one by one
+        header = _encode_u29((len(self.members) << 4) | 3)
+        header += _encode_string3(self.classname)
+        for name in self.members:
+            header += _encode_string3(name)
+        strings = tuple(s for s in (self.classname,) + self.members if s)
+        return header, strings
+
+    def encoder(self, dumper):
+        header, strings = self._header()
+        namespace = {
+            'TRAIT': self.trait,
+            'HEADER': header,
+            'STRINGS': strings,
+            'INT3': _int3,
+            'U29_CACHED': _U29_CACHED,
+            'pack_double': _marker_double.pack,
+            'write_item': dumper._write_item3,
+            'write_string': dumper._write_text3,
+            'write_vli': dumper._write_vli,
+            }
+        lines = [
+            'def encode(data, out, context):',
+            '    out.append(0x0A)',
+            '    ref = context.get_object(data)',
+            '    if ref is not None:',
+            '        write_vli(ref << 1, out)',
+            '        return',
+            '    context.add_object(data)',
+            '    ref = context.get_trait(TRAIT)',
+            '    if ref is not None:',
+            '        write_vli((ref << 2)|1, out)',
+            '    else:',
+            '        context.add_trait(TRAIT)',
+            '        out += HEADER',
+            '        for s in STRINGS:',
+            '            context.add_string(s)',
+            ]
+        for i, (name, kind) in enumerate(self.fields):
+            if _attribute(name):
+                lines.append('    v = data.{}'.format(name))
+            else:
+                namespace['NAME{}'.format(i)] = name
+                lines.append('    v = getattr(data, NAME{})'.format(i))
+            lines.append(_WRITE.get(kind, _ANY_WRITE))
+        return _compile('\n'.join(lines), 'encode', namespace,
+                        self.classname)
+
+    def decoder(self, loader):
+        namespace = {
+            'cls': self.cls,
+            'unpack_double': _double.unpack_from,
+            'markers': loader._markers3,
+            'read_string': loader._read_string3,
+            }
+        lines = ['def decode(buf, pos, context):']
+        if self.cls is None:
+            lines.append('    res = {}')
+        else:
+            lines.append('    res = cls.__new__(cls)')
+        lines.append('    context.add_object(res)')
+        for i, (name, kind) in enumerate(self.fields):
+            lines.append(_READ.get(kind, _ANY_READ))
+            if self.cls is None:
+                lines.append('    res[{!r}] = v'.format(name))
+            elif _attribute(name):
+                lines.append('    res.{} = v'.format(name))
+            else:
+                namespace['NAME{}'.format(i)] = name
+                lines.append('    setattr(res, NAME{}, v)'.format(i))
+        lines.append('    return res, pos')
+        return _compile('\n'.join(lines), 'decode', namespace,
+                        self.classname)
+
+
+def _attribute(name):
+    # members written as attributes in generated code, others are accessed
+    # with getattr and setattr
+    return name.isidentifier() and not keyword.iskeyword(name)
+
+def _compile(source, name, namespace, classname):
+    code = compile(source, '<amfy schema {}>'.format(classname), 'exec')
+    exec(code, namespace)
+    return namespace[name]
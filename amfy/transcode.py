@@ -0,0 +1,598 @@
+import re
+import json
+import base64
+import struct
+import datetime
+from json.decoder import scanstring
+from json.encoder import encode_basestring_ascii
+
+from .core import Dumper, Loader, ReadContext, TreeWriteContext, _Skipped
+from .core import SkipContext
+from .core import anonymous_trait, _marker_table
+from .core import _double, _ushort, _ulong, _marker_ulong
+
+# AMF values are written as JSON text while they are parsed, nothing but
+# strings, traits and leaf values (dates, byte arrays, numeric vectors) is
+# kept for references. Mapping:
+#
+#   undefined, null -> null
+#   date -> ISO 8601 string (UTC, as decoded by Loader)
+#   byte array -> base64 string
+#   array with associative part, ECMA array -> object, dense keys as
+#       strings like json.dumps writes int keys
+#   typed object -> object of its members, class name is dropped
+#   vectors -> arrays
+#   reference -> the referenced value written once more, circular
+#       references raise ValueError like json.dumps does
+#
+# For plain data the text is the same as of ``json.dumps(amfy.loads(data))``.
+# The reverse direction writes JSON objects as anonymous objects, the same
+# way ``Dumper`` writes dicts
+
+# parts of output gathered before writing them to the destination
+_FLUSH = 4096
+
+_ws = re.compile(r'[ \t\n\r]*')
+_number = re.compile(r'(-?(?:0|[1-9]\d*))(\.\d+)?([eE][-+]?\d+)?')
+_constants = {
+    'null': None, 'true': True, 'false': False,
+    'NaN': float('nan'), 'Infinity': float('inf'),
+    '-Infinity': float('-inf'),
+    }
+_constant = re.compile('|'.join(sorted(map(re.escape, _constants),
+                                       key=len, reverse=True)))
+# what counting items of arrays looks at, strings are matched to skip them
+_structure = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[][{},]')
+
+
+def _float(val):
+    if val != val:
+        return 'NaN'
+    if val == float('inf'):
+        return 'Infinity'
+    if val == float('-inf'):
+        return '-Infinity'
+    return float.__repr__(val)
+
+
+class _JSONContext(ReadContext):
+    # reference tables with the output, objects and arrays are recorded
+    # as offsets to be written again when referenced
+
+    def __init__(self, out, write, active):
+        super().__init__()
+        self.out = out
+        self.write = write
+        # offsets of containers being written, to catch cycles
+        self.active = active
+
+    def flush(self):
+        if self.write is not None and len(self.out) >= _FLUSH:
+            self.write(''.join(self.out))
+            del self.out[:]
+
+
+class _ExternalContext(SkipContext):
+    # reference tables of a _JSONContext for readers of externalizable
+    # objects. Values only written as JSON are decoded when referenced,
+    # they are not kept, the tables are shared with the _JSONContext
+
+    def __init__(self, loader, buf, context):
+        super().__init__(loader, buf)
+        self.strings = context.strings
+        self.objects = context.objects
+        self.traits = context.traits
+        self.complex = context.complex
+
+    def get_object(self, key):
+        val = ReadContext.get_object(self, key)
+        if type(val) is _Skipped:
+            val = self._materialize(val)
+        return val
+
+
+class _AMFContext(TreeWriteContext):
+    # JSON has no shared values, so only strings and traits are tracked.
+    # Item counts of arrays are written before the items, they are found
+    # by _array_counts
+
+    def __init__(self, write):
+        super().__init__()
+        self.write = write
+        # offset of an array in the text to its item count
+        self.counts = {}
+
+    def flush(self, out):
+        if self.write is not None and len(out) >= _FLUSH:
+            self.write(out)
+            del out[:]
+
+    def count(self, text, pos):
+        counts = self.counts
+        if pos not in counts:
+            _array_counts(text, pos, counts)
+        return counts.pop(pos, 0)
+
+
+def _array_counts(text, pos, counts):
+    # Counts items of the array at ``pos`` and of the arrays in it, in one
+    # pass up to its end. Text that is not JSON is left to the parser
+    stack = []
+    for match in _structure.finditer(text, pos):
+        char = match.group()[0]
+        if char == '[':
+            start = match.start()
+            empty = text.startswith(']', _ws.match(text, start + 1).end())
+            stack.append([start, 0 if empty else 1])
+        elif char == '{':
+            stack.append(None)
+        elif char == ',':
+            if stack[-1] is not None:
+                stack[-1][1] += 1
+        elif char != '"':
+            top = stack.pop()
+            if top is not None:
+                counts[top[0]] = top[1]
+            if not stack:
+                return
+
+
+class JSONTranscoder(object):
+
+    # AMF marker to method name, emitters write JSON for the value and
+    # return the offset past it, like skippers of ``Loader``
+    emits3 = {
+        0x00: '_emit_null',
+        0x01: '_emit_null',
+        0x02: '_emit_false',
+        0x03: '_emit_true',
+        0x04: '_emit_integer3',
+        0x05: '_emit_double',
+        0x06: '_emit_string3',
+        0x08: '_emit_date3',
+        0x09: '_emit_array3',
+        0x0A: '_emit_object3',
+        0x0C: '_emit_bytearray3',
+        0x0D: '_emit_vector3',
+        0x0E: '_emit_vector3',
+        0x0F: '_emit_vector3',
+        0x10: '_emit_vector_object3',
+        }
+    emits0 = {
+        0x00: '_emit_double',
+        0x01: '_emit_boolean0',
+        0x02: '_emit_sstring0',
+        0x03: '_emit_object0',
+        0x05: '_emit_null',
+        0x06: '_emit_null',
+        0x07: '_emit_reference0',
+        0x08: '_emit_ecma_array0',
+        0x0A: '_emit_strict_array0',
+        0x0B: '_emit_date0',
+        0x0C: '_emit_long_string0',
+        0x11: '_emit_avmplus0',
+        }
+
+    def __init__(self, Loader=Loader, Dumper=Dumper):
+        # strings, traits and leaf values are read, scalars are written by
+        # the Loader and Dumper given
+        self._loader = Loader()
+        self._dumper = Dumper()
+        self._emits3 = _marker_table(self, self.emits3, '_emit_unknown')
+        self._emits0 = _marker_table(self, self.emits0, '_emit_unknown')
+
+    def to_json(self, value, stream=None, proto=3):
+        # ``value`` is a bytes-like object, text is written to ``stream``
+        # in parts or returned when it's None
+        buf = memoryview(value)
+        if proto == 0:
+            emits = self._emits0
+        elif proto == 3:
+            emits = self._emits3
+        else:
+            raise ValueError(proto)
+        out = []
+        context = _JSONContext(out, None if stream is None else stream.write,
+                               set())
+        try:
+            emits[buf[0]](buf, 1, context)
+        except (IndexError, struct.error):
+            raise EOFError("Truncated AMF data")
+        if stream is None:
+            return ''.join(out)
+        stream.write(''.join(out))
+
+    def to_amf(self, text, stream=None, proto=3):
+        # ``text`` is a JSON document, AMF is written to ``stream`` in
+        # parts or returned as bytearray when it's None
+        if proto == 0:
+            value = self._value0
+        elif proto == 3:
+            value = self._value3
+        else:
+            raise ValueError(proto)
+        out = bytearray()
+        context = _AMFContext(None if stream is None else stream.write)
+        pos = value(text, _ws.match(text, 0).end(), out, context)
+        pos = _ws.match(text, pos).end()
+        if pos != len(text):
+            raise json.JSONDecodeError("Extra data", text, pos)
+        if stream is None:
+            return out
+        stream.write(out)
+
+    # AMF to JSON
+
+    def _emit_ref(self, buf, val, context):
+        if type(val) is not _Skipped:
+            if isinstance(val, (dict, list)):
+                # decoded by an externalizable reader
+                self._emit_value(val, context.out)
+            else:
+                self._emit_leaf(val, context.out)
+            return
+        if val.pos in context.active:
+            raise ValueError("Circular reference detected")
+        nstrings, nobjects, ntraits, ncomplex = val.mark
+        copy = _JSONContext(context.out, context.write, context.active)
+        copy.strings = context.strings[:nstrings]
+        copy.objects = context.objects[:nobjects]
+        copy.traits = context.traits[:ntraits]
+        copy.complex = context.complex[:ncomplex]
+        emits = self._emits3 if val.proto == 3 else self._emits0
+        emits[buf[val.pos]](buf, val.pos + 1, copy)
+
+    def _emit_leaf(self, val, out):
+        if isinstance(val, (bytes, memoryview)):
+            out.append('"{}"'.format(base64.b64encode(val).decode('ascii')))
+        elif isinstance(val, datetime.datetime):
+            out.append('"{}"'.format(val.isoformat()))
+        elif val.typecode == 'd':
+            out.append('[{}]'.format(', '.join(map(_float, val))))
+        else:
+            out.append('[{}]'.format(', '.join(map(str, val))))
+
+    def _emit_value(self, val, out):
+        out.append(json.dumps(val, default=self._json_leaf))
+
+    def _json_leaf(self, val):
+        parts = []
+        self._emit_leaf(val, parts)
+        return json.loads(parts[0])
+
+    def _emit_null(self, buf, pos, context):
+        context.out.append('null')
+        return pos
+
+    def _emit_false(self, buf, pos, context):
+        context.out.append('false')
+        return pos
+
+    def _emit_true(self, buf, pos, context):
+        context.out.append('true')
+        return pos
+
+    def _emit_integer3(self, buf, pos, context):
+        val, pos = self._loader._read_integer3(buf, pos, context)
+        context.out.append(str(val))
+        return pos
+
+    def _emit_double(self, buf, pos, context):
+        context.out.append(_float(_double.unpack_from(buf, pos)[0]))
+        return pos + 8
+
+    def _emit_string3(self, buf, pos, context):
+        val, pos = self._loader._read_string3(buf, pos, context)
+        context.out.append(encode_basestring_ascii(val))
+        return pos
+
+    def _emit_date3(self, buf, pos, context):
+        val, pos = self._loader._read_date3(buf, pos, context)
+        self._emit_leaf(val, context.out)
+        return pos
+
+    def _emit_bytearray3(self, buf, pos, context):
+        val, pos = self._loader._read_bytearray3(buf, pos, context)
+        self._emit_leaf(val, context.out)
+        return pos
+
+    def _emit_vector3(self, buf, pos, context):
+        val, pos = self._loader._markers3[buf[pos-1]](buf, pos, context)
+        self._emit_leaf(val, context.out)
+        return pos
+
+    def _emit_array3(self, buf, pos, context):
+        start = pos - 1
+        num, pos = self._loader._read_vli(buf, pos)
+        if not num & 1:
+            self._emit_ref(buf, context.get_object(num >> 1), context)
+            return pos
+        context.add_object(_Skipped(start, 3, context.mark()))
+        context.active.add(start)
+        read_string = self._loader._read_string3
+        emits = self._emits3
+        out = context.out
+        key, pos = read_string(buf, pos, context)
+        if key == '':
+            out.append('[')
+            for i in range(num >> 1):
+                if i:
+                    out.append(', ')
+                pos = emits[buf[pos]](buf, pos + 1, context)
+                context.flush()
+            out.append(']')
+        else:
+            out.append('{')
+            while key != '':
+                out.append(encode_basestring_ascii(key))
+                out.append(': ')
+                pos = emits[buf[pos]](buf, pos + 1, context)
+                context.flush()
+                key, pos = read_string(buf, pos, context)
+                out.append(', ')
+            for i in range(num >> 1):
+                out.append('"{}": '.format(i))
+                pos = emits[buf[pos]](buf, pos + 1, context)
+                context.flush()
+                out.append(', ')
+            out[-1] = '}'
+        context.active.discard(start)
+        return pos
+
+    def _emit_object3(self, buf, pos, context):
+        start = pos - 1
+        num, pos = self._loader._read_vli(buf, pos)
+        if not num & 1:
+            self._emit_ref(buf, context.get_object(num >> 1), context)
+            return pos
+        mark = context.mark()
+        trait, pos = self._loader._read_trait3(num, buf, pos, context)
+        if trait.skipper is not None:
+            # externalizable, decoded by the Loader and written by json
+            val, pos = trait.reader(
+                buf, pos, _ExternalContext(self._loader, buf, context))
+            self._emit_value(val, context.out)
+            return pos
+        context.add_object(_Skipped(start, 3, mark))
+        context.active.add(start)
+        emits = self._emits3
+        out = context.out
+        out.append('{')
+        for name in trait.members:
+            out.append(encode_basestring_ascii(name))
+            out.append(': ')
+            pos = emits[buf[pos]](buf, pos + 1, context)
+            context.flush()
+            out.append(', ')
+        if trait.dynamic:
+            read_string = self._loader._read_string3
+            while True:
+                key, pos = read_string(buf, pos, context)
+                if key == '':
+                    break
+                out.append(encode_basestring_ascii(key))
+                out.append(': ')
+                pos = emits[buf[pos]](buf, pos + 1, context)
+                context.flush()
+                out.append(', ')
+        if out[-1] == '{':
+            out.append('}')
+        else:
+            out[-1] = '}'
+        context.active.discard(start)
+        return pos
+
+    def _emit_vector_object3(self, buf, pos, context):
+        start = pos - 1
+        num, pos = self._loader._read_vli(buf, pos)
+        if not num & 1:
+            self._emit_ref(buf, context.get_object(num >> 1), context)
+            return pos
+        context.add_object(_Skipped(start, 3, context.mark()))
+        context.active.add(start)
+        classname, pos = self._loader._read_string3(buf, pos + 1, context)
+        emits = self._emits3
+        out = context.out
+        out.append('[')
+        for i in range(num >> 1):
+            if i:
+                out.append(', ')
+            pos = emits[buf[pos]](buf, pos + 1, context)
+            context.flush()
+        out.append(']')
+        context.active.discard(start)
+        return pos
+
+    def _emit_boolean0(self, buf, pos, context):
+        context.out.append('true' if buf[pos] else 'false')
+        return pos + 1
+
+    def _emit_sstring0(self, buf, pos, context):
+        val, pos = self._loader._read_string0(buf, pos)
+        context.out.append(encode_basestring_ascii(val))
+        return pos
+
+    def _emit_long_string0(self, buf, pos, context):
+        val, pos = self._loader._read_long_string0(buf, pos, context)
+        context.out.append(encode_basestring_ascii(val))
+        return pos
+
+    def _emit_date0(self, buf, pos, context):
+        val, pos = self._loader._read_date0(buf, pos, context)
+        self._emit_leaf(val, context.out)
+        return pos
+
+    def _emit_reference0(self, buf, pos, context):
+        idx = _ushort.unpack_from(buf, pos)[0]
+        self._emit_ref(buf, context.get_complex(idx), context)
+        return pos + 2
+
+    def _emit_members0(self, buf, pos, context):
+        emits = self._emits0
+        out = context.out
+        out.append('{')
+        while True:
+            key, pos = self._loader._read_string0(buf, pos)
+            if key == '':
+                break
+            out.append(encode_basestring_ascii(key))
+            out.append(': ')
+            pos = emits[buf[pos]](buf, pos + 1, context)
+            context.flush()
+            out.append(', ')
+        if out[-1] == '{':
+            out.append('}')
+        else:
+            out[-1] = '}'
+        if buf[pos] != 0x09:
+            raise ValueError("Bad object end marker")
+        return pos + 1
+
+    def _emit_object0(self, buf, pos, context):
+        start = pos - 1
+        context.add_complex(_Skipped(start, 0, context.mark()))
+        context.active.add(start)
+        pos = self._emit_members0(buf, pos, context)
+        context.active.discard(start)
+        return pos
+
+    def _emit_ecma_array0(self, buf, pos, context):
+        # the count is only a hint, like when loading
+        start = pos - 1
+        context.add_complex(_Skipped(start, 0, context.mark()))
+        context.active.add(start)
+        pos = self._emit_members0(buf, pos + 4, context)
+        context.active.discard(start)
+        return pos
+
+    def _emit_strict_array0(self, buf, pos, context):
+        start = pos - 1
+        cnt = _ulong.unpack_from(buf, pos)[0]
+        pos += 4
+        context.add_complex(_Skipped(start, 0, context.mark()))
+        context.active.add(start)
+        emits = self._emits0
+        out = context.out
+        out.append('[')
+        for i in range(cnt):
+            if i:
+                out.append(', ')
+            pos = emits[buf[pos]](buf, pos + 1, context)
+            context.flush()
+        out.append(']')
+        context.active.discard(start)
+        return pos
+
+    def _emit_avmplus0(self, buf, pos, context):
+        return self._emits3[buf[pos]](buf, pos + 1, context)
+
+    def _emit_unknown(self, buf, pos, context):
+        # XML is not supported by Loader either
+        raise NotImplementedError("Marker 0x{:02x}".format(buf[pos-1]))
+
+    # JSON to AMF
+
+    def _value3(self, text, pos, out, context):
+        char = text[pos:pos+1]
+        if char == '{':
+            # same as Dumper writes a dict
+            dumper = self._dumper
+            out.append(0x0A)
+            ref = context.get_trait(anonymous_trait)
+            if ref is not None:
+                dumper._write_vli((ref << 2)|1, out)
+            else:
+                context.add_trait(anonymous_trait)
+                out.append(11)
+                dumper._write_string3(anonymous_trait.classname, out, context)
+            pos = self._members(text, pos + 1, out, context, self._value3,
+                                dumper._write_string3)
+            out.append(0x01)
+        elif char == '[':
+            num = context.count(text, pos)
+            out.append(0x09)
+            self._dumper._write_vli((num << 1)|1, out)
+            out.append(0x01)
+            pos = self._items(text, pos, num, out, context, self._value3)
+        else:
+            pos = self._scalar(text, pos, out, context, self._dumper._types3)
+        return pos
+
+    def _value0(self, text, pos, out, context):
+        char = text[pos:pos+1]
+        if char == '{':
+            out.append(0x03)
+            pos = self._members(text, pos + 1, out, context, self._value0,
+                                self._dumper._write_string0)
+            out += b'\x00\x00\x09'
+        elif char == '[':
+            num = context.count(text, pos)
+            out += _marker_ulong.pack(0x0A, num)
+            pos = self._items(text, pos, num, out, context, self._value0)
+        else:
+            pos = self._scalar(text, pos, out, context, self._dumper._types0)
+        return pos
+
+    def _scalar(self, text, pos, out, context, types):
+        if text.startswith('"', pos):
+            val, pos = scanstring(text, pos + 1)
+        else:
+            match = _number.match(text, pos)
+            if match is not None:
+                integer, frac, exp = match.groups()
+                if frac or exp:
+                    val = float(match.group())
+                else:
+                    val = int(integer)
+            else:
+                match = _constant.match(text, pos)
+                if match is None:
+                    raise json.JSONDecodeError("Expecting value", text, pos)
+                val = _constants[match.group()]
+            pos = match.end()
+        types[type(val)](val, out, context)
+        return pos
+
+    def _members(self, text, pos, out, context, value, write_key):
+        pos = _ws.match(text, pos).end()
+        if text.startswith('}', pos):
+            return pos + 1
+        while True:
+            if not text.startswith('"', pos):
+                raise json.JSONDecodeError("Expecting property name "
+                    "enclosed in double quotes", text, pos)
+            key, pos = scanstring(text, pos + 1)
+            write_key(key, out, context)
+            pos = _ws.match(text, pos).end()
+            if not text.startswith(':', pos):
+                raise json.JSONDecodeError("Expecting ':' delimiter",
+                                           text, pos)
+            pos = value(text, _ws.match(text, pos + 1).end(), out, context)
+            context.flush(out)
+            pos = _ws.match(text, pos).end()
+            if text.startswith('}', pos):
+                return pos + 1
+            if not text.startswith(',', pos):
+                raise json.JSONDecodeError("Expecting ',' delimiter",
+                                           text, pos)
+            pos = _ws.match(text, pos + 1).end()
+
+    def _items(self, text, start, count, out, context, value):
+        # ``count`` is what _array_counts found, it's written already
+        pos = _ws.match(text, start + 1).end()
+        num = 0
+        if not text.startswith(']', pos):
+            while True:
+                pos = value(text, pos, out, context)
+                context.flush(out)
+                num += 1
+                pos = _ws.match(text, pos).end()
+                if text.startswith(']', pos):
+                    break
+                if not text.startswith(',', pos):
+                    raise json.JSONDecodeError("Expecting ',' delimiter",
+                                               text, pos)
+                pos = _ws.match(text, pos + 1).end()
+        if num != count:
+            raise json.JSONDecodeError("Invalid array", text, start)
+        return pos + 1
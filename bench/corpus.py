@@ -0,0 +1,61 @@
+import datetime
+
+
+def small_rpc():
+    return {
+        'id': 12345,
+        'method': 'getUser',
+        'ok': True,
+        'params': ['alpha', 'beta', 3.5],
+        'meta': {'client': 'flash', 'version': 10},
+        }
+
+
+def wide_object():
+    return {'field{}'.format(i): i if i % 2 else 'value{}'.format(i)
+            for i in range(500)}
+
+
+def deep_nesting(depth=200):
+    value = {'leaf': True}
+    for i in range(depth):
+        value = {'level': i, 'child': value}
+    return value
+
+
+def numeric_array():
+    return [i * 1.25 for i in range(50000)]
+
+
+def integer_array():
+    return list(range(50000))
+
+
+def reference_graph():
+    tags = [{'tag': 'tag{}'.format(i)} for i in range(20)]
+    users = [{'name': 'user{}'.format(i), 'tags': tags[i % 20:] + tags[:3]}
+             for i in range(300)]
+    return {'users': users, 'tags': tags, 'owner': users[0]}
+
+
+def long_strings():
+    return ['{:08d}'.format(i) * 2048 for i in range(20)]
+
+
+def records():
+    when = datetime.datetime(2015, 10, 14, 12, 0, 0)
+    return [{'name': 'row{}'.format(i), 'value': i * 0.5,
+             'flag': bool(i & 1), 'when': when} for i in range(2000)]
+
+
+# name -> (factory, protocols)
+SCENARIOS = {
+    'small_rpc': (small_rpc, (0, 3)),
+    'wide_object': (wide_object, (0, 3)),
+    'deep_nesting': (deep_nesting, (0, 3)),
+    'numeric_array': (numeric_array, (0, 3)),
+    'integer_array': (integer_array, (0, 3)),
+    'reference_graph': (reference_graph, (0, 3)),
+    'long_strings': (long_strings, (0, 3)),
+    'records': (records, (0, 3)),
+    }
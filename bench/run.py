@@ -0,0 +1,137 @@
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+import amfy
+
+from .corpus import SCENARIOS
+
+
+def _timeit(func, min_time):
+    # best time per call of several rounds, each at least min_time long
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = elapsed / number
+    for i in range(4):
+        start = time.perf_counter()
+        for i in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def _allocations(func):
+    # peak traced memory and number of blocks allocated by one call
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        result = func()
+        after = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del result
+    stats = after.compare_to(before, 'filename')
+    return peak, sum(s.count_diff for s in stats if s.count_diff > 0)
+
+
+def measure(names=None, min_time=0.2):
+    results = {}
+    for name, (factory, protos) in sorted(SCENARIOS.items()):
+        if names and name not in names:
+            continue
+        value = factory()
+        for proto in protos:
+            data = bytes(amfy.dumps(value, proto=proto))
+            for op, func in (
+                    ('dumps', lambda: amfy.dumps(value, proto=proto)),
+                    ('loads', lambda: amfy.loads(data, proto=proto))):
+                sec = _timeit(func, min_time)
+                peak, blocks = _allocations(func)
+                results['{}/amf{}/{}'.format(name, proto, op)] = {
+                    'bytes': len(data),
+                    'sec_per_op': sec,
+                    'mb_per_sec': len(data) / sec / 1e6,
+                    'peak_alloc_bytes': peak,
+                    'alloc_blocks': blocks,
+                    }
+    return results
+
+
+def compare(results, baseline, threshold, memory_threshold):
+    # returns list of regression descriptions
+    regressions = []
+    for key, res in sorted(results.items()):
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if res['sec_per_op'] > base['sec_per_op'] * (1 + threshold):
+            regressions.append('{}: {:.1f}us/op vs {:.1f}us/op baseline'
+                .format(key, res['sec_per_op'] * 1e6,
+                        base['sec_per_op'] * 1e6))
+        limit = base['peak_alloc_bytes'] * (1 + memory_threshold)
+        if res['peak_alloc_bytes'] > limit:
+            regressions.append('{}: peak {} bytes vs {} bytes baseline'
+                .format(key, res['peak_alloc_bytes'],
+                        base['peak_alloc_bytes']))
+    return regressions
+
+
+def report(results, baseline=None, file=sys.stdout):
+    for key, res in sorted(results.items()):
+        line = ('{:34s} {:9d} B {:10.1f} us/op {:8.1f} MB/s'
+                ' {:10d} B peak {:7d} blocks'.format(key, res['bytes'],
+                    res['sec_per_op'] * 1e6, res['mb_per_sec'],
+                    res['peak_alloc_bytes'], res['alloc_blocks']))
+        if baseline and key in baseline:
+            line += ' {:+6.1f}%'.format(
+                (res['sec_per_op'] / baseline[key]['sec_per_op'] - 1) * 100)
+        print(line, file=file)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog='python -m bench',
+        description='Measure amfy.dumps/amfy.loads on synthetic payloads')
+    ap.add_argument('scenarios', nargs='*',
+        help='Scenarios to run (default all): {}'
+             .format(', '.join(sorted(SCENARIOS))))
+    ap.add_argument('--min-time', type=float, default=0.2,
+        help='Minimal duration of a timing round, seconds')
+    ap.add_argument('--output', '-o',
+        help='Save results as JSON to this file')
+    ap.add_argument('--baseline', '-b',
+        help='Compare against results saved earlier with --output')
+    ap.add_argument('--threshold', type=float, default=0.10,
+        help='Allowed slowdown relative to the baseline (default 0.10)')
+    ap.add_argument('--memory-threshold', type=float, default=0.10,
+        help='Allowed growth of peak allocation (default 0.10)')
+    args = ap.parse_args(argv)
+
+    results = measure(args.scenarios, args.min_time)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    report(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': sys.version,
+                'results': results,
+                }, f, indent=2, sort_keys=True)
+    if baseline is not None:
+        regressions = compare(results, baseline,
+                              args.threshold, args.memory_threshold)
+        for line in regressions:
+            print('REGRESSION', line, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
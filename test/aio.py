@@ -0,0 +1,64 @@
+import unittest
+import asyncio
+
+import amfy
+from amfy.aio import load_async, iter_async, dump_async
+
+
+class Pipe(object):
+    # minimal StreamWriter feeding a StreamReader
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def write(self, data):
+        self.reader.feed_data(data)
+
+    async def drain(self):
+        pass
+
+
+class Async(unittest.TestCase):
+
+    values = [{'a': [1, 2.5, 'x' * 300]}, 'spam', 'spam', None]
+
+    def _run(self, coro):
+        return asyncio.run(coro)
+
+    def test_iter(self):
+        async def main():
+            reader = asyncio.StreamReader()
+            writer = Pipe(reader)
+            for v in self.values:
+                await dump_async(v, writer)
+            reader.feed_eof()
+            return [v async for v in iter_async(reader)]
+        self.assertEqual(self._run(main()), self.values)
+
+    def test_load(self):
+        async def main():
+            reader = asyncio.StreamReader()
+            data = b''.join(amfy.dumps(v, proto=0) for v in self.values)
+            for i in range(len(data)):
+                reader.feed_data(data[i:i+1])
+            reader.feed_eof()
+            res = []
+            for i in self.values:
+                res.append(await load_async(reader, proto=0))
+            with self.assertRaises(EOFError):
+                await load_async(reader, proto=0)
+            return res
+        self.assertEqual(self._run(main()), self.values)
+
+    def test_truncated(self):
+        async def main():
+            reader = asyncio.StreamReader()
+            reader.feed_data(amfy.dumps(self.values)[:-1])
+            reader.feed_eof()
+            return [v async for v in iter_async(reader)]
+        with self.assertRaises(EOFError):
+            self._run(main())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -99,6 +99,11 @@ class Roundtrip(unittest.TestCase):
         else:
             self.fail('pyamf.EncodeError not raised when encoding datetime.time')
 
+    def test_ecma_array(self):
+        self.assertEqual(amfy.loads(b'\x08\x00\x00\x00\x01'
+            b'\x00\x01a\x02\x00\x01b\x00\x00\x09', proto=0),
+            {'a': 'b'})
+
     def test_object(self):
         self._run([
             ({'a': 'b'}, b'\x03\x00\x01a\x02\x00\x01b\x00\x00\x09')])
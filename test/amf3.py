@@ -10,8 +10,11 @@ Tests for AMF0 Implementation.
 """
 
 import unittest
+import array
 import datetime
+import struct
 import types
+import uuid
 from io import BytesIO
 
 import amfy
@@ -89,5 +92,338 @@ class Roundtrip(unittest.TestCase):
         self._run(vals)
 
 
+class Vectors(unittest.TestCase):
+
+    def _run(self, data):
+        for val in data:
+            res = amfy.loads(val[1])
+            self.assertEqual(res, val[0])
+            self.assertEqual(type(res), type(val[0]))
+            self.assertEqual(amfy.dumps(val[0]), val[1])
+
+    def test_numeric(self):
+        from array import array
+        self._run([
+            (array('i', [1, -2]),
+                b'\x0d\x05\x00\x00\x00\x00\x01\xff\xff\xff\xfe'),
+            (array('I', [1, 0xffffffff]),
+                b'\x0e\x05\x00\x00\x00\x00\x01\xff\xff\xff\xff'),
+            (array('d', [0.2]),
+                b'\x0f\x03\x00\x3f\xc9\x99\x99\x99\x99\x99\x9a'),
+            ])
+
+    def test_converted(self):
+        from array import array
+        self.assertEqual(amfy.loads(amfy.dumps(array('h', [1, -2]))),
+                         array('i', [1, -2]))
+        self.assertEqual(amfy.loads(amfy.dumps(array('f', [0.5]))),
+                         array('d', [0.5]))
+
+    def test_object(self):
+        vec = amfy.ObjectVector(['a', 'a'])
+        self._run([(vec, b'\x10\x05\x00\x03*\x06\x03a\x06\x02')])
+        res = amfy.loads(b'\x10\x03\x01\x07Foo\x01')
+        self.assertEqual(res.classname, 'Foo')
+        self.assertTrue(res.fixed)
+
+
+class Point(object):
+    __slots__ = ('x', 'y')
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def __eq__(self, other):
+        return (type(self) is type(other)
+            and self.x == other.x and self.y == other.y)
+
+
+class Record(object):
+
+    def __eq__(self, other):
+        return type(self) is type(other) and vars(self) == vars(other)
+
+
+class Aliases(unittest.TestCase):
+
+    def setUp(self):
+        self.dumper = amfy.Dumper()
+        self.dumper.add_alias(Point, 'Point')
+        self.dumper.add_alias(Record, 'Record')
+        self.loader = amfy.Loader()
+        self.loader.add_alias('Point', Point)
+        self.loader.add_alias('Record', Record)
+
+    def _run(self, value, data):
+        self.assertEqual(self.dumper.dump(value, proto=3), data)
+        self.assertEqual(self.loader.loads(data, proto=3), value)
+
+    def test_sealed(self):
+        self._run([Point(1, 2), Point(3, 4)],
+            b'\t\x05\x01'
+            b'\n\x23\x0bPoint\x03x\x03y\x04\x01\x04\x02'
+            b'\n\x01\x04\x03\x04\x04')
+
+    def test_dynamic(self):
+        rec = Record()
+        rec.a = 'spam'
+        self._run([rec, rec],
+            b'\t\x05\x01\n\x0b\rRecord\x03a\x06\tspam\x01\n\x02')
+
+    def test_unknown_alias(self):
+        data = self.dumper.dump(Point(1, 2), proto=3)
+        self.assertEqual(amfy.loads(data), {'x': 1, 'y': 2})
+
+    def test_object_references(self):
+        x = {'a': 1}
+        res = amfy.loads(amfy.dumps([x, x]))
+        self.assertIs(res[0], res[1])
+
+
+class Schemas(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = amfy.Schema.from_class(Point, 'Point',
+                                             {'x': float, 'y': int})
+        self.dumper = amfy.Dumper()
+        self.dumper.add_schema(self.schema)
+        self.loader = amfy.Loader()
+        self.loader.add_schema(self.schema)
+
+    def test_same_as_alias(self):
+        dumper = amfy.Dumper()
+        dumper.add_alias(Point, 'Point')
+        loader = amfy.Loader()
+        loader.add_alias('Point', Point)
+        value = [Point(0.5, 1), Point('spam', 1 << 40), Point(None, -1.5)]
+        data = self.dumper.dump(value, proto=3)
+        self.assertEqual(data, dumper.dump(value, proto=3))
+        self.assertEqual(self.loader.loads(data, proto=3), value)
+        self.assertEqual(loader.loads(data, proto=3), value)
+
+    def test_strings_registered(self):
+        value = [Point(0.5, 1), 'x', 'Point']
+        data = self.dumper.dump(value, proto=3)
+        self.assertEqual(data[-4:], b'\x06\x02\x06\x00')
+        self.assertEqual(self.loader.loads(data, proto=3), value)
+
+    def test_size(self):
+        value = [Point(0.5, 1), Point(2.5, 1 << 20), 'Point', 'x']
+        self.assertEqual(self.dumper.size(value, proto=3),
+                         len(self.dumper.dump(value, proto=3)))
+
+    def test_dict_schema(self):
+        loader = amfy.Loader()
+        loader.add_schema(amfy.Schema(None, 'Point', [('x', float), 'y']))
+        data = self.dumper.dump(Point(0.5, 'a'), proto=3)
+        self.assertEqual(loader.loads(data, proto=3), {'x': 0.5, 'y': 'a'})
+
+    def test_other_shape(self):
+        loader = amfy.Loader()
+        loader.add_schema(amfy.Schema(None, 'Point', ['y', 'x']))
+        data = self.dumper.dump(Point(0.5, 1), proto=3)
+        self.assertEqual(loader.loads(data, proto=3), {'x': 0.5, 'y': 1})
+
+    def test_keyword_members(self):
+        class Node(object):
+            pass
+        schema = amfy.Schema(Node, 'Node', [('class', str), ('from', int),
+                                            'def', 'x'])
+        dumper = amfy.Dumper()
+        dumper.add_schema(schema)
+        loader = amfy.Loader()
+        loader.add_schema(schema)
+        node = Node()
+        for name, v in (('class', 'a'), ('from', 1), ('def', None),
+                        ('x', 2.5)):
+            setattr(node, name, v)
+        res = loader.loads(dumper.dump(node, proto=3), proto=3)
+        self.assertIs(type(res), Node)
+        self.assertEqual(vars(res), vars(node))
+
+
+class Externals(unittest.TestCase):
+
+    ids = [uuid.UUID(int=i << 100 | 0xABC) for i in (1, 2, 3)]
+
+    def _message(self, classname, groups):
+        # small message of flag bytes and the values of set flags, values
+        # are encoded alone so they must not repeat
+        data = b'\n\x07' + bytes(((len(classname) << 1) | 1,))
+        data += classname.encode('ascii')
+        for flags, values in groups:
+            data += bytes(flags)
+            for v in values:
+                data += amfy.dumps(v)
+        return data
+
+    def test_array_collection(self):
+        items = [1, 'x', {'a': 'x'}]
+        coll = amfy.ArrayCollection(items)
+        data = amfy.dumps([coll, coll, items])
+        self.assertEqual(data[3:39], b'\n\x07Cflex.messaging.io.ArrayCollection')
+        res = amfy.loads(data)
+        self.assertEqual(res, [items] * 3)
+        self.assertIs(type(res[0]), list)
+        self.assertIs(res[0], res[1])
+        self.assertIsNot(res[0], res[2])
+        self.assertEqual(amfy.encoded_size([coll, coll]),
+                         len(amfy.dumps([coll, coll])))
+
+    def test_object_proxy(self):
+        proxy = amfy.ObjectProxy({'a': 1, 'b': ['x', 'y']})
+        data = amfy.dumps([proxy, amfy.ObjectProxy()])
+        self.assertEqual(amfy.loads(data), [{'a': 1, 'b': ['x', 'y']}, {}])
+
+    def test_acknowledge_message(self):
+        data = self._message('DSK', [
+            ((0x80|0x01|0x04|0x20, 0x01|0x02),
+             [{'result': 1}, 'dest', 1.5e12, self.ids[0].bytes,
+              self.ids[1].bytes]),
+            ((0x02,), [self.ids[2].bytes]),
+            ((0x01,), ['unknown flag']),
+            ])
+        value = {
+            'body': {'result': 1},
+            'destination': 'dest',
+            'timestamp': 1.5e12,
+            'clientId': str(self.ids[0]).upper(),
+            'messageId': str(self.ids[1]).upper(),
+            'correlationId': str(self.ids[2]).upper(),
+            }
+        self.assertEqual(amfy.loads(data), value)
+        loader = amfy.Loader()
+        loader.add_alias('flex.messaging.messages.AcknowledgeMessage', Record)
+        res = loader.loads(data, proto=3)
+        self.assertIs(type(res), Record)
+        self.assertEqual(vars(res), value)
+        self.assertEqual(amfy.Loader().skip(data + b'\x01', proto=3),
+                         len(data))
+        self.assertEqual(amfy.extract(data, ['body', 'result']), 1)
+
+    def test_command_message(self):
+        data = self._message('DSC', [
+            ((0x10,), ['id']), ((0x01,), ['corr']), ((0x01,), [5])])
+        self.assertEqual(amfy.loads(data), {'messageId': 'id',
+                                            'correlationId': 'corr',
+                                            'operation': 5})
+        data = self._message('DSA', [((0x01,), ['body']), ((0x00,), [])])
+        self.assertEqual(amfy.loads(data), {'body': 'body'})
+
+    def test_skip(self):
+        coll = amfy.ArrayCollection([1, 'x'])
+        data = amfy.dumps({'a': coll, 'b': coll, 'c': 'x'})
+        self.assertEqual(amfy.Loader().skip(data, proto=3), len(data))
+        self.assertEqual(amfy.extract(data, ['c']), 'x')
+        self.assertEqual(amfy.extract(data, ['b', 1]), 'x')
+        self.assertEqual(amfy.transcode_json(data),
+                         '{"a": [1, "x"], "b": [1, "x"], "c": "x"}')
+
+    def test_registry(self):
+        def write(data, out, context):
+            out += struct.pack('!dd', data.x, data.y)
+        def read(buf, pos, context):
+            res = Point(*struct.unpack_from('!dd', buf, pos))
+            context.add_object(res)
+            return res, pos + 16
+        def skip(buf, pos, context):
+            return pos + 16
+        dumper = amfy.Dumper()
+        dumper.add_external(Point, 'com.example.Point', write)
+        loader = amfy.Loader()
+        loader.add_external('com.example.Point', read, skip)
+        value = [Point(0.5, 1.5), Point(2.5, 3.5), 'x']
+        data = dumper.dump(value, proto=3)
+        self.assertEqual(loader.loads(data, proto=3), value)
+        self.assertEqual(loader.extract(data, [2], proto=3), 'x')
+        self.assertRaises(NotImplementedError, amfy.loads, data)
+
+
+class Columnar(unittest.TestCase):
+
+    def setUp(self):
+        self.dumper = amfy.Dumper()
+        self.dumper.add_alias(Point, 'Point')
+        self.rows = [Point(i * 0.5, 'p{}'.format(i % 3)) for i in range(10)]
+        self.loader = amfy.Loader(columns=True)
+
+    def test_columns(self):
+        data = self.dumper.dump([self.rows, [1, 2]], proto=3)
+        res, other = self.loader.loads(data, proto=3)
+        self.assertIs(type(res), amfy.Columns)
+        self.assertEqual(res.classname, 'Point')
+        self.assertEqual(list(res), ['x', 'y'])
+        self.assertEqual(res['x'], array.array('d', [p.x for p in self.rows]))
+        self.assertEqual(res['y'], [p.y for p in self.rows])
+        self.assertEqual(other, [1, 2])
+        ints = amfy.Columns(a=[1, 2, 3], b=['x', None, 'x'])
+        res = self.loader.loads(amfy.dumps([ints]), proto=3)[0]
+        self.assertEqual(res['a'], array.array('q', [1, 2, 3]))
+        self.assertEqual(res['b'], ints['b'])
+
+    def test_row_references(self):
+        self.loader.add_alias('Point', Point)
+        value = [self.rows, self.rows[3], self.rows[3], self.rows]
+        data = self.dumper.dump(value, proto=3)
+        res = self.loader.loads(data, proto=3)
+        self.assertIs(type(res[0]), amfy.Columns)
+        self.assertEqual(res[1], self.rows[3])
+        self.assertIs(res[1], res[2])
+        self.assertIs(res[3], res[0])
+
+    def test_long_trait_reference(self):
+        plain = amfy.Loader()
+        for count in (31, 32, 33, 64):
+            dumper = amfy.Dumper()
+            dumper.add_alias(Point, 'Point')
+            others = []
+            for i in range(count):
+                cls = type('T{}'.format(i), (Point,), {'__slots__': ()})
+                dumper.add_alias(cls, cls.__name__)
+                others.append(cls(i, 'y'))
+            data = dumper.dump([others, self.rows], proto=3)
+            res = self.loader.loads(data, proto=3)[1]
+            self.assertIs(type(res), amfy.Columns)
+            self.assertEqual(res['x'],
+                             array.array('d', [p.x for p in self.rows]))
+            self.assertEqual(res['y'], [p.y for p in self.rows])
+            self.assertEqual(len(plain.loads(data, proto=3)[1]),
+                             len(self.rows))
+
+    def test_not_columns(self):
+        loader = amfy.Loader()
+        for value in ([self.rows[0], {'x': 1}], [self.rows[0], 1],
+                      [{'x': 1}, {'x': 2}], self.rows + [self.rows[0]],
+                      [self.rows[1], self.rows[0], 'x', self.rows[1]]):
+            data = self.dumper.dump(value, proto=3)
+            res = self.loader.loads(data, proto=3)
+            self.assertEqual(res, loader.loads(data, proto=3))
+        res = self.loader.loads(data, proto=3)
+        self.assertIs(res[0], res[3])
+
+    def test_write(self):
+        columns = amfy.Columns(x=array.array('d', [0.5, 1.5]), y=['a', 'b'])
+        columns.classname = 'Point'
+        loader = amfy.Loader()
+        loader.add_alias('Point', Point)
+        data = amfy.dumps(columns)
+        self.assertEqual(loader.loads(data, proto=3),
+                         [Point(0.5, 'a'), Point(1.5, 'b')])
+        self.assertEqual(data, self.dumper.dump(
+            [Point(0.5, 'a'), Point(1.5, 'b')], proto=3))
+        self.assertEqual(amfy.encoded_size(columns), len(data))
+        other = amfy.Columns(x=[2.5], y=['c'])
+        other.classname = 'Point'
+        data = amfy.dumps([columns, other])
+        self.assertEqual(data, self.dumper.dump(
+            [[Point(0.5, 'a'), Point(1.5, 'b')], [Point(2.5, 'c')]],
+            proto=3))
+        self.assertEqual(amfy.encoded_size([columns, other]), len(data))
+        self.assertEqual(amfy.loads(amfy.dumps(amfy.Columns())), [])
+        self.assertRaises(ValueError, amfy.dumps,
+                          amfy.Columns(x=[1], y=[1, 2]))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,590 @@
+import unittest
+import os
+import mmap
+import array
+import struct
+import datetime
+import tempfile
+from io import BytesIO
+
+import amfy
+from amfy.core import Loader, Dumper
+
+
+class Buffers(unittest.TestCase):
+
+    value = {'a': [1, 2.5, 'x', [True]], 'b': None}
+
+    def test_buffer_types(self):
+        data = amfy.dumps(self.value)
+        self.assertEqual(amfy.loads(bytearray(data)), self.value)
+        self.assertEqual(amfy.loads(memoryview(data)), self.value)
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            mm = mmap.mmap(f.fileno(), 0)
+            try:
+                self.assertEqual(amfy.loads(mm), self.value)
+            finally:
+                mm.close()
+
+    def test_stream_position(self):
+        for proto in (0, 3):
+            data = amfy.dumps(self.value, proto=proto)
+            stream = BytesIO(b'junk' + data + data)
+            stream.seek(4)
+            self.assertEqual(Loader().load(stream, proto), self.value)
+            self.assertEqual(stream.tell(), 4 + len(data))
+            self.assertEqual(Loader().load(stream, proto), self.value)
+            self.assertEqual(stream.tell(), 4 + 2*len(data))
+
+    def test_unseekable_stream(self):
+        for proto in (0, 3):
+            data = bytes(amfy.dumps(self.value, proto=proto))
+            for buffering in (0, 16):
+                rfd, wfd = os.pipe()
+                with open(rfd, 'rb', buffering) as r:
+                    with open(wfd, 'wb') as w:
+                        w.write(data + data + b'tail')
+                    self.assertEqual(amfy.load(r, proto=proto), self.value)
+                    self.assertEqual(amfy.load(r, proto=proto), self.value)
+                    self.assertEqual(r.read(), b'tail')
+
+    def test_read_only_stream(self):
+        class Stream(object):
+            def __init__(self, data):
+                self.read = BytesIO(data).read
+        for proto in (0, 3):
+            data = bytes(amfy.dumps(self.value, proto=proto))
+            stream = Stream(data + data + b'tail')
+            self.assertEqual(amfy.load(stream, proto=proto), self.value)
+            self.assertEqual(amfy.load(stream, proto=proto), self.value)
+            self.assertEqual(stream.read(), b'tail')
+
+    def test_file_position(self):
+        for proto in (0, 3):
+            data = bytes(amfy.dumps(self.value, proto=proto))
+            with tempfile.TemporaryFile() as f:
+                f.write(data + data + b'\x00' * 200000)
+                f.seek(0)
+                self.assertEqual(amfy.load(f, proto=proto), self.value)
+                self.assertEqual(f.tell(), len(data))
+                self.assertEqual(amfy.load(f, proto=proto), self.value)
+                self.assertEqual(f.tell(), 2*len(data))
+
+    def test_truncated(self):
+        for proto in (0, 3):
+            data = amfy.dumps(self.value, proto=proto)
+            for i in range(len(data)):
+                with self.assertRaises(EOFError):
+                    amfy.loads(data[:i], proto=proto)
+
+    def test_date0(self):
+        when = datetime.datetime(2005, 3, 18, 1, 58, 31)
+        data = bytes(amfy.dumps([when], proto=0))
+        for i in range(len(data)):
+            with self.assertRaises(EOFError):
+                amfy.loads(data[:i], proto=0)
+        parser = amfy.IncrementalLoader(0)
+        self.assertEqual(parser.feed(data[:-1]), [])
+        self.assertEqual(parser.feed(data[-1:]), [[when]])
+        self.assertRaises(ValueError, amfy.loads, data[:-1] + b'\x01', 0)
+
+    def test_bytearray_views(self):
+        payload = bytes(range(256)) * 64
+        data = bytes(amfy.dumps({'a': payload, 'b': payload}))
+        res = Loader(views=True).loads(data, proto=3)
+        self.assertIsInstance(res['a'], memoryview)
+        self.assertIs(res['a'], res['b'])
+        self.assertEqual(res['a'], payload)
+        self.assertEqual(res['a'].obj, data)
+        self.assertRaises(ValueError, amfy.IncrementalLoader, 3,
+                          Loader(views=True))
+
+    def test_write_buffers(self):
+        import array
+        payload = b'spam' * 100
+        expected = amfy.dumps(payload)
+        self.assertEqual(amfy.dumps(bytearray(payload)), expected)
+        self.assertEqual(amfy.dumps(memoryview(payload)), expected)
+        self.assertEqual(amfy.dumps(memoryview(payload * 2)[::2]),
+                         amfy.dumps((payload * 2)[::2]))
+        doubles = memoryview(array.array('d', [0.5, 1.5]))
+        self.assertEqual(amfy.loads(amfy.dumps(doubles)), doubles.tobytes())
+        buf = bytearray(payload)
+        data = amfy.dumps([buf, buf])
+        self.assertEqual(amfy.loads(data), [payload, payload])
+        self.assertLess(len(data), 2 * len(payload))
+
+
+class Output(unittest.TestCase):
+
+    def test_single_write(self):
+        class Stream(BytesIO):
+            writes = 0
+            def write(self, data):
+                self.writes += 1
+                return super().write(data)
+        value = {'a': [1, 2.5, 'x', [True]], 'b': None}
+        for proto in (0, 3):
+            stream = Stream()
+            amfy.dump(value, stream, proto=proto)
+            self.assertEqual(stream.writes, 1)
+            self.assertEqual(stream.getvalue(), amfy.dumps(value, proto=proto))
+
+    def test_dumps_buffer(self):
+        self.assertIsInstance(amfy.dumps([1, 2]), bytearray)
+
+    def test_prefix(self):
+        value = {'a': [1, 2.5, 'x']}
+        for proto in (0, 3):
+            data = amfy.dumps(value, proto=proto)
+            self.assertEqual(
+                amfy.dumps(value, proto=proto, prefix=struct.Struct('!L')),
+                struct.pack('!L', len(data)) + data)
+            stream = BytesIO()
+            amfy.dump(value, stream, proto=proto, prefix=struct.Struct('<H'))
+            self.assertEqual(stream.getvalue(),
+                             struct.pack('<H', len(data)) + data)
+
+    def test_values_not_cached(self):
+        from amfy.core import _encode_string0, _encode_string3
+        values = ['value-{}'.format(i) for i in range(2000)]
+        for proto, encode in ((0, _encode_string0), (3, _encode_string3)):
+            amfy.dumps({'key': 'x'}, proto=proto)
+            misses = encode.cache_info().misses
+            data = amfy.dumps([{'key': v} for v in values], proto=proto)
+            self.assertEqual(encode.cache_info().misses, misses)
+            self.assertEqual(amfy.loads(data, proto=proto),
+                             [{'key': v} for v in values])
+
+
+class Size(unittest.TestCase):
+
+    def test_same_as_dumps(self):
+        shared = {'s': 'x' * 100, 'when': datetime.datetime(2015, 1, 1)}
+        value = [shared, [shared, 'x' * 100, 'é' * 70, 'ab', 'ab'],
+                 {'n': [0, 127, 128, 1 << 20, 1 << 30, -1, 0.5, 2 ** 40],
+                  'e': [], 'u': amfy.undefined}, None, True]
+        for proto in (0, 3):
+            if proto == 3:
+                value += [b'abc', bytearray(b'xyz'), array.array('i', [1, 2]),
+                          array.array('d', [0.5]),
+                          amfy.ObjectVector([shared, 1])]
+            for refs in ('identity', 'tree', 'value'):
+                self.assertEqual(amfy.encoded_size(value, proto, refs=refs),
+                                 len(amfy.dumps(value, proto, refs=refs)))
+            self.assertEqual(Dumper(max_depth=10).size(value, proto),
+                             len(amfy.dumps(value, proto)))
+
+    def test_overridden(self):
+        class Custom(Dumper):
+            def _write_str3(self, data, out, context):
+                out.append(0x06)
+                self._write_string3(data.upper(), out, context)
+            def _write_float3(self, data, out, context):
+                self._write_int3(int(data), out, context)
+        value = {'a': ['x', 'X', 1.5, 1 << 20], 'é': 'é'}
+        self.assertEqual(Custom().size(value, 3),
+                         len(Custom().dump(value, proto=3)))
+
+    def test_errors(self):
+        self.assertRaises(ValueError, amfy.encoded_size, 1, proto=1)
+        self.assertRaises(ValueError, Dumper(stats=True).size, 1, 3)
+        self.assertRaises(NotImplementedError, amfy.encoded_size, object())
+
+
+class Incremental(unittest.TestCase):
+
+    values = [{'a': [1, 2.5, 'x' * 300, [True]], 'b': None}, 'x' * 300, 7]
+
+    def test_bytewise(self):
+        for proto in (0, 3):
+            data = b''.join(amfy.dumps(v, proto=proto) for v in self.values)
+            parser = amfy.IncrementalLoader(proto)
+            res = []
+            for i in range(len(data)):
+                res.extend(parser.feed(data[i:i+1]))
+            self.assertEqual(res, self.values)
+            self.assertEqual(parser.pending(), 0)
+
+    def test_chunks(self):
+        data = b''.join(amfy.dumps(v) for v in self.values)
+        parser = amfy.IncrementalLoader()
+        self.assertEqual(parser.feed(data[:5]), [])
+        self.assertEqual(parser.feed(data[5:-1]), self.values[:2])
+        self.assertEqual(parser.pending(), 1)
+        self.assertEqual(parser.feed(data[-1:]), self.values[2:])
+
+    def test_shared_references(self):
+        data = amfy.dumps(['spam', 'spam'])
+        parser = amfy.IncrementalLoader()
+        self.assertEqual(parser.feed(data[:-1]), [])
+        self.assertEqual(parser.context.strings, [])
+        self.assertEqual(parser.feed(data[-1:]), [['spam', 'spam']])
+        self.assertEqual(parser.context.strings, ['spam'])
+
+    def test_decoded_once(self):
+        # a large value arriving in small pieces is scanned as it comes
+        # and decoded once it's complete
+        calls = []
+        class Counting(Loader):
+            def _decode(self, buf, pos, proto, context):
+                calls.append(pos)
+                return super()._decode(buf, pos, proto, context)
+        value = [{'id': i, 'name': 'x' * (i % 7), 'when': None}
+                 for i in range(20000)]
+        for proto in (0, 3):
+            del calls[:]
+            data = amfy.dumps(value, proto=proto)
+            parser = amfy.IncrementalLoader(proto, Counting())
+            res = []
+            for i in range(0, len(data), 1000):
+                res += parser.feed(data[i:i+1000])
+            self.assertEqual(res, [value])
+            self.assertEqual(len(calls), 1)
+
+    def test_unscanned(self):
+        # readers of Loader subclasses are retried as data arrives
+        class Doubled(Loader):
+            markers3 = dict(Loader.markers3)
+            markers3[0x11] = '_read_doubled3'
+            def _read_doubled3(self, buf, pos, context):
+                val, pos = self._read_item3(buf, pos, context)
+                return val * 2, pos
+        data = b'\x11\x09\x05\x01\x06\x07abc\x04\x05\x06\x00'
+        parser = amfy.IncrementalLoader(3, Doubled())
+        res = []
+        for i in range(len(data)):
+            res += parser.feed(data[i:i+1])
+        self.assertEqual(res, [['abc', 5, 'abc', 5], 'abc'])
+
+
+class Extract(unittest.TestCase):
+
+    shared = {'k': 'v', 'when': datetime.datetime(2005, 3, 18, 1, 58, 31)}
+    doc = {
+        'head': {'id': 7, 'name': 'spam'},
+        'body': {'user': {'id': 42, 'name': 'spam', 'tags': ['a', shared]},
+                 'other': shared,
+                 'n': [1.5, 2, 'name']},
+        'tail': [shared, 'k', 'name'],
+        }
+
+    def _paths(self, value, prefix=()):
+        yield prefix
+        if isinstance(value, dict):
+            items = value.items()
+        elif isinstance(value, list):
+            items = enumerate(value)
+        else:
+            return
+        for k, v in items:
+            yield from self._paths(v, prefix + (k,))
+
+    def test_all_paths(self):
+        for proto in (0, 3):
+            data = amfy.dumps(self.doc, proto=proto)
+            full = amfy.loads(data, proto=proto)
+            for path in self._paths(full):
+                expected = full
+                for key in path:
+                    expected = expected[key]
+                self.assertEqual(amfy.extract(data, path, proto=proto),
+                                 expected)
+
+    def test_missing(self):
+        data = amfy.dumps(self.doc)
+        self.assertRaises(KeyError, amfy.extract, data, ['body', 'nope'])
+        self.assertRaises(KeyError, amfy.extract, data, ['tail', 3])
+
+    def test_skip(self):
+        for proto in (0, 3):
+            data = amfy.dumps(self.doc, proto=proto)
+            self.assertEqual(Loader().skip(data + b'junk', proto), len(data))
+
+
+class NumberRuns(unittest.TestCase):
+
+    values = [
+        [i * 1.25 for i in range(200)],
+        list(range(300)),
+        [1, 2.5, 3, 4.5, -1, 2**40, 200000] * 20,
+        [1, 'a', 2.5, 3.5, 4, None, 0.5],
+        [True, 1, 1.0, False],
+        ]
+
+    def test_same_as_generic(self):
+        class GenericDumper(Dumper):
+            def __init__(self):
+                super().__init__()
+                self._bulk0 = self._bulk3 = False
+        class GenericLoader(Loader):
+            def __init__(self):
+                super().__init__()
+                self._bulk0 = self._bulk3 = False
+        for proto in (0, 3):
+            for value in self.values:
+                data = amfy.dumps(value, proto=proto)
+                self.assertEqual(data, amfy.dumps(value, proto=proto,
+                                                  Dumper=GenericDumper))
+                res = amfy.loads(data, proto=proto)
+                expected = amfy.loads(data, proto=proto, Loader=GenericLoader)
+                self.assertEqual(res, expected)
+                self.assertEqual(list(map(type, res)),
+                                 list(map(type, expected)))
+
+
+class Sessions(unittest.TestCase):
+
+    def test_references_between_messages(self):
+        dumper, loader = Dumper(), Loader()
+        wsession, rsession = amfy.WriteSession(), amfy.ReadSession()
+        value = {'spam': 'eggs', 'list': [1, 2]}
+        first = dumper.dump(value, proto=3, context=wsession)
+        second = dumper.dump(value, proto=3, context=wsession)
+        self.assertLess(len(second), len(first))
+        self.assertEqual(loader.loads(first, 3, rsession), value)
+        self.assertEqual(loader.loads(second, 3, rsession), value)
+        # objects of the previous message only
+        self.assertEqual(len(rsession.objects), 2)
+
+    def test_limits(self):
+        dumper, loader = Dumper(), Loader()
+        wsession = amfy.WriteSession(max_strings=2)
+        rsession = amfy.ReadSession(max_strings=2)
+        for i in range(5):
+            value = ['a', 'b', 'c', 'a', 'c']
+            data = dumper.dump(value, proto=3, context=wsession)
+            self.assertEqual(loader.loads(data, 3, rsession), value)
+        self.assertEqual(rsession.strings, ['a', 'b'])
+        self.assertEqual(wsession.nstrings, 2)
+
+    def test_reset(self):
+        dumper, loader = Dumper(), Loader()
+        wsession, rsession = amfy.WriteSession(), amfy.ReadSession()
+        first = dumper.dump('spam', proto=3, context=wsession)
+        loader.loads(first, 3, rsession)
+        wsession.reset()
+        rsession.reset()
+        self.assertEqual((wsession.epoch, rsession.epoch), (1, 1))
+        self.assertEqual(dumper.dump('spam', proto=3, context=wsession), first)
+        self.assertEqual(loader.loads(first, 3, rsession), 'spam')
+
+
+class RefModes(unittest.TestCase):
+
+    def test_tree(self):
+        x = [1, 2]
+        data = amfy.dumps([x, x], refs='tree')
+        self.assertEqual(data, amfy.dumps([[1, 2], [1, 2]]))
+        self.assertEqual(amfy.loads(data), [x, x])
+        data = amfy.dumps([{'a': x}, {'a': x}], proto=0, refs='tree')
+        self.assertEqual(amfy.loads(data, proto=0), [{'a': x}, {'a': x}])
+
+    def test_value(self):
+        value = [bytes(bytearray(b'spam')) for i in range(3)]
+        value += [datetime.datetime(2005, 3, 18) for i in range(3)]
+        data = amfy.dumps(value, refs='value')
+        self.assertLess(len(data), len(amfy.dumps(value)))
+        self.assertEqual(amfy.loads(data), value)
+
+    def test_identity_pins_temporaries(self):
+        class Fresh(object):
+            @property
+            def items(self):
+                return [len(self.__dict__)]
+        class FreshDumper(Dumper):
+            def __init__(self):
+                super().__init__()
+                self.add_alias(Fresh, 'Fresh', ['items'])
+        value = [Fresh() for i in range(10)]
+        res = amfy.loads(amfy.dumps(value, Dumper=FreshDumper))
+        for obj in res:
+            self.assertEqual(obj, {'items': [0]})
+
+
+class Dispatch(unittest.TestCase):
+
+    def test_subclass_fallback(self):
+        from collections import OrderedDict
+        class Int(int):
+            pass
+        data = OrderedDict([('a', Int(5))])
+        self.assertEqual(amfy.dumps(data), amfy.dumps({'a': 5}))
+        self.assertEqual(amfy.dumps(data, proto=0),
+                         amfy.dumps({'a': 5}, proto=0))
+
+    def test_extend_tables(self):
+        class TupleDumper(Dumper):
+            types3 = dict(Dumper.types3)
+            types3[tuple] = '_write_list3'
+        class NoDates(Loader):
+            markers3 = dict(Loader.markers3)
+            markers3[0x08] = '_read_unknown3'
+        self.assertEqual(amfy.dumps((1, 2), Dumper=TupleDumper),
+                         amfy.dumps([1, 2]))
+        self.assertRaises(NotImplementedError, amfy.dumps, (1, 2))
+        data = amfy.dumps(datetime.datetime(2005, 3, 18, 1, 58, 31))
+        self.assertRaises(NotImplementedError, amfy.loads, data,
+                          Loader=NoDates)
+
+    def test_tables_on_first_use(self):
+        loader, dumper = Loader(), Dumper()
+        self.assertNotIn('_markers3', vars(loader))
+        self.assertNotIn('_types3', vars(dumper))
+        data = dumper.dump(amfy.ArrayCollection([1]), proto=3)
+        self.assertEqual(loader.loads(data, 3), amfy.ArrayCollection([1]))
+        self.assertIn('_markers3', vars(loader))
+        self.assertIn('_types3', vars(dumper))
+        self.assertEqual(data, amfy.dumps(amfy.ArrayCollection([1])))
+
+
+class Stats(unittest.TestCase):
+
+    value = {'a': ['x', 'x', 'y', 1, 2.5, [1, 2]], 'b': {'c': 'x'}}
+
+    def test_symmetric(self):
+        for proto in (0, 3):
+            dumper = Dumper(stats=True)
+            data = dumper.dump(self.value, proto=proto)
+            loader = Loader(stats=True)
+            self.assertEqual(loader.loads(data, proto=proto), self.value)
+            for stats in (dumper.stats, loader.stats):
+                self.assertEqual(sum(stats.bytes.values()), len(data))
+                self.assertEqual(stats.max_depth, 4)
+                self.assertEqual(stats.calls, 1)
+            self.assertEqual(dumper.stats.counts, loader.stats.counts)
+            self.assertEqual(dumper.stats.bytes, loader.stats.bytes)
+            self.assertEqual(dumper.stats.hits, loader.stats.hits)
+            self.assertEqual(dumper.stats.misses, loader.stats.misses)
+
+    def test_counts(self):
+        loader = Loader(stats=True)
+        loader.loads(amfy.dumps(self.value), proto=3)
+        stats = loader.stats
+        self.assertEqual(stats.counts[3, 0x06], 4)
+        self.assertEqual(stats.counts[3, 0x04], 3)
+        self.assertEqual(stats.counts[3, 0x0A], 2)
+        # 'x' twice by reference, 'a', 'b', 'c', 'x', 'y' inline
+        self.assertEqual(stats.hits['strings'], 2)
+        self.assertEqual(stats.misses['strings'], 5)
+        self.assertEqual(stats.hit_ratio('strings'), 2 / 7)
+        loader.loads(amfy.dumps(1), proto=3)
+        self.assertEqual(stats.calls, 2)
+        stats.reset()
+        self.assertEqual(stats.counts, {})
+        self.assertEqual(stats.hit_ratio('traits'), 0.0)
+
+    def test_disabled(self):
+        self.assertIsNone(Loader().stats)
+        self.assertIsNone(Dumper().stats)
+        self.assertTrue(Dumper()._bulk3)
+        self.assertFalse(Dumper(stats=True)._bulk3)
+
+
+class Depth(unittest.TestCase):
+
+    def _nested(self, depth):
+        # lists and objects alternate
+        value = leaf = []
+        for i in range(depth - 1):
+            item = {'a': leaf} if i % 2 else [leaf]
+            leaf = item
+        return leaf
+
+    def test_deep(self):
+        for proto in (0, 3):
+            value = self._nested(20000)
+            dumper = Dumper(max_depth=100000)
+            data = dumper.dump(value, proto=proto)
+            res = Loader(max_depth=100000).loads(data, proto)
+            # comparison itself would recurse
+            self.assertEqual(dumper.dump(res, proto=proto), data)
+
+    def test_same_as_recursive(self):
+        shared = {'x': [1, 2.5, 'x'], 'when': datetime.datetime(2015, 1, 1)}
+        value = [shared, [shared, {'y': shared, 'z': [[[]], 'x']}],
+                 'x', 2.5]
+        for proto in (0, 3):
+            if proto == 3:
+                value.append(amfy.ObjectVector([shared, shared]))
+            data = Dumper().dump(value, proto=proto)
+            self.assertEqual(Dumper(max_depth=10).dump(value, proto=proto),
+                             data)
+            self.assertEqual(Loader(max_depth=10).loads(data, proto),
+                             Loader().loads(data, proto))
+
+    def test_limit(self):
+        for proto in (0, 3):
+            value = self._nested(6)
+            data = amfy.dumps(value, proto=proto)
+            self.assertEqual(Loader(max_depth=6).loads(data, proto), value)
+            self.assertRaises(ValueError, Loader(max_depth=5).loads,
+                              data, proto)
+            self.assertEqual(Dumper(max_depth=6).dump(value, proto=proto),
+                             data)
+            self.assertRaises(ValueError, Dumper(max_depth=5).dump,
+                              value, proto=proto)
+        self.assertRaises(ValueError, Loader, stats=True, max_depth=5)
+        self.assertRaises(ValueError, Dumper, stats=True, max_depth=5)
+
+
+class Fragments(unittest.TestCase):
+
+    config = {'name': 'spam', 'tags': ['spam', 'eggs'], 'when': None}
+
+    def test_verbatim(self):
+        for proto in (0, 3):
+            frag = amfy.fragment(self.config, proto=proto)
+            self.assertEqual(frag.data, amfy.dumps(self.config, proto=proto))
+            data = amfy.dumps([frag, 1], proto=proto)
+            self.assertEqual(data, amfy.dumps([self.config, 1], proto=proto))
+            self.assertEqual(amfy.encoded_size([frag, 1], proto=proto),
+                             len(data))
+            self.assertRaises(ValueError, amfy.dumps, frag, proto=3 - proto)
+
+    def test_references(self):
+        # references in the fragment are shifted past what comes before
+        # it and later data may reference what's in the fragment
+        for proto in (0, 3):
+            frag = amfy.fragment(self.config, proto=proto)
+            prefix = {'eggs': ['spam'], 'tags': {}}
+            value = [prefix, frag, 'spam', frag, self.config['tags']]
+            data = amfy.dumps(value, proto=proto)
+            res = amfy.loads(data, proto=proto)
+            self.assertEqual(res, [prefix, self.config, 'spam', self.config,
+                                   self.config['tags']])
+            self.assertIs(res[4], res[3]['tags'])
+            self.assertEqual(amfy.encoded_size(value, proto=proto),
+                             len(data))
+
+    def test_ref_modes(self):
+        frag = amfy.fragment(self.config)
+        for refs in ('tree', 'value'):
+            value = [[self.config['tags']], frag, [b'x', b'x']]
+            data = amfy.dumps(value, refs=refs)
+            self.assertEqual(amfy.loads(data), [[self.config['tags']],
+                                                self.config, [b'x', b'x']])
+
+    def test_nested(self):
+        inner = amfy.fragment(self.config)
+        outer = amfy.fragment({'a': inner, 'b': self.config['tags']})
+        res = amfy.loads(amfy.dumps(['eggs', outer]))
+        self.assertEqual(res, ['eggs', {'a': self.config,
+                                        'b': self.config['tags']}])
+
+    def test_sessions(self):
+        dumper, loader = Dumper(), Loader()
+        frag = dumper.fragment(self.config)
+        wsession = amfy.WriteSession(max_strings=4)
+        rsession = amfy.ReadSession(max_strings=4)
+        for word in ('a', 'b', 'c'):
+            value = [word, frag, 'eggs']
+            data = dumper.dump(value, proto=3, context=wsession)
+            self.assertEqual(loader.loads(data, 3, rsession),
+                             [word, self.config, 'eggs'])
+
+
+if __name__ == '__main__':
+    unittest.main()
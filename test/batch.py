@@ -0,0 +1,69 @@
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import amfy
+from amfy.core import Loader
+
+
+class Counting(Loader):
+    # module level, so worker processes can import it
+    calls = 0
+
+    def loads(self, value, proto=0, context=None):
+        Counting.calls += 1
+        return super().loads(value, proto, context)
+
+
+class Batch(unittest.TestCase):
+
+    values = [{'id': i, 'name': 'item{}'.format(i), 'tags': ['a', 'b']}
+              for i in range(50)]
+
+    def test_in_process(self):
+        Counting.calls = 0
+        data = list(amfy.dumps_many(self.values))
+        self.assertEqual(data, [amfy.dumps(v) for v in self.values])
+        self.assertEqual(list(amfy.loads_many(data, Loader=Counting)),
+                         self.values)
+        # single chunk is decoded here
+        self.assertEqual(Counting.calls, len(self.values))
+
+    def test_pool(self):
+        Counting.calls = 0
+        data = list(amfy.dumps_many(self.values, proto=0,
+                                    chunk_size=7, workers=2))
+        self.assertEqual(data, [amfy.dumps(v, proto=0)
+                                for v in self.values])
+        res = amfy.loads_many(iter(data), proto=0, Loader=Counting,
+                              chunk_size=7, workers=2)
+        self.assertEqual(list(res), self.values)
+        self.assertEqual(Counting.calls, 0)
+
+    def test_executor(self):
+        with ProcessPoolExecutor(2) as executor:
+            data = amfy.dumps_many(self.values, chunk_size=5,
+                                   executor=executor)
+            res = amfy.loads_many(data, chunk_size=5, executor=executor)
+            self.assertEqual(list(res), self.values)
+
+    def test_streamed(self):
+        consumed = []
+        def values():
+            for v in self.values:
+                consumed.append(v)
+                yield v
+        res = amfy.dumps_many(values(), chunk_size=5, workers=1)
+        next(res)
+        self.assertEqual(len(consumed), 10)
+
+    def test_errors(self):
+        data = [amfy.dumps(1)] * 20 + [b'\x0A'] + [amfy.dumps(2)] * 20
+        res = amfy.loads_many(data, chunk_size=4, workers=2)
+        self.assertEqual([next(res) for i in range(20)], [1] * 20)
+        self.assertRaises(EOFError, next, res)
+        self.assertRaises(ValueError, list, amfy.loads_many(data,
+                                                            chunk_size=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
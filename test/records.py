@@ -0,0 +1,99 @@
+import os
+import shutil
+import unittest
+import tempfile
+from io import BytesIO
+
+import amfy
+from amfy.core import Loader
+from amfy.records import RecordWriter, RecordReader
+
+
+class Records(unittest.TestCase):
+
+    values = [{'id': i, 'name': 'user{}'.format(i), 'tags': ['a', 'a']}
+              for i in range(100)]
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'log.amf')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, values, proto=3):
+        with RecordWriter(self.path, proto) as writer:
+            for v in values:
+                writer.write(v)
+
+    def test_random_access(self):
+        self._write(self.values[:60])
+        self._write(self.values[60:])
+        with RecordReader(self.path) as reader:
+            self.assertEqual(len(reader), 100)
+            self.assertEqual(reader[42], self.values[42])
+            self.assertEqual(reader[-1], self.values[-1])
+            self.assertEqual(reader[10:20], self.values[10:20])
+            self.assertEqual(list(reader.iter(95)), self.values[95:])
+            self.assertEqual(list(reader), self.values)
+
+    def test_amf0(self):
+        self._write(self.values, proto=0)
+        with RecordReader(self.path) as reader:
+            self.assertEqual(reader.proto, 0)
+            self.assertEqual(reader[7], self.values[7])
+        self.assertRaises(ValueError, RecordWriter, self.path, 3)
+
+    def test_rebuild_index(self):
+        self._write(self.values[:50])
+        with open(self.path + '.idx', 'rb') as f:
+            index = f.read()
+        self._write(self.values[50:])
+        # stale index, missing entries are found by scanning
+        with open(self.path + '.idx', 'wb') as f:
+            f.write(index[:-3])
+        with RecordReader(self.path) as reader:
+            self.assertEqual(list(reader), self.values)
+        os.unlink(self.path + '.idx')
+        with RecordReader(self.path) as reader:
+            self.assertEqual(reader[77], self.values[77])
+        # interrupted write of the last record
+        with open(self.path, 'ab') as f:
+            f.write(b'\x00\x00\x01\x00\x0a')
+        with RecordReader(self.path) as reader:
+            self.assertEqual(len(reader), 100)
+
+    def test_not_a_log(self):
+        with open(self.path, 'wb') as f:
+            f.write(amfy.dumps(self.values))
+        self.assertRaises(ValueError, RecordReader, self.path)
+
+
+class LoadAll(unittest.TestCase):
+
+    def test_load_all(self):
+        for proto in (0, 3):
+            data = b''.join(amfy.dumps(v, proto=proto)
+                            for v in ['x', 1, {'a': 'x'}])
+            self.assertEqual(list(Loader().load_all(BytesIO(data), proto)),
+                             ['x', 1, {'a': 'x'}])
+            self.assertRaises(EOFError, list,
+                              Loader().loads_all(data[:-1], proto))
+            self.assertRaises(EOFError, list,
+                              Loader().load_all(BytesIO(data[:-1]), proto))
+
+    def test_values_as_read(self):
+        values = [{'a': 'x' * 100, 'n': i} for i in range(100)]
+        data = b''.join(amfy.dumps(v) for v in values)
+        class Stream(BytesIO):
+            def read1(self, size=-1):
+                return super().read1(min(size, 1000))
+        stream = Stream(data)
+        res = Loader().load_all(stream, 3)
+        self.assertEqual(next(res), values[0])
+        self.assertLess(stream.tell(), 2000)
+        self.assertEqual([values[0]] + list(res), values)
+
+
+if __name__ == '__main__':
+    unittest.main()
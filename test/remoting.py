@@ -0,0 +1,69 @@
+import unittest
+
+import amfy
+from amfy import remoting
+
+
+class Envelope(unittest.TestCase):
+
+    def test_roundtrip(self):
+        env = remoting.Envelope(0,
+            [remoting.Header('Credentials', {'userid': 'u'}, True)],
+            [remoting.Body('svc.echo', '/1', ['spam', 1.0])])
+        data = remoting.dumps(env)
+        self.assertEqual(data,
+            b'\x00\x00\x00\x01\x00\x0bCredentials\x01\x00\x00\x00\x10'
+            b'\x03\x00\x06userid\x02\x00\x01u\x00\x00\x09'
+            b'\x00\x01\x00\x08svc.echo\x00\x02/1\x00\x00\x00\x15'
+            b'\x0a\x00\x00\x00\x02\x02\x00\x04spam'
+            b'\x00\x3f\xf0\x00\x00\x00\x00\x00\x00')
+        res = remoting.loads(data)
+        self.assertEqual(res.version, 0)
+        self.assertEqual(res.headers[0].name, 'Credentials')
+        self.assertTrue(res.headers[0].must_understand)
+        self.assertEqual(res.headers[0].value, {'userid': 'u'})
+        self.assertEqual(res.bodies[0].target, 'svc.echo')
+        self.assertEqual(res.bodies[0].response, '/1')
+        self.assertEqual(res.bodies[0].data, ['spam', 1.0])
+
+    def test_lazy(self):
+        env = remoting.Envelope(3, [], [
+            remoting.Body('a', '/1', {'big': 'x' * 1000}),
+            remoting.Body('b', '/2', 5)])
+        data = bytes(remoting.dumps(env))
+        res = remoting.loads(data)
+        self.assertEqual([b.target for b in res.bodies], ['a', 'b'])
+        self.assertIs(res.bodies[0]._value, remoting._missing)
+        # undecoded bodies are written back as is
+        self.assertEqual(remoting.dumps(res), data)
+        res.bodies[1].data = 6
+        self.assertEqual(remoting.loads(remoting.dumps(res)).bodies[1].data, 6)
+
+    def test_unknown_length_avmplus(self):
+        value = b'\x11' + bytes(amfy.dumps({'a': 1}))
+        data = (b'\x00\x03\x00\x00\x00\x01\x00\x01a\x00\x02/1'
+                b'\xff\xff\xff\xff' + value)
+        res = remoting.loads(data)
+        self.assertEqual(bytes(res.bodies[0]._raw), value)
+        self.assertEqual(res.bodies[0].data, {'a': 1})
+
+    def test_changed_in_place(self):
+        env = remoting.Envelope(0,
+            [remoting.Header('h', {'n': 1})],
+            [remoting.Body('a', '/1', {'a': 1})])
+        res = remoting.loads(remoting.dumps(env))
+        res.headers[0].value['n'] = 2
+        res.bodies[0].data['a'] = 2
+        res = remoting.loads(remoting.dumps(res))
+        self.assertEqual(res.headers[0].value, {'n': 2})
+        self.assertEqual(res.bodies[0].data, {'a': 2})
+
+    def test_truncated(self):
+        data = remoting.dumps(remoting.Envelope(3, [],
+            [remoting.Body('a', '/1', 'spam')]))
+        with self.assertRaises(EOFError):
+            remoting.loads(data[:-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import json
+import array
+import unittest
+import datetime
+from io import StringIO, BytesIO
+
+import amfy
+
+
+class ToJSON(unittest.TestCase):
+
+    value = {
+        'id': 12345,
+        'name': 'spam é',
+        'ok': True,
+        'missing': None,
+        'items': [1, 2.5, -3, 1 << 40, 'x', 'x', [], {}],
+        'nested': {'a': {'b': ['c']}},
+        }
+
+    def test_same_as_json(self):
+        for proto in (0, 3):
+            data = amfy.dumps(self.value, proto=proto)
+            self.assertEqual(amfy.transcode_json(data, proto=proto),
+                             json.dumps(amfy.loads(data, proto=proto)))
+
+    def test_stream(self):
+        big = [dict(self.value, id=i) for i in range(1000)]
+        data = amfy.dumps(big)
+        chunks = []
+        class Out(object):
+            def write(self, text):
+                chunks.append(text)
+        amfy.transcode_json(BytesIO(data), Out())
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(json.loads(''.join(chunks)), big)
+
+    def test_special_values(self):
+        when = datetime.datetime(2015, 10, 14, 12, 30)
+        data = amfy.dumps([amfy.undefined, when, b'\x00\xff',
+                           array.array('d', [0.5]), float('nan')])
+        self.assertEqual(amfy.transcode_json(data),
+            '[null, "2015-10-14T12:30:00", "AP8=", [0.5], NaN]')
+
+    def test_references(self):
+        shared = {'a': [1]}
+        for proto in (0, 3):
+            data = amfy.dumps([shared, shared, [shared]], proto=proto)
+            text = amfy.transcode_json(data, proto=proto)
+            self.assertEqual(json.loads(text),
+                             [{'a': [1]}] * 2 + [[{'a': [1]}]])
+        cycle = {}
+        cycle['self'] = cycle
+        self.assertRaises(ValueError, amfy.transcode_json, amfy.dumps(cycle))
+
+    def test_externalizable_references(self):
+        shared = {'a': [1]}
+        value = [shared, amfy.ArrayCollection([shared]),
+                 amfy.ObjectProxy(shared)]
+        data = amfy.dumps(value)
+        self.assertEqual(amfy.transcode_json(data),
+                         json.dumps(amfy.loads(data)))
+
+    def test_errors(self):
+        data = amfy.dumps(self.value)
+        self.assertRaises(EOFError, amfy.transcode_json, data[:-3])
+        self.assertRaises(NotImplementedError, amfy.transcode_json, b'\x07')
+
+
+class ToAMF(unittest.TestCase):
+
+    text = ('{"a": [1, 2.5, -7, 1e3, "x", "x", true, false, null],'
+            ' "b": {"c": [], "d": {}}, "e": "\\u00e9\\n"}')
+
+    def test_same_as_dumps(self):
+        for proto in (0, 3):
+            self.assertEqual(amfy.transcode_amf(self.text, proto=proto),
+                             amfy.dumps(json.loads(self.text), proto=proto))
+
+    def test_stream(self):
+        text = json.dumps([{'id': i, 'n': 'v{}'.format(i)}
+                           for i in range(2000)])
+        out = BytesIO()
+        amfy.transcode_amf(StringIO(text), out)
+        self.assertEqual(out.getvalue(), amfy.dumps(json.loads(text)))
+        chunks = []
+        class Out(object):
+            def write(self, data):
+                chunks.append(bytes(data))
+        for value in ({'k{}'.format(i): [i] for i in range(2000)},
+                      [[i, {'n': [i, 'v']}] for i in range(2000)]):
+            for proto in (0, 3):
+                del chunks[:]
+                amfy.transcode_amf(json.dumps(value), Out(), proto=proto)
+                self.assertGreater(len(chunks), 1)
+                self.assertEqual(b''.join(chunks),
+                                 amfy.dumps(value, proto=proto))
+
+    def test_roundtrip(self):
+        for proto in (0, 3):
+            data = amfy.transcode_amf(self.text, proto=proto)
+            text = amfy.transcode_json(data, proto=proto)
+            self.assertEqual(json.loads(text), json.loads(self.text))
+
+    def test_errors(self):
+        for text in ('', '[1,', '{"a" 1}', '{1: 2}', '[1] 2', 'nul'):
+            self.assertRaises(ValueError, amfy.transcode_amf, text)
+
+
+if __name__ == '__main__':
+    unittest.main()